@@ -0,0 +1,168 @@
+import hashlib
+import logging
+import os
+import tempfile
+from collections import namedtuple
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import UploadFile
+
+# audio_intake.py
+#
+# Voice uploads for /recognise_text_to_llm, without a full in-memory copy
+# or a temp file on the hot path. Two request shapes are accepted:
+#
+#   * raw body (Content-Type audio/* or application/octet-stream): streamed
+#     chunk by chunk into a SpooledTemporaryFile that stays in memory up to
+#     AUDIO_SPOOL_BYTES and only then spills to disk;
+#   * multipart/form-data with a `file` part: Starlette already spools the
+#     part (1 MB in memory), so that file object is used as-is.
+#
+# Either way the size is capped at AUDIO_MAX_BYTES (checked against
+# Content-Length before reading, and again while streaming), the container
+# format comes from the file header rather than the filename, and the
+# transcription backend reads straight from the spooled file.
+
+logger = logging.getLogger(__name__)
+
+AUDIO_MAX_BYTES = int(os.getenv("AUDIO_MAX_BYTES", str(25 * 1024 * 1024)))
+AUDIO_SPOOL_BYTES = int(os.getenv("AUDIO_SPOOL_BYTES", str(2 * 1024 * 1024)))
+
+AUDIO_FORMATS = ("webm", "wav", "mp3", "m4a", "ogg", "flac", "aac")
+_SNIFF_BYTES = 12
+# Boundaries and part headers on top of the audio itself.
+_MULTIPART_OVERHEAD = 16 * 1024
+_RAW_CONTENT_TYPES = ("audio/", "video/webm", "application/octet-stream")
+
+AudioUpload = namedtuple("AudioUpload", ["file", "size", "format"])
+
+
+class AudioRejected(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def detect_audio_format(header: bytes):
+    """Container format from the first bytes of the file, or None if unrecognised."""
+    if header[:4] == b"\x1a\x45\xdf\xa3":  # EBML: WebM / Matroska
+        return "webm"
+    if header[:4] == b"RIFF" and header[8:12] == b"WAVE":
+        return "wav"
+    if header[4:8] == b"ftyp":  # ISO BMFF: m4a / mp4
+        return "m4a"
+    if header[:4] == b"OggS":
+        return "ogg"
+    if header[:4] == b"fLaC":
+        return "flac"
+    if header[:3] == b"ID3":
+        return "mp3"
+    if len(header) >= 2 and header[0] == 0xFF:
+        if header[1] & 0xF6 == 0xF0:  # ADTS sync, layer 0
+            return "aac"
+        if header[1] & 0xE0 == 0xE0 and (header[1] >> 1) & 0x03:  # MPEG audio frame sync
+            return "mp3"
+    return None
+
+
+def _require_format(header: bytes) -> str:
+    audio_format = detect_audio_format(header)
+    if audio_format is None:
+        raise AudioRejected(415, f"Unsupported audio format. Supported: {', '.join(AUDIO_FORMATS)}")
+    return audio_format
+
+
+def _content_length(request, allowance: int = 0):
+    value = request.headers.get("content-length")
+    if value is None:
+        return None
+    try:
+        length = int(value)
+    except ValueError:
+        raise AudioRejected(400, "Invalid Content-Length")
+    if length > AUDIO_MAX_BYTES + allowance:
+        raise AudioRejected(413, f"Audio larger than {AUDIO_MAX_BYTES} bytes")
+    return length
+
+
+async def spool_audio(chunks, max_bytes: int = AUDIO_MAX_BYTES, spool_bytes: int = AUDIO_SPOOL_BYTES) -> AudioUpload:
+    """
+    Copies an async iterable of byte chunks into a spooled buffer, enforcing
+    the size cap as the bytes arrive. The caller owns (and closes) the file.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=spool_bytes)
+    size, header, audio_format = 0, b"", None
+    try:
+        async for chunk in chunks:
+            if not chunk:
+                continue
+            size += len(chunk)
+            if size > max_bytes:
+                raise AudioRejected(413, f"Audio larger than {max_bytes} bytes")
+            if audio_format is None:
+                header = (header + chunk)[:_SNIFF_BYTES]
+                if len(header) == _SNIFF_BYTES:
+                    # Reject before reading the rest of a non-audio body.
+                    audio_format = _require_format(header)
+            if getattr(spool, "_rolled", True):
+                # Spilled to disk: keep the blocking write off the event loop.
+                await run_in_threadpool(spool.write, chunk)
+            else:
+                spool.write(chunk)
+
+        if size == 0:
+            raise AudioRejected(400, "Empty audio file")
+        if audio_format is None:
+            audio_format = _require_format(header)
+        spool.seek(0)
+        return AudioUpload(spool, size, audio_format)
+    except BaseException:
+        spool.close()
+        raise
+
+
+async def _receive_multipart(request) -> AudioUpload:
+    if _content_length(request, allowance=_MULTIPART_OVERHEAD) is None:
+        # The form parser reads the whole body before we see it: no cap without a length.
+        raise AudioRejected(411, "Content-Length required for multipart uploads")
+    form = await request.form(max_files=1, max_fields=8)
+    upload = form.get("file")
+    if not isinstance(upload, UploadFile):
+        await form.close()
+        raise AudioRejected(400, "No file provided")
+    try:
+        if not upload.size:
+            raise AudioRejected(400, "Empty audio file")
+        if upload.size > AUDIO_MAX_BYTES:
+            raise AudioRejected(413, f"Audio larger than {AUDIO_MAX_BYTES} bytes")
+        audio_format = _require_format(await upload.read(_SNIFF_BYTES))
+        await upload.seek(0)
+    except BaseException:
+        await form.close()
+        raise
+    return AudioUpload(upload.file, upload.size, audio_format)
+
+
+def audio_digest(audio: AudioUpload) -> str:
+    """sha256 of the upload (blocking read); leaves the file rewound."""
+    digest = hashlib.sha256()
+    audio.file.seek(0)
+    for block in iter(lambda: audio.file.read(64 * 1024), b""):
+        digest.update(block)
+    audio.file.seek(0)
+    return digest.hexdigest()
+
+
+async def receive_audio(request) -> AudioUpload:
+    """Reads the voice upload from a raw or multipart request; raises AudioRejected."""
+    content_type = request.headers.get("content-type", "").lower()
+    if content_type.startswith("multipart/form-data"):
+        audio = await _receive_multipart(request)
+    elif not content_type or content_type.startswith(_RAW_CONTENT_TYPES):
+        _content_length(request)
+        audio = await spool_audio(request.stream())
+    else:
+        raise AudioRejected(415, f"Unsupported upload content type {content_type!r}")
+    logger.info(f"🎧 Received {audio.size} bytes of {audio.format} audio")
+    return audio
@@ -0,0 +1,124 @@
+"""
+Compares the store-index ANN backends on synthetic catalogs.
+
+    python -m benchmarks.ann_backends [--sizes 10000,100000,1000000] [--queries 1000]
+
+(run from Voice-Command-Shopping-Assistant/, like the other benchmarks)
+
+Catalog vectors are clustered, unit-length and 384-dimensional like the
+MiniLM embeddings the service stores; each cluster belongs to one of 50
+categories. For every size and backend the report shows build time
+(training included), on-disk index size (≈ resident memory), single-query
+QPS, and recall@5 against the exact flat index, both unfiltered and with
+the search restricted to one category.
+
+Tuning knobs are the usual STORE_INDEX_* environment variables
+(STORE_INDEX_HNSW_EF_SEARCH, STORE_INDEX_IVF_NPROBE, ...). The 1M run
+needs roughly 6 GB of RAM.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from vector_index import VectorIndex
+
+DIM = 384
+LATENT_DIM = 48
+K = 5
+CATEGORIES = 50
+
+BACKENDS = [
+    ("flat", "flat", False),
+    ("flat-fp16", "flat", True),
+    ("hnsw", "hnsw", False),
+    ("hnsw-fp16", "hnsw", True),
+    ("ivfpq", "ivfpq", False),
+]
+
+
+def synthetic_catalog(n, queries, seed=0):
+    """
+    Clustered points in a low-dimensional latent space, projected to DIM and
+    normalised. Sentence embeddings have a low intrinsic dimension too; plain
+    isotropic 384-d noise would make every neighbour nearly equidistant.
+    """
+    rng = np.random.default_rng(seed)
+    clusters = max(n // 100, 10)
+    projection = rng.standard_normal((LATENT_DIM, DIM), dtype="float32")
+    centres = rng.standard_normal((clusters, LATENT_DIM), dtype="float32")
+    assignment = rng.integers(0, clusters, n + queries)
+    vectors = np.empty((n + queries, DIM), dtype="float32")
+    for start in range(0, n + queries, 100_000):
+        rows = assignment[start:start + 100_000]
+        latent = centres[rows] + 0.5 * rng.standard_normal((len(rows), LATENT_DIM), dtype="float32")
+        chunk = latent @ projection + 0.05 * rng.standard_normal((len(rows), DIM), dtype="float32")
+        vectors[start:start + len(rows)] = chunk / np.linalg.norm(chunk, axis=1, keepdims=True)
+    tags = (assignment % CATEGORIES).astype("int32")
+    return vectors[:n], tags[:n], vectors[n:]
+
+
+def recall(found, truth):
+    hits = sum(len(set(f[f >= 0]) & set(t[t >= 0])) for f, t in zip(found, truth))
+    return hits / max(sum((t >= 0).sum() for t in truth), 1)
+
+
+def run_queries(index, queries, include=None):
+    labels = np.empty((len(queries), K), dtype="int64")
+    start = time.perf_counter()
+    for i, query in enumerate(queries):
+        labels[i] = index.search(query.reshape(1, -1), K, include=include)[1][0]
+    return labels, len(queries) / (time.perf_counter() - start)
+
+
+def index_size(index):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "index.faiss")
+        index.save(path, os.path.join(tmp, "ids.npz"))
+        return os.path.getsize(path)
+
+
+def bench_size(n, query_count, backends):
+    vectors, tags, queries = synthetic_catalog(n, query_count)
+    labels = np.arange(n, dtype="int64")
+    category = [int(tags[0])]
+    truth = truth_filtered = None
+
+    print(f"\n{n:,} items, {query_count} queries, k={K}")
+    print(f"{'backend':<11} {'build s':>8} {'size MB':>8} {'B/vec':>6} {'QPS':>8} "
+          f"{'recall@5':>9} {'QPS filt':>9} {'recall filt':>12}")
+    for name, kind, fp16 in backends:
+        index = VectorIndex(DIM, kind, fp16)
+        start = time.perf_counter()
+        index.add(vectors, labels, tags)
+        build = time.perf_counter() - start
+
+        found, qps = run_queries(index, queries)
+        found_filtered, qps_filtered = run_queries(index, queries, include=category)
+        if truth is None:
+            # The first backend is exact flat: it defines the ground truth.
+            truth, truth_filtered = found, found_filtered
+        size = index_size(index)
+        print(f"{name:<11} {build:>8.2f} {size / 2**20:>8.1f} {size / n:>6.0f} {qps:>8.0f} "
+              f"{recall(found, truth):>9.3f} {qps_filtered:>9.0f} {recall(found_filtered, truth_filtered):>12.3f}")
+        del index
+
+
+def main(args):
+    names = [b[0] for b in BACKENDS]
+    selected = args.backends.split(",") if args.backends else names
+    backends = [b for b in BACKENDS if b[0] in selected]
+    if backends[0][0] != "flat":
+        backends.insert(0, BACKENDS[0])
+    for n in (int(s) for s in args.sizes.split(",")):
+        bench_size(n, args.queries, backends)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--backends", default="", help="comma-separated subset of: " + ", ".join(b[0] for b in BACKENDS))
+    main(parser.parse_args())
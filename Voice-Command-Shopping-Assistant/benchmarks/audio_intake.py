@@ -0,0 +1,141 @@
+"""
+Per-request memory and latency of the voice upload intake, old vs new.
+
+    python -m benchmarks.audio_intake [--sizes 1,8,24] [--repeat 5]
+
+(run from Voice-Command-Shopping-Assistant/, like the other benchmarks)
+
+Runs in-process against Starlette requests fed in 64 KB chunks, the way
+uvicorn delivers a body, with WAV payloads of the given sizes (MB):
+  * legacy     - multipart, await file.read(), copy into a NamedTemporaryFile,
+                 transcribe from the path (the pre-audio_intake flow)
+  * multipart  - audio_intake.receive_audio() on the same multipart body
+  * raw        - audio_intake.receive_audio() on a raw audio/wav body
+Each flow ends by reading the audio back in 64 KB blocks, as the
+AssemblyAI SDK does while uploading. Memory is the tracemalloc peak of one
+request (Python-side buffers: bytes copies, in-memory spools); latency is
+the median over --repeat runs. A final row shows how quickly an over-cap
+upload is turned away.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+from starlette.requests import Request
+
+from audio_intake import AUDIO_MAX_BYTES, AudioRejected, receive_audio
+
+CHUNK = 64 * 1024
+BOUNDARY = "benchboundary"
+
+
+def wav_bytes(size):
+    header = b"RIFF" + (size - 8).to_bytes(4, "little") + b"WAVEfmt "
+    return header + b"\x00" * (size - len(header))
+
+
+def multipart_body(audio):
+    return (
+        f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"command.wav\"\r\n"
+        f"Content-Type: audio/wav\r\n\r\n".encode()
+        + audio
+        + f"\r\n--{BOUNDARY}--\r\n".encode()
+    )
+
+
+def make_request(body, content_type):
+    chunks = [body[i:i + CHUNK] for i in range(0, len(body), CHUNK)]
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": "/recognise_text_to_llm",
+        "query_string": b"",
+        "headers": [
+            (b"content-type", content_type.encode()),
+            (b"content-length", str(len(body)).encode()),
+        ],
+    }
+    pending = iter(chunks)
+
+    async def receive():
+        chunk = next(pending, None)
+        return {"type": "http.request", "body": chunk or b"", "more_body": chunk is not None}
+
+    return Request(scope, receive)
+
+
+def drain(f):
+    while f.read(CHUNK):
+        pass
+
+
+async def legacy(request):
+    form = await request.form()
+    content = await form["file"].read()
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".webm") as temp_file:
+        temp_file.write(content)
+        path = temp_file.name
+    try:
+        with open(path, "rb") as f:
+            drain(f)
+    finally:
+        os.unlink(path)
+        await form.close()
+
+
+async def streamed(request):
+    audio = await receive_audio(request)
+    try:
+        drain(audio.file)
+    finally:
+        audio.file.close()
+
+
+FLOWS = {
+    "legacy": (legacy, True),
+    "multipart": (streamed, True),
+    "raw": (streamed, False),
+}
+
+
+async def measure(flow, body, content_type, repeat):
+    latencies, peak = [], 0
+    for _ in range(repeat):
+        request = make_request(body, content_type)
+        tracemalloc.start()
+        start = time.perf_counter()
+        await flow(request)
+        latencies.append((time.perf_counter() - start) * 1000)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return statistics.median(latencies), peak
+
+
+async def main(args):
+    print(f"{'upload':>8} {'flow':<10} {'peak MB':>8} {'median ms':>10}")
+    for mb in (float(s) for s in args.sizes.split(",")):
+        audio = wav_bytes(int(mb * 2**20))
+        bodies = {True: (multipart_body(audio), f"multipart/form-data; boundary={BOUNDARY}"), False: (audio, "audio/wav")}
+        for name, (flow, multipart) in FLOWS.items():
+            body, content_type = bodies[multipart]
+            ms, peak = await measure(flow, body, content_type, args.repeat)
+            print(f"{mb:>6.1f}MB {name:<10} {peak / 2**20:>8.2f} {ms:>10.1f}")
+
+    oversized = wav_bytes(AUDIO_MAX_BYTES + 2**20)
+    request = make_request(oversized, "audio/wav")
+    start = time.perf_counter()
+    try:
+        await streamed(request)
+    except AudioRejected as e:
+        print(f"\nover-cap upload ({len(oversized) / 2**20:.0f}MB): {e.status_code} after {(time.perf_counter() - start) * 1000:.2f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1,8,24")
+    parser.add_argument("--repeat", type=int, default=5)
+    asyncio.run(main(parser.parse_args()))
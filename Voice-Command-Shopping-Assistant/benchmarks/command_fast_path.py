@@ -0,0 +1,85 @@
+"""
+Compares command-parsing latency with and without the local fast path.
+
+    python -m benchmarks.command_fast_path [--corpus benchmarks/transcripts.txt]
+
+(run from Voice-Command-Shopping-Assistant/, like the other benchmarks)
+
+Every transcript is parsed twice:
+  * LLM only   - process_command() against GROQ_API_URL (the real Groq API,
+                 or benchmarks/stub_upstreams.py for a repeatable run)
+  * fast path  - LocalCommandParser first, LLM only on low confidence
+
+The catalog is the demo catalog from seed_store.py. The report shows the
+fast-path hit rate, latency percentiles of both modes, and how often the
+fast path agreed with the LLM on product/quantity/action (only meaningful
+against the real Groq API; the stub always answers the same command).
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from command_parser import LocalCommandParser
+from groq_client import process_command
+from seed_store import products as demo_catalog
+from upstream import close_upstreams
+
+from benchmarks.stats import percentile
+
+
+def load_corpus(path):
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+
+def describe(label, latencies_ms):
+    return (
+        f"{label:<10} p50={percentile(latencies_ms, 50):9.3f}ms "
+        f"p95={percentile(latencies_ms, 95):9.3f}ms "
+        f"mean={sum(latencies_ms) / len(latencies_ms):9.3f}ms"
+    )
+
+
+def same_command(a, b):
+    keys = ("product", "quantity", "action")
+    try:
+        return all(str(a[k]).lower().rstrip("s") == str(b[k]).lower().rstrip("s") for k in keys)
+    except (KeyError, TypeError):
+        return False
+
+
+async def main(args):
+    parser = LocalCommandParser(lambda: (1, demo_catalog))
+    corpus = load_corpus(args.corpus)
+
+    llm_only, fast_path, agreements, compared = [], [], 0, 0
+    for transcript in corpus:
+        start = time.perf_counter()
+        llm_result = await process_command(transcript)
+        llm_only.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        result = parser.parse(transcript)
+        if result is None:
+            await process_command(transcript)
+        else:
+            compared += 1
+            agreements += same_command(result, llm_result)
+        fast_path.append((time.perf_counter() - start) * 1000)
+
+    await close_upstreams()
+
+    stats = parser.stats()
+    print(f"transcripts: {len(corpus)}")
+    print(f"fast-path hit rate: {stats['hit_rate']:.1%} ({stats['hits']}/{stats['attempts']})")
+    if compared:
+        print(f"fast-path agreement with LLM: {agreements}/{compared}")
+    print(describe("llm only", llm_only))
+    print(describe("fast path", fast_path))
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument("--corpus", default=os.path.join(os.path.dirname(__file__), "transcripts.txt"))
+    asyncio.run(main(argparser.parse_args()))
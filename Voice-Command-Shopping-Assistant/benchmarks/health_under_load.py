@@ -0,0 +1,79 @@
+"""
+Measures /health latency while the API is busy with voice commands.
+
+Start benchmarks/stub_upstreams.py and the API (see that module's docstring),
+then run:
+    python -m benchmarks.health_under_load --api http://127.0.0.1:8000 --voice 50
+
+The /health latency is sampled once on an idle server and once while
+--voice concurrent /recognise_text_to_llm requests are in flight. With the
+voice pipeline off the event loop the two distributions should match.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+from benchmarks.stats import percentile
+
+# Smallest valid WebM/EBML header; the stub ASR never decodes it.
+FAKE_AUDIO = b"\x1a\x45\xdf\xa3" + b"\x00" * 1024
+
+
+async def sample_health(client, api, samples, interval):
+    latencies = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        response = await client.get(f"{api}/health")
+        response.raise_for_status()
+        latencies.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(interval)
+    return latencies
+
+
+async def voice_command(client, api):
+    files = {"file": ("command.webm", FAKE_AUDIO, "audio/webm")}
+    start = time.perf_counter()
+    response = await client.post(f"{api}/recognise_text_to_llm", files=files)
+    return response.status_code, (time.perf_counter() - start) * 1000
+
+
+def report(label, latencies):
+    print(
+        f"{label:<14} n={len(latencies):<4} "
+        f"p50={percentile(latencies, 50):7.1f}ms "
+        f"p95={percentile(latencies, 95):7.1f}ms "
+        f"max={max(latencies):7.1f}ms "
+        f"mean={statistics.fmean(latencies):7.1f}ms"
+    )
+
+
+async def main(args):
+    async with httpx.AsyncClient(timeout=120) as client:
+        idle = await sample_health(client, args.api, args.samples, args.interval)
+
+        voice_tasks = [
+            asyncio.create_task(voice_command(client, args.api))
+            for _ in range(args.voice)
+        ]
+        # Give the voice requests a moment to reach the upstream stubs.
+        await asyncio.sleep(0.1)
+        loaded = await sample_health(client, args.api, args.samples, args.interval)
+        voice_results = await asyncio.gather(*voice_tasks)
+
+    report("health idle", idle)
+    report("health loaded", loaded)
+    report("voice", [latency for _, latency in voice_results])
+    failures = [status for status, _ in voice_results if status != 200]
+    print(f"voice failures: {len(failures)}/{len(voice_results)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--api", default="http://127.0.0.1:8000")
+    parser.add_argument("--voice", type=int, default=50, help="concurrent voice commands")
+    parser.add_argument("--samples", type=int, default=20, help="/health samples per phase")
+    parser.add_argument("--interval", type=float, default=0.05, help="seconds between samples")
+    asyncio.run(main(parser.parse_args()))
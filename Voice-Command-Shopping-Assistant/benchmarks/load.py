@@ -0,0 +1,245 @@
+"""
+Load driver: latency percentiles and throughput for every endpoint.
+
+Against a running API (see benchmarks/serve.py for one backed by local
+stand-ins):
+    python -m benchmarks.load --api http://127.0.0.1:8000 --concurrency 32 --duration 10
+
+or let it start the stub upstreams and an in-memory API itself:
+    python -m benchmarks.load --spawn --json results/$(git rev-parse --short HEAD).json
+
+Each scenario runs closed-loop for --duration seconds with --concurrency
+clients, after a short warm-up, and reports p50/p95/p99 latency, requests
+per second and the share of unexpected statuses. --json saves the report;
+--baseline compares against a saved one and exits 1 if any scenario's p95
+rose, or its RPS fell, by more than --tolerance percent.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import wave
+
+import httpx
+
+from benchmarks.stats import percentile
+from benchmarks.synthetic_data import USER_PREFIX
+
+SAMPLE_RATE = 16000
+
+
+def wav_file(seconds=1.0, seed=0):
+    rng = random.Random(seed)
+    frames = bytes(rng.getrandbits(8) for _ in range(int(seconds * SAMPLE_RATE) * 2))
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(frames)
+    return buffer.getvalue()
+
+
+class Scenario:
+    """One endpoint: `build(rng)` returns the httpx request kwargs; `ok` the accepted statuses."""
+
+    def __init__(self, name, build, ok=(200,)):
+        self.name = name
+        self.build = build
+        self.ok = ok
+
+
+def scenarios(products, users, etag, audio):
+    def user(rng):
+        return rng.choice(users)
+
+    def add_command(rng):
+        item = rng.choice(products)
+        return {"product": item["product"], "quantity": 1, "category": item["category"],
+                "action": "add", "status": "ai_generated"}
+
+    wav_headers = {"Content-Type": "audio/wav"}
+    return [
+        Scenario("health", lambda rng: {"method": "GET", "url": "/health"}),
+        Scenario("metrics", lambda rng: {"method": "GET", "url": "/metrics"}),
+        Scenario("store_page", lambda rng: {"method": "GET", "url": "/store", "params": {"limit": 50}}),
+        Scenario("store_not_modified", lambda rng: {
+            "method": "GET", "url": "/store", "headers": {"If-None-Match": etag}}, ok=(304,)),
+        Scenario("wishlist", lambda rng: {"method": "GET", "url": f"/wishlist/{user(rng)}"}),
+        Scenario("history", lambda rng: {"method": "GET", "url": f"/history/{user(rng)}", "params": {"limit": 20}}),
+        Scenario("recommendations", lambda rng: {"method": "GET", "url": f"/recommendations/{user(rng)}"}),
+        Scenario("update_wishlist", lambda rng: {
+            "method": "POST", "url": f"/update_wishlist/{user(rng)}", "json": add_command(rng)}),
+        Scenario("recognise", lambda rng: {
+            "method": "POST", "url": "/recognise_text_to_llm", "content": audio, "headers": wav_headers}),
+        Scenario("voice_command", lambda rng: {
+            "method": "POST", "url": f"/voice_command/{user(rng)}", "content": audio, "headers": wav_headers}),
+    ]
+
+
+async def run_scenario(client, scenario, concurrency, duration, warmup):
+    latencies, statuses = [], {}
+    rng = random.Random(scenario.name)
+    deadline = time.perf_counter() + warmup + duration
+    measure_from = time.perf_counter() + warmup
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            request = scenario.build(rng)
+            start = time.perf_counter()
+            try:
+                status = (await client.request(**request)).status_code
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            if start >= measure_from:
+                latencies.append((time.perf_counter() - start) * 1000)
+                statuses[status] = statuses.get(status, 0) + 1
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    failed = sum(count for status, count in statuses.items() if status not in scenario.ok)
+    return {
+        "requests": len(latencies),
+        "rps": round(len(latencies) / duration, 1),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "error_rate": round(failed / len(latencies), 4) if latencies else 0.0,
+        "statuses": {str(k): v for k, v in sorted(statuses.items(), key=str)},
+    }
+
+
+def print_report(results, baseline=None):
+    print(f"{'scenario':<20}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>9}")
+    for name, r in results.items():
+        line = f"{name:<20}{r['rps']:>9.1f}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['p99_ms']:>10.1f}{r['error_rate']:>9.1%}"
+        base = (baseline or {}).get(name)
+        if base:
+            line += f"   p95 {_change(base['p95_ms'], r['p95_ms']):>7}  rps {_change(base['rps'], r['rps']):>7}"
+        print(line)
+
+
+def _change(old, new):
+    return f"{(new - old) / old:+.0%}" if old else "n/a"
+
+
+def regressions(results, baseline, tolerance):
+    found = []
+    for name, r in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if base["p95_ms"] and r["p95_ms"] > base["p95_ms"] * (1 + tolerance / 100):
+            found.append(f"{name}: p95 {base['p95_ms']}ms -> {r['p95_ms']}ms")
+        if base["rps"] and r["rps"] < base["rps"] * (1 - tolerance / 100):
+            found.append(f"{name}: rps {base['rps']} -> {r['rps']}")
+    return found
+
+
+async def wait_until_up(url, timeout=120):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(url)).status_code < 500:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.5)
+    raise SystemExit(f"{url} did not come up within {timeout}s")
+
+
+def spawn(args):
+    """Starts the stub upstreams and an in-memory API; returns the processes."""
+    env = {**os.environ, "STUB_GROQ_LATENCY_MS": str(args.groq_ms), "STUB_ASR_LATENCY_MS": str(args.asr_ms),
+           "STUB_LATENCY_SIGMA": str(args.sigma)}
+    stub_port, api_port = 9100, int(args.api.rsplit(":", 1)[1])
+    stub = subprocess.Popen([sys.executable, "-m", "uvicorn", "benchmarks.stub_upstreams:app",
+                             "--port", str(stub_port), "--log-level", "warning"], env=env)
+    api = subprocess.Popen([sys.executable, "-m", "benchmarks.serve", "--port", str(api_port),
+                            "--stub", f"http://127.0.0.1:{stub_port}", "--mongo", args.mongo,
+                            "--products", str(args.products), "--users", str(args.users)], env=env)
+    return [stub, api]
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def main(args):
+    await wait_until_up(f"{args.api}/health")
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.api, limits=limits, timeout=60) as client:
+        listing = (await client.get("/store", params={"limit": 1000, "fields": "product,category"})).raise_for_status()
+        products = listing.json()["store_items"]
+        etag = listing.headers.get("etag", "")
+        users = [f"{USER_PREFIX}{i}" for i in range(args.users)]
+        selected = [s for s in scenarios(products, users, etag, wav_file())
+                    if not args.endpoints or s.name in args.endpoints]
+
+        results = {}
+        for scenario in selected:
+            results[scenario.name] = await run_scenario(client, scenario, args.concurrency, args.duration, args.warmup)
+            r = results[scenario.name]
+            print(f"  {scenario.name}: {r['rps']} rps, p95 {r['p95_ms']}ms", file=sys.stderr)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+    print_report(results, baseline)
+
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, "w") as f:
+            json.dump({
+                "revision": git_revision(),
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "config": {k: v for k, v in vars(args).items() if k not in ("json", "baseline")},
+                "results": results,
+            }, f, indent=2)
+
+    if baseline:
+        found = regressions(results, baseline, args.tolerance)
+        for line in found:
+            print(f"❌ regression: {line}")
+        return 1 if found else 0
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--api", default="http://127.0.0.1:8000")
+    parser.add_argument("--endpoints", nargs="*", help="scenario names (default: all)")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10, help="measured seconds per scenario")
+    parser.add_argument("--warmup", type=float, default=2)
+    parser.add_argument("--users", type=int, default=500, help="bench users to spread requests over")
+    parser.add_argument("--json", help="write the report here")
+    parser.add_argument("--baseline", help="report to compare against")
+    parser.add_argument("--tolerance", type=float, default=10, help="allowed regression, percent")
+    spawned = parser.add_argument_group("--spawn: start the stub upstreams and an in-memory API")
+    spawned.add_argument("--spawn", action="store_true")
+    spawned.add_argument("--mongo", default="memory")
+    spawned.add_argument("--products", type=int, default=2000)
+    spawned.add_argument("--groq-ms", type=float, default=300)
+    spawned.add_argument("--asr-ms", type=float, default=500)
+    spawned.add_argument("--sigma", type=float, default=0.3, help="log-normal latency spread")
+    args = parser.parse_args()
+
+    processes = spawn(args) if args.spawn else []
+    try:
+        code = asyncio.run(main(args))
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+    sys.exit(code)
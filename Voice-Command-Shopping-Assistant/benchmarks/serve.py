@@ -0,0 +1,76 @@
+"""
+Runs the API against local stand-ins, for load tests.
+
+    uvicorn benchmarks.stub_upstreams:app --port 9100 &
+    python -m benchmarks.serve --port 8000 --mongo memory --products 2000 --users 500
+
+Groq and AssemblyAI (upload and streaming) point at the stub on --stub,
+with placeholder API keys. --mongo is either a MongoDB URI (use a scratch
+database - the store, users and history collections are replaced with
+synthetic data) or "memory" for an in-process mongomock store
+(`pip install mongomock`; no transactions, so stock updates take the
+non-transactional path, and no change stream, so the index polls).
+
+The catalog and users come from benchmarks/synthetic_data.py. main.py
+logs at INFO for every request; --log-level defaults to warning so the
+logging itself doesn't dominate the numbers.
+"""
+import argparse
+import logging
+import os
+
+
+def use_in_memory_mongo():
+    """Every MongoClient(...) in the process shares one mongomock client."""
+    try:
+        import mongomock
+    except ImportError:
+        raise SystemExit("--mongo memory needs mongomock: pip install mongomock")
+    import pymongo
+
+    shared = mongomock.MongoClient()
+    pymongo.MongoClient = lambda *args, **kwargs: shared
+
+
+def main(args):
+    stub = args.stub.rstrip("/")
+    os.environ.setdefault("GROQ_API_KEY", "bench")
+    os.environ.setdefault("ASSEMBLYAI_API_KEY", "bench")
+    os.environ["GROQ_API_URL"] = f"{stub}/openai/v1/chat/completions"
+    os.environ["ASSEMBLYAI_BASE_URL"] = stub
+    os.environ["ASSEMBLYAI_STREAMING_HOST"] = stub.replace("http", "ws", 1)
+    if args.mongo == "memory":
+        os.environ["MONGO_URI"] = "mongodb://in-memory"
+        use_in_memory_mongo()
+    else:
+        os.environ["MONGO_URI"] = args.mongo
+
+    # Only now: db.py creates its client on import.
+    from benchmarks.synthetic_data import seed
+    from db import history_collection, store_collection, user_collection
+
+    for collection in (store_collection, user_collection, history_collection):
+        collection.delete_many({})
+    counts = seed(store_collection, user_collection, history_collection,
+                  args.products, args.users, args.wishlist, args.history)
+    print("✅ Seeded %d products, %d users, %d history entries" % counts)
+
+    import uvicorn
+    import main as api
+
+    logging.getLogger().setLevel(args.log_level.upper())
+    uvicorn.run(api.app, host=args.host, port=args.port, log_level=args.log_level)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--stub", default="http://127.0.0.1:9100")
+    parser.add_argument("--mongo", default="memory", help='MongoDB URI of a scratch database, or "memory"')
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--wishlist", type=int, default=8)
+    parser.add_argument("--history", type=int, default=20)
+    parser.add_argument("--log-level", default="warning")
+    main(parser.parse_args())
@@ -0,0 +1,109 @@
+"""
+Cold-start profile: what importing main costs, and how long a fresh
+worker takes to serve.
+
+    MONGO_URI=... GROQ_API_KEY=... python -m benchmarks.startup_profile --runs 3
+
+For each run, in fresh processes:
+  import     wall time of `import main`, plus the slowest top-level
+             imports from `python -X importtime`
+  serve      starts `uvicorn main:app` and polls until /health answers
+             (the worker accepts traffic) and until a model-backed route,
+             /recommendations, answers (embedder and index are usable)
+
+The index snapshot and embedding cache live in a scratch directory
+(--state-dir) that is kept between runs, like on a restarted host;
+--cold wipes it before every process, so the FAISS index is rebuilt from
+MongoDB and every product re-encoded, like on a fresh one. Run it on two
+commits to compare.
+"""
+import argparse
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+_IMPORTTIME = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def import_profile(env, top):
+    """(wall seconds of `import main`, [(cumulative seconds, module)] for the slowest top-level imports)."""
+    code = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], env=env,
+                            capture_output=True, text=True, check=True)
+    modules = []
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME.match(line)
+        # One leading space is a top-level import (of main itself or of its imports).
+        if match and len(match.group(3)) <= 3:
+            modules.append((int(match.group(2)) / 1e6, match.group(4)))
+    wall = float(result.stdout.strip().splitlines()[-1])
+    return wall, sorted(modules, reverse=True)[:top]
+
+
+def time_to_serve(env, port, timeout):
+    """Seconds from process start until /health, then /recommendations, answer 200."""
+    start = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(port),
+                               "--log-level", "warning"], env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    marks = {}
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=timeout) as client:
+            for name, path in (("health", "/health"), ("models", "/recommendations/startup_probe")):
+                while time.perf_counter() - start < timeout:
+                    try:
+                        if client.get(path).status_code == 200:
+                            marks[name] = time.perf_counter() - start
+                            break
+                    except httpx.HTTPError:
+                        pass
+                    time.sleep(0.02)
+    finally:
+        server.terminate()
+        server.wait()
+    return marks
+
+
+def main(args):
+    state_dir = args.state_dir or tempfile.mkdtemp(prefix="startup_profile_")
+    env = {**os.environ, "STORE_INDEX_DIR": os.path.join(state_dir, "store_index"),
+           "EMBEDDING_CACHE_DIR": os.path.join(state_dir, "embedding_cache")}
+
+    def reset():
+        if args.cold:
+            shutil.rmtree(state_dir, ignore_errors=True)
+
+    imports, health, models, top = [], [], [], None
+    for _ in range(args.runs):
+        reset()
+        wall, top = import_profile(env, args.top)
+        imports.append(wall)
+        reset()
+        marks = time_to_serve(env, args.port, args.timeout)
+        health.append(marks.get("health", float("nan")))
+        models.append(marks.get("models", float("nan")))
+
+    print(f"{'':<28}{'median':>10}{'max':>10}")
+    for label, samples in (("import main", imports), ("first /health", health), ("first /recommendations", models)):
+        print(f"{label:<28}{statistics.median(samples):>9.2f}s{max(samples):>9.2f}s")
+    print("\nslowest imports (cumulative, last run):")
+    for seconds, module in top:
+        print(f"  {seconds * 1000:>8.1f} ms  {module}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=12)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--state-dir", help="index snapshot + embedding cache directory (default: a temp dir)")
+    parser.add_argument("--cold", action="store_true", help="delete the snapshot and cache before each process")
+    main(parser.parse_args())
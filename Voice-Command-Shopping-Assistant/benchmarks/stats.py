@@ -0,0 +1,11 @@
+"""
+Helpers shared by the benchmark scripts; not a benchmark itself.
+"""
+
+
+def percentile(samples, pct):
+    """The pct-th percentile (0-100) of samples, nearest rank; 0.0 when there are none."""
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
@@ -0,0 +1,113 @@
+"""
+Hammers a single SKU with concurrent wishlist adds, comparing the old
+check-then-decrement flow with the conditional reservation in stock.py.
+
+    MONGO_URI=mongodb://localhost:27017 python -m benchmarks.stock_contention \
+        --stock 50 --adds 500 --concurrency 100
+
+Uses its own scratch database (bench_stock, dropped afterwards). For each
+flow it reports accepted adds, final stock, units oversold and the number
+of MongoDB round trips one add costs (counted with a command listener).
+"""
+import argparse
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from pymongo import MongoClient, monitoring
+
+from stock import InsufficientStock, reserve, run_grouped
+
+
+class RoundTrips(monitoring.CommandListener):
+    def __init__(self):
+        self.count = 0
+
+    def started(self, event):
+        self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def legacy_add(db, username, quantity):
+    """The pre-reservation flow: read, check in Python, push, decrement."""
+    item = db.store.find_one({"name_key": "milk"})
+    if item["quantity"] < quantity:
+        return False
+    db.users.update_one(
+        {"username": username},
+        {"$push": {"wishlist": {"product": item["product"], "quantity": quantity}}},
+        upsert=True,
+    )
+    db.store.update_one({"_id": item["_id"]}, {"$inc": {"quantity": -quantity}})
+    return True
+
+
+def reserved_add(client, db, username, quantity):
+    def operation(session):
+        item = reserve(db.store, "milk", quantity, session)
+        db.users.update_one(
+            {"username": username},
+            {"$push": {"wishlist": {"product": item["product"], "quantity": quantity}}},
+            upsert=True,
+            session=session,
+        )
+    try:
+        run_grouped(client, operation)
+        return True
+    except InsufficientStock:
+        return False
+
+
+def reset(db, stock):
+    db.store.drop()
+    db.users.drop()
+    db.store.insert_one({"product": "Milk", "name_key": "milk", "category": "dairy", "quantity": stock})
+
+
+async def hammer(add, adds, concurrency):
+    loop = asyncio.get_running_loop()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = await asyncio.gather(*[
+            loop.run_in_executor(pool, add, f"user{i % concurrency}") for i in range(adds)
+        ])
+    return sum(results)
+
+
+def main(args):
+    listener = RoundTrips()
+    client = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017"), event_listeners=[listener])
+    db = client["bench_stock"]
+    flows = {
+        "legacy": lambda user: legacy_add(db, user, 1),
+        "reserve": lambda user: reserved_add(client, db, user, 1),
+    }
+    try:
+        for name, add in flows.items():
+            reset(db, args.stock)
+            listener.count = 0
+            add("probe")
+            trips = listener.count
+            reset(db, args.stock)
+
+            accepted = asyncio.run(hammer(add, args.adds, args.concurrency))
+            final = db.store.find_one({"name_key": "milk"})["quantity"]
+            oversold = max(0, accepted - args.stock)
+            print(
+                f"{name:<8} accepted={accepted:<5} final_stock={final:<5} "
+                f"oversold={oversold:<5} round_trips_per_add={trips}"
+            )
+    finally:
+        client.drop_database("bench_stock")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stock", type=int, default=50)
+    parser.add_argument("--adds", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=100)
+    main(parser.parse_args())
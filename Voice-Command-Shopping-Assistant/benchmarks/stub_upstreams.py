@@ -0,0 +1,162 @@
+"""
+Local stand-ins for the Groq and AssemblyAI HTTP APIs.
+
+Run with:
+    uvicorn benchmarks.stub_upstreams:app --port 9100
+
+then start the API pointed at it:
+    GROQ_API_URL=http://127.0.0.1:9100/openai/v1/chat/completions \
+    ASSEMBLYAI_BASE_URL=http://127.0.0.1:9100 \
+    ASSEMBLYAI_STREAMING_HOST=ws://127.0.0.1:9100 \
+    uvicorn main:app
+
+Latencies are configured (in milliseconds) with STUB_GROQ_LATENCY_MS and
+STUB_ASR_LATENCY_MS. With STUB_LATENCY_SIGMA > 0 each request instead
+draws a log-normal latency with that median and sigma (0.5 gives a p99
+about 3x the median), which is closer to a real upstream's long tail. The streaming ASR stand-in reveals one more word of
+STUB_TRANSCRIPT per STUB_STREAM_WORD_MS of audio received and closes the
+turn STUB_STREAM_FINAL_MS after it is asked to.
+
+Faults are injected with STUB_GROQ_ERROR_RATE / STUB_ASR_ERROR_RATE
+(fraction of requests answered 503) and STUB_GROQ_STALL_RATE (fraction of
+Groq requests held an extra STUB_GROQ_STALL_MS), or changed at runtime by
+POSTing any of those keys (or the latency ones), lower-cased without the
+prefix, to /_faults:
+    curl -X POST localhost:9100/_faults -d '{"groq_error_rate": 1}'
+"""
+import asyncio
+import datetime
+import json
+import os
+import random
+import uuid
+
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse
+
+STUB_TRANSCRIPT = os.getenv("STUB_TRANSCRIPT", "add two milk")
+STREAM_WORD_MS = float(os.getenv("STUB_STREAM_WORD_MS", "300"))
+STREAM_FINAL_MS = float(os.getenv("STUB_STREAM_FINAL_MS", "150"))
+
+app = FastAPI(title="Stub upstreams")
+
+_transcripts = {}
+
+FAULTS = {
+    "groq_latency_ms": float(os.getenv("STUB_GROQ_LATENCY_MS", "800")),
+    "asr_latency_ms": float(os.getenv("STUB_ASR_LATENCY_MS", "1500")),
+    "latency_sigma": float(os.getenv("STUB_LATENCY_SIGMA", "0")),
+    "groq_error_rate": float(os.getenv("STUB_GROQ_ERROR_RATE", "0")),
+    "groq_stall_rate": float(os.getenv("STUB_GROQ_STALL_RATE", "0")),
+    "groq_stall_ms": float(os.getenv("STUB_GROQ_STALL_MS", "5000")),
+    "asr_error_rate": float(os.getenv("STUB_ASR_ERROR_RATE", "0")),
+}
+
+
+def _latency(median_ms: float) -> float:
+    """Seconds to wait: fixed, or log-normal around median_ms."""
+    if FAULTS["latency_sigma"] > 0:
+        median_ms *= random.lognormvariate(0, FAULTS["latency_sigma"])
+    return median_ms / 1000
+
+
+def _unavailable():
+    return JSONResponse({"error": "injected fault"}, status_code=503)
+
+
+@app.post("/_faults")
+async def set_faults(request: Request):
+    FAULTS.update({k: float(v) for k, v in (await request.json()).items() if k in FAULTS})
+    return FAULTS
+
+
+# ======================= GROQ ======================
+@app.post("/openai/v1/chat/completions")
+async def chat_completions(request: Request):
+    await request.json()
+    if random.random() < FAULTS["groq_error_rate"]:
+        return _unavailable()
+    latency = _latency(FAULTS["groq_latency_ms"])
+    if random.random() < FAULTS["groq_stall_rate"]:
+        latency += FAULTS["groq_stall_ms"] / 1000
+    await asyncio.sleep(latency)
+    content = json.dumps({
+        "product": "Milk",
+        "quantity": 2,
+        "category": "dairy",
+        "action": "add",
+        "status": "ai_generated",
+    })
+    return {"choices": [{"message": {"role": "assistant", "content": content}}]}
+
+
+# ======================= ASSEMBLY AI ======================
+@app.post("/v2/upload")
+async def upload(request: Request):
+    await request.body()
+    if random.random() < FAULTS["asr_error_rate"]:
+        return _unavailable()
+    return {"upload_url": f"http://stub/{uuid.uuid4().hex}"}
+
+
+@app.post("/v2/transcript")
+async def create_transcript(request: Request):
+    body = await request.json()
+    await asyncio.sleep(_latency(FAULTS["asr_latency_ms"]))
+    transcript = {
+        "id": uuid.uuid4().hex,
+        "status": "completed",
+        "text": STUB_TRANSCRIPT,
+        "audio_url": body.get("audio_url", ""),
+        "language_code": "en",
+    }
+    _transcripts[transcript["id"]] = transcript
+    return transcript
+
+
+@app.get("/v2/transcript/{transcript_id}")
+async def get_transcript(transcript_id: str):
+    return _transcripts[transcript_id]
+
+
+# ================= ASSEMBLY AI STREAMING =================
+def _turn(transcript, end_of_turn):
+    return {
+        "type": "Turn",
+        "turn_order": 0,
+        "turn_is_formatted": False,
+        "end_of_turn": end_of_turn,
+        "transcript": transcript,
+        "end_of_turn_confidence": 1.0 if end_of_turn else 0.0,
+        "words": [],
+    }
+
+
+@app.websocket("/v3/ws")
+async def streaming(websocket: WebSocket):
+    await websocket.accept()
+    expires = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(minutes=10)
+    await websocket.send_json({"type": "Begin", "id": uuid.uuid4().hex, "expires_at": expires.isoformat()})
+    words, audio_ms, shown = STUB_TRANSCRIPT.split(), 0.0, 0
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            if message.get("bytes") is not None:
+                audio_ms += len(message["bytes"]) / 32  # 16 kHz PCM16
+                revealed = min(len(words), int(audio_ms // STREAM_WORD_MS))
+                if revealed > shown:
+                    shown = revealed
+                    await websocket.send_json(_turn(" ".join(words[:shown]), False))
+                continue
+            control = json.loads(message["text"])
+            if control["type"] == "ForceEndpoint":
+                await asyncio.sleep(STREAM_FINAL_MS / 1000)
+                await websocket.send_json(_turn(STUB_TRANSCRIPT, True))
+            elif control["type"] == "Terminate":
+                await websocket.send_json({"type": "Termination"})
+                await websocket.close()
+                return
+    except WebSocketDisconnect:
+        pass
@@ -0,0 +1,136 @@
+"""
+Synthetic catalog, users and history for load tests.
+
+    MONGO_URI=mongodb://localhost:27017 python -m benchmarks.synthetic_data \
+        --products 5000 --users 1000 --wishlist 8 --history 20 --reset
+
+Products are "[brand] <adjective> <noun>" combinations per category (plus the
+demo catalog from seed_store.py, so the stub transcript "add two milk"
+resolves). Users are bench_user_0..N-1, each with --wishlist entries and
+--history past commands. The same --seed always produces the same data.
+
+--reset deletes the store, users and history collections first; without
+it the command refuses to touch a non-empty store.
+"""
+import argparse
+import datetime
+import random
+
+from helper_function import normalize_product_name
+from seed_store import products as DEMO_PRODUCTS
+
+USER_PREFIX = "bench_user_"
+
+NOUNS = {
+    "dairy": ["Milk", "Cheese", "Yogurt", "Butter", "Cream", "Paneer", "Ghee", "Curd"],
+    "fruit": ["Apple", "Banana", "Orange", "Mango", "Grapes", "Pear", "Kiwi", "Papaya"],
+    "drinks": ["Cola", "Juice", "Water", "Lemonade", "Iced Tea", "Soda", "Smoothie", "Coffee"],
+    "snacks": ["Chips", "Cookies", "Popcorn", "Crackers", "Pretzels", "Nuts", "Granola Bar", "Wafers"],
+    "grains": ["Rice", "Flour", "Oats", "Barley", "Quinoa", "Pasta", "Noodles", "Bread"],
+    "vegetables": ["Tomato", "Potato", "Onion", "Carrot", "Spinach", "Cabbage", "Peas", "Pepper"],
+}
+ADJECTIVES = [
+    "Organic", "Fresh", "Classic", "Premium", "Low Fat", "Family Pack", "Spicy", "Sweet",
+    "Whole", "Mini", "Golden", "Farm", "Roasted", "Lite", "Crunchy", "Smoked", "Wild",
+    "Honey", "Sea Salt", "Masala", "Vanilla", "Double", "Extra", "Baby", "Green",
+]
+BRANDS = ["", "Acme", "Sunrise", "Valley", "Northstar", "Harvest", "Blue Hill", "Urban"]
+
+
+def generate_catalog(count: int, seed: int = 0):
+    """The demo products first, then unique synthetic ones up to `count` in total."""
+    rng = random.Random(seed)
+    # Plenty of stock everywhere, so long runs don't drain it into 400s.
+    catalog = [{**p, "quantity": rng.randrange(10**6, 2 * 10**6)} for p in DEMO_PRODUCTS[:count]]
+    seen = {normalize_product_name(p["product"]) for p in catalog}
+    combos = [(b, a, n, c) for c, nouns in NOUNS.items() for n in nouns for a in ADJECTIVES for b in BRANDS]
+    rng.shuffle(combos)
+    for brand, adjective, noun, category in combos:
+        if len(catalog) >= count:
+            break
+        name = " ".join(part for part in (brand, adjective, noun) if part)
+        key = normalize_product_name(name)
+        if key in seen:
+            continue
+        seen.add(key)
+        catalog.append({
+            "product": name,
+            "category": category,
+            "price": rng.randrange(10, 500, 5),
+            "quantity": rng.randrange(10**6, 2 * 10**6),
+        })
+    if len(catalog) < count:
+        raise ValueError(f"Can only generate {len(catalog)} distinct products")
+    return catalog
+
+
+def generate_users(count: int, catalog, wishlist_size: int, history_size: int, seed: int = 0):
+    """(user documents, history documents) for bench_user_0..count-1."""
+    rng = random.Random(seed + 1)
+    now = datetime.datetime.utcnow()
+    users, history = [], []
+    for i in range(count):
+        username = f"{USER_PREFIX}{i}"
+        wishlist = []
+        for item in rng.sample(catalog, min(wishlist_size, len(catalog))):
+            wishlist.append({
+                "product": item["product"],
+                "quantity": rng.randint(1, 5),
+                "category": item["category"],
+                "action": "add",
+                "status": "ai_generated",
+                "timestamp": (now - datetime.timedelta(minutes=rng.randint(0, 10**4))).isoformat(),
+            })
+        users.append({"username": username, "wishlist": wishlist})
+        for _ in range(history_size):
+            item = rng.choice(catalog)
+            ts = now - datetime.timedelta(minutes=rng.randint(0, 10**5))
+            history.append({
+                "username": username,
+                "ts": ts,
+                "command": {
+                    "product": item["product"],
+                    "quantity": rng.randint(1, 5),
+                    "category": item["category"],
+                    "action": rng.choice(["add", "add", "add", "remove"]),
+                    "status": "ai_generated",
+                    "timestamp": ts.isoformat(),
+                },
+            })
+    return users, history
+
+
+def seed(store, users_collection, history_collection, products: int, users: int,
+         wishlist_size: int, history_size: int, seed_value: int = 0, batch: int = 1000):
+    catalog = generate_catalog(products, seed_value)
+    user_docs, history_docs = generate_users(users, catalog, wishlist_size, history_size, seed_value)
+    for collection, docs in (
+        (store, [{**p, "name_key": normalize_product_name(p["product"])} for p in catalog]),
+        (users_collection, user_docs),
+        (history_collection, history_docs),
+    ):
+        for start in range(0, len(docs), batch):
+            collection.insert_many(docs[start:start + batch], ordered=False)
+    return len(catalog), len(user_docs), len(history_docs)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--wishlist", type=int, default=8, help="entries per user")
+    parser.add_argument("--history", type=int, default=20, help="past commands per user")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--reset", action="store_true", help="delete existing store / users / history first")
+    args = parser.parse_args()
+
+    from db import history_collection, store_collection, user_collection
+
+    if args.reset:
+        for collection in (store_collection, user_collection, history_collection):
+            collection.delete_many({})
+    elif store_collection.estimated_document_count():
+        raise SystemExit("Store is not empty; pass --reset to replace it")
+    counts = seed(store_collection, user_collection, history_collection, args.products, args.users,
+                  args.wishlist, args.history, args.seed)
+    print("✅ Seeded %d products, %d users, %d history entries" % counts)
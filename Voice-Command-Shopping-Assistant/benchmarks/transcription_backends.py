@@ -0,0 +1,129 @@
+"""
+Latency and word error rate of the transcription backends on the sample clips.
+
+    python -m benchmarks.transcription_backends [--backends assemblyai,local] [--repeat 1]
+    python -m benchmarks.transcription_backends --synthesize en_US-lessac-medium.onnx
+
+(run from Voice-Command-Shopping-Assistant/, like the other benchmarks)
+
+The clips are the shopping commands listed in asr_clips/manifest.tsv
+(file name, reference transcript). Only the manifest is checked in; the
+WAV files are rendered from it with a piper TTS voice (`pip install
+piper-tts`, any .onnx voice) via --synthesize, or replace them with real
+recordings under the same names.
+
+Each backend is configured from the usual environment (ASSEMBLYAI_API_KEY,
+TRANSCRIPTION_LOCAL_MODEL, ...). Per backend the report shows the latency
+p50/p95 of one command (upload + recognition, model load excluded) and the
+corpus WER. Transcripts and references both go through
+parse_cache.normalize_command_key first, so "Add 2 milk." and "add two
+milk" count as the same words - the parser sees them the same way.
+"""
+import argparse
+import asyncio
+import csv
+import os
+import time
+import wave
+
+from rapidfuzz.distance import Levenshtein
+
+from audio_intake import AudioUpload, detect_audio_format
+from parse_cache import normalize_command_key
+from transcription import BACKENDS, create_backend
+
+from benchmarks.stats import percentile
+
+CLIPS_DIR = os.path.join(os.path.dirname(__file__), "asr_clips")
+
+
+def load_manifest(clips_dir):
+    with open(os.path.join(clips_dir, "manifest.tsv"), newline="") as f:
+        return [(os.path.join(clips_dir, row["clip"]), row["reference"]) for row in csv.DictReader(f, delimiter="\t")]
+
+
+def synthesize(clips, voice_path):
+    from piper import PiperVoice
+
+    voice = PiperVoice.load(voice_path)
+    for path, reference in clips:
+        if os.path.exists(path):
+            continue
+        with wave.open(path, "wb") as wav_file:
+            voice.synthesize_wav(reference, wav_file)
+        print(f"synthesized {os.path.basename(path)}")
+
+
+def word_edits(hypothesis, reference):
+    hyp, ref = normalize_command_key(hypothesis).split(), normalize_command_key(reference).split()
+    return Levenshtein.distance(hyp, ref), len(ref)
+
+
+def open_clip(path):
+    f = open(path, "rb")
+    audio_format = detect_audio_format(f.read(12))
+    f.seek(0)
+    return AudioUpload(f, os.path.getsize(path), audio_format)
+
+
+async def run_backend(backend, clips, repeat, verbose):
+    latencies, edits, words, errors = [], 0, 0, 0
+    for path, reference in clips:
+        for _ in range(repeat):
+            audio = open_clip(path)
+            start = time.perf_counter()
+            try:
+                text = await backend.transcribe(audio)
+            except Exception as e:
+                errors += 1
+                print(f"  {os.path.basename(path)}: {e}")
+                continue
+            finally:
+                audio.file.close()
+            latencies.append((time.perf_counter() - start) * 1000)
+            clip_edits, clip_words = word_edits(text, reference)
+            edits += clip_edits
+            words += clip_words
+            if verbose and clip_edits:
+                print(f"  {os.path.basename(path)}: {text!r} (expected {reference!r})")
+    return latencies, edits, words, errors
+
+
+def main(args):
+    clips = load_manifest(args.clips)
+    if args.synthesize:
+        synthesize(clips, args.synthesize)
+    missing = [os.path.basename(path) for path, _ in clips if not os.path.exists(path)]
+    if missing:
+        raise SystemExit(f"{len(missing)} clips missing ({', '.join(missing[:3])}...); render them with --synthesize VOICE.onnx")
+
+    print(f"{len(clips)} clips × {args.repeat}")
+    print(f"{'backend':<11} {'load s':>7} {'p50 ms':>8} {'p95 ms':>8} {'WER':>6} {'errors':>7}")
+    for name in args.backends.split(","):
+        backend = create_backend(name)
+        start = time.perf_counter()
+        try:
+            backend.start()
+        except RuntimeError as e:
+            print(f"{name:<11} unavailable: {e}")
+            continue
+        load = time.perf_counter() - start
+        try:
+            latencies, edits, words, errors = asyncio.run(run_backend(backend, clips, args.repeat, args.verbose))
+        finally:
+            backend.stop()
+        if not latencies:
+            print(f"{name:<11} {load:>7.2f} {'-':>8} {'-':>8} {'-':>6} {errors:>7}")
+            continue
+        print(f"{name:<11} {load:>7.2f} {percentile(latencies, 50):>8.0f} {percentile(latencies, 95):>8.0f} "
+              f"{edits / max(words, 1):>6.3f} {errors:>7}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    parser.add_argument("--clips", default=CLIPS_DIR)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--synthesize", metavar="VOICE.onnx", help="render missing clips with this piper voice")
+    parser.add_argument("--verbose", action="store_true", help="print every misrecognised clip")
+    main(parser.parse_args())
@@ -0,0 +1,159 @@
+"""
+How the Groq and AssemblyAI clients behave when the upstream misbehaves.
+
+Start the fault-injecting stub (see benchmarks/stub_upstreams.py), e.g.
+    STUB_GROQ_LATENCY_MS=200 STUB_ASR_LATENCY_MS=100 \
+        uvicorn benchmarks.stub_upstreams:app --port 9100
+then run:
+    python -m benchmarks.upstream_faults --stub http://127.0.0.1:9100
+
+Each scenario sets the stub's faults through /_faults and calls
+groq_client.process_command (or AssemblyAIBackend.transcribe) directly,
+with a fresh circuit breaker:
+  * healthy           - baseline latency
+  * stalls            - --stall-rate of Groq calls stall --stall-ms, with
+                        GROQ_HEDGE off and on (tail latency)
+  * errors            - --error-rate of Groq calls return 503, with 1
+                        attempt and with UPSTREAM_RETRY_ATTEMPTS (success)
+  * outage            - every Groq call fails; once the breaker opens,
+                        calls should fail in well under a millisecond
+  * asr errors        - --error-rate of AssemblyAI uploads return 503
+"""
+import argparse
+import asyncio
+import io
+import os
+import statistics
+import time
+import wave
+
+import httpx
+
+from benchmarks.stats import percentile
+
+
+def configure(stub):
+    # Must happen before groq_client / transcription read their settings.
+    os.environ.setdefault("GROQ_API_KEY", "stub")
+    os.environ.setdefault("ASSEMBLYAI_API_KEY", "stub")
+    os.environ["GROQ_API_URL"] = f"{stub}/openai/v1/chat/completions"
+    os.environ["ASSEMBLYAI_BASE_URL"] = stub
+
+
+async def set_faults(stub, **faults):
+    reset = {"groq_error_rate": 0, "groq_stall_rate": 0, "asr_error_rate": 0}
+    async with httpx.AsyncClient() as client:
+        response = await client.post(f"{stub}/_faults", json={**reset, **faults})
+        response.raise_for_status()
+
+
+def silent_wav(seconds=0.5):
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(16000)
+        wav.writeframes(b"\x00\x00" * int(16000 * seconds))
+    return buffer.getvalue()
+
+
+async def run_calls(call, n, concurrency):
+    from resilience import UpstreamUnavailable, request_deadline
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, outcomes = [], {"ok": 0, "unavailable": 0, "error": 0}
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            with request_deadline():
+                try:
+                    result = await call()
+                    outcomes["error" if isinstance(result, dict) and "error" in result else "ok"] += 1
+                except UpstreamUnavailable:
+                    outcomes["unavailable"] += 1
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    await asyncio.gather(*(one() for _ in range(n)))
+    return latencies, outcomes
+
+
+def report(label, latencies, outcomes, extra=""):
+    print(f"{label:<28} ok {outcomes['ok']:>4}/{len(latencies):<4} "
+          f"p50 {statistics.median(latencies):7.1f}ms  p99 {percentile(latencies, 99):7.1f}ms  {extra}")
+
+
+async def main(args):
+    configure(args.stub)
+    import groq_client
+    import resilience
+    from audio_intake import AudioUpload
+    from resilience import CircuitBreaker, LatencyTracker
+    from transcription import AssemblyAIBackend
+
+    def fresh_groq(hedge=False, attempts=None):
+        groq_client.GROQ_HEDGE = hedge
+        groq_client.groq_breaker = CircuitBreaker("Groq")
+        groq_client.groq_counters.update(hedged=0, hedge_wins=0)
+        resilience.UPSTREAM_RETRY_ATTEMPTS = attempts or args.attempts
+
+    def groq_call():
+        return groq_client.process_command("add two milk")
+
+    n, c = args.requests, args.concurrency
+
+    await set_faults(args.stub)
+    fresh_groq()
+    groq_client.groq_latency = LatencyTracker()
+    report("healthy", *await run_calls(groq_call, n, c))
+    # The hedged runs below reuse these latencies for their p95.
+
+    for hedge in (False, True):
+        await set_faults(args.stub, groq_stall_rate=args.stall_rate, groq_stall_ms=args.stall_ms)
+        fresh_groq(hedge=hedge)
+        latencies, outcomes = await run_calls(groq_call, n, c)
+        report(f"stalls, hedge {'on' if hedge else 'off'}", latencies, outcomes,
+               f"hedged {groq_client.groq_counters['hedged']}, won {groq_client.groq_counters['hedge_wins']}")
+
+    for attempts in (1, args.attempts):
+        await set_faults(args.stub, groq_error_rate=args.error_rate)
+        fresh_groq(attempts=attempts)
+        latencies, outcomes = await run_calls(groq_call, n, c)
+        report(f"errors, {attempts} attempt(s)", latencies, outcomes, f"unavailable {outcomes['unavailable']}")
+
+    await set_faults(args.stub, groq_error_rate=1)
+    fresh_groq()
+    latencies, outcomes = await run_calls(groq_call, n, 1)
+    threshold = groq_client.groq_breaker.failure_threshold
+    fail_fast = latencies[threshold:] or [0.0]
+    report("outage", latencies, outcomes,
+           f"circuit {groq_client.groq_breaker.state}, after opening p50 {statistics.median(fail_fast):.3f}ms")
+
+    await set_faults(args.stub, asr_error_rate=args.error_rate)
+    backend = AssemblyAIBackend()
+    backend.start()
+    resilience.UPSTREAM_RETRY_ATTEMPTS = args.attempts
+    audio = silent_wav()
+
+    def asr_call():
+        return backend.transcribe(AudioUpload(io.BytesIO(audio), len(audio), "wav"))
+
+    latencies, outcomes = await run_calls(asr_call, args.asr_requests, c)
+    report("asr errors", latencies, outcomes, f"circuit {backend.stats()['circuit']}")
+
+    await set_faults(args.stub)
+    from upstream import close_upstreams
+    await close_upstreams()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stub", default="http://127.0.0.1:9100")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--asr-requests", type=int, default=30)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--attempts", type=int, default=3, help="retry attempts for the retrying runs")
+    parser.add_argument("--stall-rate", type=float, default=0.05)
+    parser.add_argument("--stall-ms", type=float, default=3000)
+    parser.add_argument("--error-rate", type=float, default=0.3)
+    asyncio.run(main(parser.parse_args()))
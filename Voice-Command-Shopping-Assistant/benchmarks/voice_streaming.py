@@ -0,0 +1,123 @@
+"""
+Time to first result of the streaming voice endpoint vs the upload endpoint.
+
+Start benchmarks/stub_upstreams.py and the API (see that module's docstring,
+including ASSEMBLYAI_STREAMING_HOST), then run:
+    python -m benchmarks.voice_streaming --api http://127.0.0.1:8000 --sessions 10
+
+Each simulated user speaks --speech seconds of synthetic audio (loud noise,
+well above STREAM_SPEECH_RMS) followed by silence, captured in 20 ms
+frames in real time:
+  * upload  - the recording is POSTed as a WAV once the user stops
+              (stop pressed the moment speech ends, the best case)
+  * stream  - frames go to /ws/recognise_text_to_llm as they are captured;
+              the server's endpointer ends the utterance on the silence
+All times are from the end of speech; for the stream the first partial is
+from the start of speech. --sessions users run concurrently.
+"""
+import argparse
+import asyncio
+import io
+import json
+import statistics
+import time
+import wave
+
+import httpx
+import numpy as np
+from websockets.asyncio.client import connect
+
+from benchmarks.stats import percentile
+
+SAMPLE_RATE = 16000
+FRAME_MS = 20
+
+
+def synthetic_speech(seconds, seed=0):
+    rng = np.random.default_rng(seed)
+    return (rng.standard_normal(int(seconds * SAMPLE_RATE)) * 4000).clip(-32768, 32767).astype("<i2").tobytes()
+
+
+def frames(pcm):
+    step = SAMPLE_RATE * 2 * FRAME_MS // 1000
+    return [pcm[i:i + step] for i in range(0, len(pcm), step)]
+
+
+def wav_file(pcm):
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(pcm)
+    return buffer.getvalue()
+
+
+async def upload(client, api, speech):
+    await asyncio.sleep(len(speech) / (SAMPLE_RATE * 2))  # recording
+    end_of_speech = time.perf_counter()
+    response = await client.post(f"{api}/recognise_text_to_llm", content=wav_file(speech),
+                                 headers={"Content-Type": "audio/wav"})
+    return {"result": (time.perf_counter() - end_of_speech) * 1000, "ok": response.status_code == 200}
+
+
+async def stream(api, speech, silence_seconds):
+    url = api.replace("http", "ws", 1) + "/ws/recognise_text_to_llm"
+    silence = b"\x00" * int(silence_seconds * SAMPLE_RATE * 2)
+    timings = {"ok": False}
+    async with connect(url) as websocket:
+        assert json.loads(await websocket.recv())["type"] == "ready"
+        start = time.perf_counter()
+        speech_frames = len(frames(speech))
+
+        async def send():
+            for i, frame in enumerate(frames(speech) + frames(silence)):
+                await websocket.send(frame)
+                if i + 1 == speech_frames:
+                    timings["end_of_speech"] = time.perf_counter()
+                await asyncio.sleep(FRAME_MS / 1000)
+
+        sender = asyncio.create_task(send())
+        try:
+            async for raw in websocket:
+                message = json.loads(raw)
+                if message["type"] == "partial" and "first_partial" not in timings:
+                    timings["first_partial"] = (time.perf_counter() - start) * 1000
+                elif message["type"] in ("result", "error"):
+                    timings["result"] = (time.perf_counter() - timings["end_of_speech"]) * 1000
+                    timings["ok"] = message["type"] == "result"
+                    break
+        finally:
+            sender.cancel()
+    return timings
+
+
+def report(label, results, key):
+    values = [r[key] for r in results if key in r]
+    if not values:
+        print(f"{label:<22} n=0")
+        return
+    p95 = percentile(values, 95)
+    print(f"{label:<22} n={len(values):<4} p50={statistics.median(values):7.0f}ms p95={p95:7.0f}ms")
+
+
+async def main(args):
+    speech = synthetic_speech(args.speech)
+    async with httpx.AsyncClient(timeout=60) as client:
+        uploads = await asyncio.gather(*[upload(client, args.api, speech) for _ in range(args.sessions)])
+    streams = await asyncio.gather(*[stream(args.api, speech, args.silence) for _ in range(args.sessions)])
+
+    report("upload: result", uploads, "result")
+    report("stream: first partial", streams, "first_partial")
+    report("stream: result", streams, "result")
+    failures = sum(not r["ok"] for r in uploads + streams)
+    print(f"failures: {failures}/{len(uploads) + len(streams)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--api", default="http://127.0.0.1:8000")
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--speech", type=float, default=1.5, help="seconds of speech per command")
+    parser.add_argument("--silence", type=float, default=2.0, help="seconds of trailing silence sent")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,153 @@
+import logging
+import threading
+from collections import namedtuple
+
+from pymongo import ASCENDING, UpdateOne
+from rapidfuzz import fuzz, process
+
+from helper_function import normalize_product_name, singularize
+
+# catalog_resolver.py
+#
+# Maps whatever product name the parser produced ("apples", "coke",
+# "orange-juice") to the canonical store item. Tiers, cheapest first:
+#
+#   1. exact normalized name (and its singular form)
+#   2. rapidfuzz candidate over all catalog names, compared word by word:
+#      every spoken word has to match a word of the candidate, so
+#      "peanut butter" is not "Butter" and "corn" is not "Popcorn"
+#   3. FAISS semantic nearest neighbour
+#   4. indexed Mongo point query on `name_key` (products the in-memory
+#      snapshot hasn't seen yet)
+
+logger = logging.getLogger(__name__)
+
+RESOLVER_FUZZY_MIN_SCORE = 88  # token_sort_ratio of the whole name
+RESOLVER_FUZZY_WORD_MIN_SCORE = 80  # each spoken word vs its best candidate word
+RESOLVER_SEMANTIC_MIN_SCORE = 0.6
+# Fuzzy and semantic matches are guesses: they report at most this, below
+# the fast-path bar, so /voice_command?confirm_below=... asks before applying.
+RESOLVER_APPROXIMATE_MAX_CONFIDENCE = 0.8
+# Tiers that matched the normalized name itself rather than guessed
+EXACT_TIERS = ("exact", "database")
+
+Resolution = namedtuple("Resolution", ["item", "confidence", "tier"])
+
+
+def ensure_name_keys(collection):
+    """
+    Creates the `name_key` index on the store and backfills documents that
+    predate it, so lookups by normalized name are indexed point queries.
+    """
+    collection.create_index([("name_key", ASCENDING)], name="name_key")
+    missing = list(collection.find({"name_key": {"$exists": False}}, {"_id": 1, "product": 1}))
+    if missing:
+        collection.bulk_write([
+            UpdateOne({"_id": doc["_id"]}, {"$set": {"name_key": normalize_product_name(doc.get("product", ""))}})
+            for doc in missing
+        ], ordered=False)
+        logger.info(f"🔑 Backfilled name_key on {len(missing)} store products")
+
+
+def words_covered(spoken: str, candidate: str, min_score: float = RESOLVER_FUZZY_WORD_MIN_SCORE) -> bool:
+    """True when every word of `spoken` matches some word of `candidate`."""
+    candidate_words = {form for w in candidate.split() for form in (w, singularize(w))}
+    return all(
+        max(fuzz.ratio(word, other) for other in candidate_words) >= min_score
+        for word in spoken.split()
+    )
+
+
+class CatalogResolver:
+    """
+    `catalog_fn()` returns (version, products) - see StoreIndex.catalog().
+    `semantic_fn(name)` returns (similarity, product name) for the nearest
+    catalog product, or None; it is only called when tiers 1-2 miss.
+    """
+
+    def __init__(self, catalog_fn, collection, semantic_fn=None,
+                 fuzzy_min_score: float = RESOLVER_FUZZY_MIN_SCORE,
+                 semantic_min_score: float = RESOLVER_SEMANTIC_MIN_SCORE):
+        self.catalog_fn = catalog_fn
+        self.collection = collection
+        self.semantic_fn = semantic_fn
+        self.fuzzy_min_score = fuzzy_min_score
+        self.semantic_min_score = semantic_min_score
+        self._version = object()
+        self._by_key = {}
+        self._choices = []
+        self._lock = threading.Lock()
+        self.counters = {"exact": 0, "fuzzy": 0, "semantic": 0, "database": 0, "unresolved": 0}
+
+    def _refresh(self):
+        version, products = self.catalog_fn()
+        if version == self._version:
+            return
+        by_key = {}
+        for item in products:
+            key = normalize_product_name(item["product"])
+            canonical = {**item, "name_key": key}
+            canonical.pop("text", None)
+            by_key.setdefault(key, canonical)
+        self._by_key = by_key
+        self._choices = list(by_key)
+        self._version = version
+
+    def _count(self, tier):
+        with self._lock:
+            self.counters[tier] += 1
+
+    def resolve(self, name: str):
+        """Returns a Resolution for `name`, or None when nothing is close enough."""
+        key = normalize_product_name(name)
+        if not key:
+            self._count("unresolved")
+            return None
+        singular = " ".join(singularize(w) for w in key.split())
+
+        with self._lock:
+            self._refresh()
+            by_key, choices = self._by_key, self._choices
+
+        # Tier 1: exact
+        for candidate, confidence in ((key, 1.0), (singular, 0.95)):
+            if candidate in by_key:
+                self._count("exact")
+                return Resolution(by_key[candidate], confidence, "exact")
+
+        # Tier 2: fuzzy, whole words only
+        if choices:
+            for spoken in dict.fromkeys([singular, key]):
+                for candidate, score, _ in process.extract(spoken, choices, scorer=fuzz.token_sort_ratio,
+                                                           score_cutoff=self.fuzzy_min_score, limit=5):
+                    if words_covered(spoken, candidate):
+                        self._count("fuzzy")
+                        confidence = RESOLVER_APPROXIMATE_MAX_CONFIDENCE * score / 100
+                        return Resolution(by_key[candidate], round(confidence, 3), "fuzzy")
+
+        # Tier 3: semantic
+        if self.semantic_fn is not None:
+            nearest = self.semantic_fn(key)
+            if nearest is not None:
+                similarity, product = nearest
+                item = by_key.get(normalize_product_name(product))
+                if item is not None and similarity >= self.semantic_min_score:
+                    self._count("semantic")
+                    confidence = min(similarity, RESOLVER_APPROXIMATE_MAX_CONFIDENCE)
+                    return Resolution(item, round(confidence, 3), "semantic")
+
+        # Tier 4: indexed point query for products newer than our snapshot
+        doc = self.collection.find_one(
+            {"name_key": {"$in": list(dict.fromkeys([key, singular]))}},
+            {"_id": 0, "product": 1, "category": 1, "price": 1, "name_key": 1},
+        )
+        if doc is not None:
+            self._count("database")
+            return Resolution(doc, 1.0 if doc["name_key"] == key else 0.95, "database")
+
+        self._count("unresolved")
+        return None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self.counters, "catalog_items": len(self._by_key)}
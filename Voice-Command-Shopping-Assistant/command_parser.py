@@ -0,0 +1,229 @@
+import os
+import re
+import threading
+
+from rapidfuzz import fuzz, process
+
+from helper_function import singularize
+
+# command_parser.py
+#
+# Deterministic fast path for the common shopping commands ("add two milk",
+# "remove bananas", "delete 3 bottles of cola"). It produces the same dict
+# shape as the Groq parser and is only trusted when it is confident; every
+# other transcript still goes to the LLM.
+
+FAST_PATH_MIN_CONFIDENCE = float(os.getenv("FAST_PATH_MIN_CONFIDENCE", "0.85"))
+# Bar for applying a local parse when the LLM is unavailable (see
+# main.interpret_transcript): exact (1.0) or singular (0.95) catalog names
+# only - fuzzy guesses ("coke" -> Cookies) stay below it and get a 503.
+FALLBACK_MIN_CONFIDENCE = float(os.getenv("FALLBACK_MIN_CONFIDENCE", "0.95"))
+
+NUMBER_WORDS = {
+    "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+    "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10, "eleven": 11,
+    "twelve": 12, "thirteen": 13, "fourteen": 14, "fifteen": 15,
+    "sixteen": 16, "seventeen": 17, "eighteen": 18, "nineteen": 19,
+    "twenty": 20, "thirty": 30, "forty": 40, "fifty": 50, "sixty": 60,
+    "seventy": 70, "eighty": 80, "ninety": 90, "hundred": 100,
+    "dozen": 12, "couple": 2, "pair": 2, "few": 3,
+    # common ASR homophones
+    "to": 2, "too": 2, "for": 4, "won": 1,
+}
+# Homophones only count as numbers directly after the verb ("add to milk").
+HOMOPHONES = {"to", "too", "for", "won"}
+
+UNITS = {
+    "kg", "kgs", "kilo", "kilos", "kilogram", "kilograms", "g", "gram", "grams",
+    "l", "liter", "liters", "litre", "litres", "ml", "pack", "packs", "packet",
+    "packets", "bottle", "bottles", "box", "boxes", "bag", "bags", "can", "cans",
+    "carton", "cartons", "piece", "pieces", "pcs", "jar", "jars", "loaf",
+    "loaves", "unit", "units", "dozen", "of",
+}
+
+VERBS = {
+    "add": "add", "buy": "add", "get": "add", "put": "add", "include": "add",
+    "need": "add", "want": "add", "order": "add", "purchase": "add",
+    "remove": "remove", "drop": "remove", "minus": "remove",
+    "delete": "delete", "erase": "delete", "cancel": "delete",
+}
+# "take out / off / away" removes; a bare "take" ("take two apples") usually
+# means add, so it is left to the LLM.
+TAKE_PARTICLES = {"out", "off", "away"}
+
+FILLERS = {
+    "please", "can", "could", "would", "you", "i", "id", "we", "like", "also",
+    "some", "the", "my", "me", "to", "from", "in", "into", "on", "onto", "off",
+    "out", "list", "wishlist", "wish", "shopping", "cart", "basket", "it",
+    "for", "more", "another", "just", "now", "thanks", "thank",
+}
+
+_PUNCTUATION = re.compile(r"[^\w\s.]")
+
+
+def normalize_transcript(text: str) -> str:
+    """Lower-cases, strips punctuation (keeping decimals) and collapses whitespace."""
+    text = _PUNCTUATION.sub(" ", str(text).lower())
+    text = re.sub(r"(?<!\d)\.|\.(?!\d)", " ", text)
+    return " ".join(text.split())
+
+
+def parse_quantity(tokens, start):
+    """
+    Reads a quantity at tokens[start:]. Returns (quantity or None, tokens used).
+    Handles digits and compound number words ("twenty five", "a dozen").
+    """
+    if start >= len(tokens):
+        return None, 0
+    token = tokens[start]
+    if re.fullmatch(r"\d+", token):
+        return int(token), 1
+    if re.fullmatch(r"\d+\.\d+", token):
+        return "fraction", 1
+    total, used = 0, 0
+    while start + used < len(tokens):
+        word = tokens[start + used]
+        if word not in NUMBER_WORDS:
+            break
+        if word in HOMOPHONES:
+            following = tokens[start + used + 1] if start + used + 1 < len(tokens) else None
+            if used > 0 or following is None or following in FILLERS:
+                break
+        value = NUMBER_WORDS[word]
+        if word == "hundred":
+            total = max(total, 1) * 100
+        elif word == "dozen":
+            total = max(total, 1) * 12
+        elif word in ("a", "an") and start + used + 1 < len(tokens) and tokens[start + used + 1] in ("dozen", "couple", "pair", "few"):
+            pass  # "a dozen": let the next word carry the value
+        else:
+            total += value
+        used += 1
+    if used == 0:
+        return None, 0
+    return total, used
+
+
+class LocalCommandParser:
+    """
+    Rule-based parser over the store catalog.
+
+    `catalog_fn()` returns (version, products) where products are dicts with
+    at least "product" and "category". The name lookup tables are rebuilt
+    only when the version changes.
+    """
+
+    def __init__(self, catalog_fn, min_confidence: float = FAST_PATH_MIN_CONFIDENCE):
+        self.catalog_fn = catalog_fn
+        self.min_confidence = min_confidence
+        self._version = object()
+        self._names = {}  # normalized name -> product dict
+        self._choices = []
+        self._lock = threading.Lock()
+        self.counters = {"attempts": 0, "hits": 0, "low_confidence": 0}
+
+    def _refresh_catalog(self):
+        version, products = self.catalog_fn()
+        if version == self._version:
+            return
+        names = {}
+        for item in products:
+            key = normalize_transcript(item["product"])
+            names.setdefault(key, item)
+            names.setdefault(" ".join(singularize(w) for w in key.split()), item)
+        self._names = names
+        self._choices = list(names)
+        self._version = version
+
+    def _resolve(self, phrase: str):
+        """Returns (catalog item, confidence) for a product phrase."""
+        if not phrase:
+            return None, 0.0
+        if phrase in self._names:
+            return self._names[phrase], 1.0
+        singular = " ".join(singularize(w) for w in phrase.split())
+        if singular in self._names:
+            return self._names[singular], 0.95
+        if not self._choices:
+            return None, 0.0
+        match = process.extractOne(singular, self._choices, scorer=fuzz.ratio)
+        if match is None:
+            return None, 0.0
+        name, score, _ = match
+        return self._names[name], score / 100 * 0.95
+
+    def analyse(self, user_text: str):
+        """
+        Parses a transcript. Returns (parsed dict or None, confidence); the
+        dict matches what validate_llm_response() accepts.
+        """
+        tokens = normalize_transcript(user_text).split()
+
+        action, verb_at = None, None
+        for i, token in enumerate(tokens[:5]):
+            if token == "take":
+                if tokens[i + 1:i + 2] and tokens[i + 1] in TAKE_PARTICLES:
+                    action, verb_at = "remove", i
+                break
+            if token in VERBS:
+                action, verb_at = VERBS[token], i
+                break
+        if action is None:
+            return None, 0.0
+        # Anything before the verb must be politeness ("can you please add").
+        if any(t not in FILLERS for t in tokens[:verb_at]):
+            return None, 0.0
+
+        rest = tokens[verb_at + 1:]
+        # "take out", "take off": particle belongs to the verb
+        if tokens[verb_at] == "take":
+            rest = rest[1:]
+
+        quantity, used = parse_quantity(rest, 0)
+        if quantity is None:
+            # No amount: add one, or remove the whole entry (quantity 0).
+            quantity, used = (1 if action == "add" else 0), 0
+        elif quantity == "fraction" or quantity <= 0:
+            return None, 0.0
+        rest = rest[used:]
+        while rest and rest[0] in UNITS:
+            rest = rest[1:]
+
+        phrase_tokens = [t for t in rest if t not in FILLERS]
+        # More than one item, or a qualifier we can't interpret: leave it to the LLM.
+        if "and" in phrase_tokens or any(t.isdigit() or t in NUMBER_WORDS and t not in HOMOPHONES for t in phrase_tokens):
+            return None, 0.0
+
+        with self._lock:
+            self._refresh_catalog()
+            item, confidence = self._resolve(" ".join(phrase_tokens))
+        if item is None:
+            return None, 0.0
+
+        return {
+            "product": item["product"],
+            "quantity": quantity,
+            "category": item.get("category", "unknown"),
+            "action": action,
+            "status": "ai_generated",
+            "source": "local_parser",
+            "confidence": round(confidence, 3),
+        }, confidence
+
+    def parse(self, user_text: str):
+        """Returns the parsed command, or None when the LLM should decide."""
+        parsed, confidence = self.analyse(user_text)
+        hit = parsed is not None and confidence >= self.min_confidence
+        with self._lock:
+            self.counters["attempts"] += 1
+            self.counters["hits" if hit else "low_confidence"] += 1
+        return parsed if hit else None
+
+    def stats(self) -> dict:
+        with self._lock:
+            c = dict(self.counters)
+        return {
+            **c,
+            "hit_rate": round(c["hits"] / c["attempts"], 4) if c["attempts"] else 0.0,
+            "min_confidence": self.min_confidence,
+        }
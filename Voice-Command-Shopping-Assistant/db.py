@@ -13,3 +13,5 @@ db = client[DB_NAME]
 # Collections
 user_collection = db["users"]
 store_collection = db["store"]
+history_collection = db["history"]
+idempotency_collection = db["idempotency_keys"]
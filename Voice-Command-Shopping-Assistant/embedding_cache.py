@@ -0,0 +1,272 @@
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# embedding_cache.py
+#
+# Content-addressed cache for sentence embeddings.
+#
+#   key    = blake2b(model name + normalized text), 16 bytes
+#   tier 1 = in-process LRU of vectors
+#   tier 2 = on-disk arena shared by every worker on the node:
+#              keys.bin     one 16-byte key per row, append-only
+#              vectors.f32  one float32 vector per row, same order
+#            Both files are memory-mapped; a row's vector is always written
+#            before its key, so any visible key has a complete vector.
+#            Appends and compactions hold an exclusive flock; readers pick
+#            up new rows and map the vectors under a shared one, so they
+#            never pair one compaction's keys with another's vectors.
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", os.path.join(os.path.dirname(__file__), "index_cache", "embeddings"))
+EMBEDDING_CACHE_MEMORY_ITEMS = int(os.getenv("EMBEDDING_CACHE_MEMORY_ITEMS", "10000"))
+EMBEDDING_CACHE_DISK_ITEMS = int(os.getenv("EMBEDDING_CACHE_DISK_ITEMS", "2000000"))
+EMBEDDING_CACHE_READONLY = os.getenv("EMBEDDING_CACHE_READONLY", "false").lower() == "true"
+
+KEY_BYTES = 16
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """
+    Canonical form used both as cache key and as the text actually encoded.
+    Case folding is safe because all-MiniLM-L6-v2 is an uncased model.
+    """
+    return _WHITESPACE.sub(" ", str(text)).strip().lower()
+
+
+def cache_key(model_name: str, normalized: str) -> bytes:
+    return hashlib.blake2b(f"{model_name}\x00{normalized}".encode(), digest_size=KEY_BYTES).digest()
+
+
+class DiskArena:
+    """Append-only, memory-mapped key/vector store shared between processes."""
+
+    def __init__(self, directory: str, max_items: int, readonly: bool = False):
+        self.directory = directory
+        self.max_items = max_items
+        self.readonly = readonly
+        self.dim = None
+        self.rows = {}  # key -> row
+        self._keys_seen = 0
+        self._inode = None
+        self._vectors = None
+        if not readonly:
+            os.makedirs(directory, exist_ok=True)
+        self._read_meta()
+
+    # paths
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _read_meta(self):
+        try:
+            with open(self._path("meta.json")) as f:
+                self.dim = json.load(f)["dim"]
+        except (OSError, ValueError, KeyError):
+            self.dim = None
+
+    def _lock(self, shared: bool = False):
+        """
+        Cross-process lock: exclusive for appends and compaction, shared for
+        reading keys and mapping vectors. None when there is no lock file
+        to take (read-only cache that nobody has written to).
+        """
+        try:
+            handle = open(self._path("arena.lock"), "a")
+        except OSError:
+            if not shared:
+                raise
+            try:
+                handle = open(self._path("arena.lock"), "r")
+            except OSError:
+                return None
+        fcntl.flock(handle, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        return handle
+
+    def _refresh(self):
+        """Picks up rows appended by other workers (or a compaction)."""
+        keys_path = self._path("keys.bin")
+        try:
+            stat = os.stat(keys_path)
+        except FileNotFoundError:
+            return
+        if stat.st_ino != self._inode:
+            # File was replaced by a compaction: start over.
+            self.rows, self._keys_seen, self._inode, self._vectors = {}, 0, stat.st_ino, None
+            self._read_meta()
+        total = stat.st_size // KEY_BYTES
+        if total > self._keys_seen:
+            with open(keys_path, "rb") as f:
+                f.seek(self._keys_seen * KEY_BYTES)
+                data = f.read((total - self._keys_seen) * KEY_BYTES)
+            for i in range(len(data) // KEY_BYTES):
+                self.rows[data[i * KEY_BYTES:(i + 1) * KEY_BYTES]] = self._keys_seen + i
+            self._keys_seen += len(data) // KEY_BYTES
+            self._vectors = None
+
+    def _vector_map(self):
+        if self._vectors is None and self.dim and self._keys_seen:
+            self._vectors = np.memmap(
+                self._path("vectors.f32"), dtype="float32", mode="r",
+                shape=(self._keys_seen, self.dim),
+            )
+        return self._vectors
+
+    def get_many(self, keys):
+        """Returns {key: vector} for the keys present on disk."""
+        if any(key not in self.rows for key in keys):
+            handle = self._lock(shared=True)
+            try:
+                self._refresh()
+                vectors = self._vector_map()
+            finally:
+                if handle is not None:
+                    handle.close()
+        else:
+            vectors = self._vector_map()
+        found = {}
+        for key in keys:
+            row = self.rows.get(key)
+            if row is not None and vectors is not None and row < len(vectors):
+                found[key] = np.array(vectors[row])
+        return found
+
+    def put_many(self, items):
+        """Appends (key, vector) pairs not already present."""
+        if self.readonly or not items:
+            return 0
+        handle = self._lock()
+        try:
+            self._refresh()
+            items = [(k, v) for k, v in dict(items).items() if k not in self.rows]
+            if not items:
+                return 0
+            # A batch larger than the arena keeps only its newest max_items.
+            dropped = max(0, len(items) - self.max_items)
+            items = items[dropped:]
+            if self.dim is None:
+                self.dim = int(items[0][1].shape[0])
+                with open(self._path("meta.json"), "w") as f:
+                    json.dump({"dim": self.dim}, f)
+            evicted = dropped
+            if self._keys_seen + len(items) > self.max_items:
+                evicted += self._compact(keep=max(0, int(self.max_items * 0.75) - len(items)))
+            with open(self._path("vectors.f32"), "ab") as f:
+                f.write(np.stack([v for _, v in items]).astype("float32").tobytes())
+            with open(self._path("keys.bin"), "ab") as f:
+                f.write(b"".join(k for k, _ in items))
+            self._refresh()
+            return evicted
+        finally:
+            handle.close()
+
+    def _compact(self, keep: int) -> int:
+        """Drops the oldest rows, keeping the newest `keep`. Caller holds the lock."""
+        total = self._keys_seen
+        start = total - keep
+        vectors = self._vector_map()
+        with open(self._path("keys.bin"), "rb") as f:
+            f.seek(start * KEY_BYTES)
+            kept_keys = f.read(keep * KEY_BYTES)
+        kept_vectors = np.array(vectors[start:]) if vectors is not None else np.zeros((0, self.dim), "float32")
+        with open(self._path("vectors.f32.tmp"), "wb") as f:
+            f.write(kept_vectors.tobytes())
+        with open(self._path("keys.bin.tmp"), "wb") as f:
+            f.write(kept_keys)
+        os.replace(self._path("vectors.f32.tmp"), self._path("vectors.f32"))
+        os.replace(self._path("keys.bin.tmp"), self._path("keys.bin"))
+        self._inode = None
+        self._refresh()
+        logger.info(f"🧹 Embedding cache compacted: evicted {start} rows, kept {keep}")
+        return start
+
+
+class EmbeddingCache:
+    """
+    Wraps an encode function with the two cache tiers.
+    `encode_fn(texts) -> np.ndarray` is only called for cache misses, in one
+    batch per call to encode().
+    """
+
+    def __init__(self, model_name: str, encode_fn, directory: str = EMBEDDING_CACHE_DIR,
+                 memory_items: int = EMBEDDING_CACHE_MEMORY_ITEMS,
+                 disk_items: int = EMBEDDING_CACHE_DISK_ITEMS,
+                 readonly: bool = EMBEDDING_CACHE_READONLY):
+        self.model_name = model_name
+        self.encode_fn = encode_fn
+        self.memory_items = memory_items
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.disk = None
+        if disk_items > 0:
+            try:
+                self.disk = DiskArena(os.path.join(directory, model_name.replace("/", "_")), disk_items, readonly)
+            except OSError as e:
+                logger.warning(f"⚠️ Embedding disk cache disabled: {e}")
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0,
+                         "memory_evictions": 0, "disk_evictions": 0}
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+            self.counters["memory_evictions"] += 1
+
+    def encode(self, texts) -> np.ndarray:
+        normalized = [normalize_text(t) for t in texts]
+        keys = [cache_key(self.model_name, n) for n in normalized]
+        found = {}
+
+        with self._lock:
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[key] = self._memory[key]
+            self.counters["memory_hits"] += sum(1 for k in keys if k in found)
+
+            missing = [k for k in dict.fromkeys(keys) if k not in found]
+            if missing and self.disk is not None:
+                on_disk = self.disk.get_many(missing)
+                self.counters["disk_hits"] += sum(1 for k in keys if k in on_disk)
+                for key, vector in on_disk.items():
+                    self._remember(key, vector)
+                found.update(on_disk)
+
+        todo = {}
+        for key, text in zip(keys, normalized):
+            if key not in found:
+                todo.setdefault(key, text)
+        if todo:
+            vectors = np.asarray(self.encode_fn(list(todo.values())), dtype="float32")
+            fresh = list(zip(todo.keys(), vectors))
+            with self._lock:
+                self.counters["misses"] += sum(1 for k in keys if k in todo)
+                for key, vector in fresh:
+                    self._remember(key, vector)
+                    found[key] = vector
+                if self.disk is not None:
+                    self.counters["disk_evictions"] += self.disk.put_many(fresh)
+
+        if not keys:
+            return np.zeros((0, self.disk.dim if self.disk and self.disk.dim else 0), dtype="float32")
+        return np.stack([found[k] for k in keys])
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.counters["memory_hits"] + self.counters["disk_hits"] + self.counters["misses"]
+            return {
+                **self.counters,
+                "hit_rate": round(1 - self.counters["misses"] / lookups, 4) if lookups else 0.0,
+                "memory_items": len(self._memory),
+                "disk_items": len(self.disk.rows) if self.disk else 0,
+            }
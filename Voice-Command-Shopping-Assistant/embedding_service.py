@@ -0,0 +1,251 @@
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+# embedding_service.py
+#
+# Micro-batching front end for the sentence-transformer.
+#
+# Callers (route threads, the index builder, async handlers) submit small
+# encode requests. A collector thread drains them into batches - closing a
+# batch after EMBEDDING_BATCH_WAIT_MS or EMBEDDING_BATCH_MAX_ITEMS texts -
+# and runs each batch as a single encode() call on a pool of worker
+# processes, each holding its own model instance. Results are split back
+# per caller. A batch that fails to dispatch fails its callers' futures, and a
+# pool whose worker died (e.g. OOM-killed) is replaced on the next submit.
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", str(min(4, os.cpu_count() or 1))))
+EMBEDDING_BATCH_MAX_ITEMS = int(os.getenv("EMBEDDING_BATCH_MAX_ITEMS", "64"))
+EMBEDDING_BATCH_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "5"))
+EMBEDDING_QUEUE_MAX = int(os.getenv("EMBEDDING_QUEUE_MAX", "1024"))
+EMBEDDING_ENCODE_TIMEOUT_S = float(os.getenv("EMBEDDING_ENCODE_TIMEOUT_S", "60"))
+
+
+class EmbeddingQueueFull(Exception):
+    """Raised when the encode queue is at EMBEDDING_QUEUE_MAX."""
+
+
+# ---------------- worker process side ----------------
+_worker_model = None
+
+
+def _load_model(model_name: str):
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name)
+
+
+def _worker_init(model_name: str):
+    global _worker_model
+    _worker_model = _load_model(model_name)
+
+
+def _worker_encode(texts):
+    return _worker_model.encode(texts, convert_to_numpy=True)
+
+
+# ------------------- service side --------------------
+class _Request:
+    __slots__ = ("texts", "future", "enqueued_at")
+
+    def __init__(self, texts):
+        self.texts = texts
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class EmbeddingService:
+    def __init__(self, model_name: str, workers: int = EMBEDDING_WORKERS,
+                 max_batch: int = EMBEDDING_BATCH_MAX_ITEMS,
+                 wait_ms: float = EMBEDDING_BATCH_WAIT_MS,
+                 queue_max: int = EMBEDDING_QUEUE_MAX):
+        self.model_name = model_name
+        self.workers = workers
+        self.max_batch = max_batch
+        self.wait_s = wait_ms / 1000
+        self._queue = queue.Queue(maxsize=queue_max)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._local_model = None
+        self._local_lock = threading.Lock()
+        self._collector = None
+        self._stopping = threading.Event()
+        self._stats_lock = threading.Lock()
+        self.counters = {
+            "requests": 0, "batches": 0, "items": 0,
+            "max_queue_depth": 0, "wait_ms_total": 0.0, "encode_ms_total": 0.0,
+        }
+
+    # ---------------------- lifecycle ----------------------
+    def start(self):
+        if self._collector is not None and self._collector.is_alive():
+            return
+        if self.workers > 0 and self._pool is None:
+            self._pool = self._new_pool()
+        self._stopping.clear()
+        self._collector = threading.Thread(target=self._collect, name="embedding-batcher", daemon=True)
+        self._collector.start()
+        logger.info(
+            f"🧮 Embedding service started: workers={self.workers}, "
+            f"max_batch={self.max_batch}, wait={self.wait_s * 1000:.1f}ms"
+        )
+
+    def _new_pool(self):
+        # spawn, not fork: the parent may already hold torch/BLAS threads.
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_worker_init,
+            initargs=(self.model_name,),
+        )
+
+    def stop(self):
+        if self._collector is not None:
+            self._stopping.set()
+            try:
+                self._queue.put_nowait(None)  # wakes an idle collector
+            except queue.Full:
+                pass  # busy: it sees the event after its current batch
+            self._collector.join(timeout=5)
+            self._collector = None
+            # Requests still queued will never be batched now.
+            while True:
+                try:
+                    request = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if request is not None:
+                    request.future.set_exception(RuntimeError("Embedding service stopped"))
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    # ----------------------- encoding ----------------------
+    def _encode_now(self, texts):
+        """Runs one encode() call, in the pool or in-process."""
+        pool = self._pool
+        if pool is not None:
+            try:
+                return pool.submit(_worker_encode, texts)
+            except BrokenProcessPool:
+                # A worker died: replace the pool once, then retry on the new one.
+                with self._pool_lock:
+                    if self._pool is pool:
+                        logger.warning("⚠️ Embedding worker pool broken, restarting it")
+                        pool.shutdown(wait=False, cancel_futures=True)
+                        self._pool = self._new_pool()
+                    pool = self._pool
+                if pool is not None:
+                    return pool.submit(_worker_encode, texts)
+        future = Future()
+        try:
+            with self._local_lock:
+                if self._local_model is None:
+                    self._local_model = _load_model(self.model_name)
+                future.set_result(self._local_model.encode(texts, convert_to_numpy=True))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def submit(self, texts) -> Future:
+        """
+        Queues texts for encoding and returns a Future of an (n, dim) array.
+        Requests larger than one batch (e.g. a catalog build) skip the queue.
+        """
+        texts = list(texts)
+        collector = self._collector
+        if (len(texts) >= self.max_batch or collector is None or not collector.is_alive()
+                or self._stopping.is_set()):
+            return self._encode_now(texts)
+        request = _Request(texts)
+        try:
+            self._queue.put_nowait(request)
+        except queue.Full:
+            raise EmbeddingQueueFull(f"Embedding queue is full ({self._queue.maxsize} requests)")
+        with self._stats_lock:
+            self.counters["requests"] += 1
+            self.counters["max_queue_depth"] = max(self.counters["max_queue_depth"], self._queue.qsize())
+        return request.future
+
+    def encode(self, texts, timeout=EMBEDDING_ENCODE_TIMEOUT_S) -> np.ndarray:
+        """Blocking encode, safe to call from any thread. Raises TimeoutError after timeout seconds."""
+        return self.submit(texts).result(timeout=timeout)
+
+    def _collect(self):
+        while not self._stopping.is_set():
+            first = self._queue.get()
+            if first is None:
+                return
+            batch, size = [first], len(first.texts)
+            deadline = time.perf_counter() + self.wait_s
+            while size < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if request is None:
+                    break
+                batch.append(request)
+                size += len(request.texts)
+            self._dispatch(batch)
+
+    def _dispatch(self, batch):
+        texts = [text for request in batch for text in request.texts]
+        dispatched_at = time.perf_counter()
+        with self._stats_lock:
+            self.counters["batches"] += 1
+            self.counters["items"] += len(texts)
+            self.counters["wait_ms_total"] += sum(dispatched_at - r.enqueued_at for r in batch) * 1000
+
+        def _split(done: Future):
+            with self._stats_lock:
+                self.counters["encode_ms_total"] += (time.perf_counter() - dispatched_at) * 1000
+            try:
+                vectors = done.result()
+            except Exception as e:
+                for request in batch:
+                    request.future.set_exception(e)
+                return
+            offset = 0
+            for request in batch:
+                request.future.set_result(vectors[offset:offset + len(request.texts)])
+                offset += len(request.texts)
+
+        try:
+            future = self._encode_now(texts)
+        except Exception as e:
+            # Never let one batch kill the collector thread.
+            logger.error(f"❌ Embedding batch dispatch failed: {e}")
+            future = Future()
+            future.set_exception(e)
+        future.add_done_callback(_split)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            c = dict(self.counters)
+        batches = c["batches"] or 1
+        return {
+            "workers": self.workers,
+            "max_batch": self.max_batch,
+            "batch_wait_ms": self.wait_s * 1000,
+            "queue_depth": self._queue.qsize(),
+            "queue_max": self._queue.maxsize,
+            "max_queue_depth": c["max_queue_depth"],
+            "requests": c["requests"],
+            "batches": c["batches"],
+            "mean_batch_size": round(c["items"] / batches, 2),
+            "mean_wait_ms": round(c["wait_ms_total"] / max(c["requests"], 1), 3),
+            "mean_encode_ms": round(c["encode_ms_total"] / batches, 3),
+        }
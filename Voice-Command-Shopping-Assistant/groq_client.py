@@ -0,0 +1,166 @@
+import asyncio
+import json
+import os
+import time
+
+import httpx
+from dotenv import load_dotenv
+
+from resilience import (
+    CircuitBreaker, DeadlineExceeded, LatencyTracker, UpstreamUnavailable, current_deadline, hedged,
+    retry,
+)
+from metrics import upstream_requests
+from upstream import get_http_client, groq_limiter
+
+load_dotenv()
+
+# groq_client.py
+#
+# LLM command parsing via Groq. main.py validates that GROQ_API_KEY is set
+# before serving; this module only reads it.
+#
+# Each attempt is bounded by GROQ_TIMEOUT_SECONDS and the request deadline,
+# transport errors / 429 / 5xx are retried with backoff behind a circuit
+# breaker, and with GROQ_HEDGE=true a second request goes out once the
+# first is slower than the recent p95. When Groq can't answer,
+# process_command raises resilience.UpstreamUnavailable.
+
+GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+GROQ_MODEL = os.getenv("GROQ_MODEL", "llama-3.3-70b-versatile")
+
+GROQ_API_URL = os.getenv("GROQ_API_URL", "https://api.groq.com/openai/v1/chat/completions")
+GROQ_TIMEOUT_SECONDS = float(os.getenv("GROQ_TIMEOUT_SECONDS", "8"))
+GROQ_HEDGE = os.getenv("GROQ_HEDGE", "false").lower() == "true"
+GROQ_HEDGE_MIN_DELAY_MS = float(os.getenv("GROQ_HEDGE_MIN_DELAY_MS", "100"))
+
+groq_breaker = CircuitBreaker("Groq")
+groq_latency = LatencyTracker()
+groq_counters = {"hedged": 0, "hedge_wins": 0}
+
+
+def _retryable(e: Exception) -> bool:
+    if isinstance(e, httpx.HTTPStatusError):
+        return e.response.status_code == 429 or e.response.status_code >= 500
+    return isinstance(e, (httpx.TransportError, asyncio.TimeoutError))
+
+
+def _outcome(e: Exception) -> str:
+    if isinstance(e, (asyncio.TimeoutError, httpx.TimeoutException)):
+        return "timeout"
+    if isinstance(e, httpx.HTTPStatusError):
+        return f"http_{e.response.status_code}"
+    return "error"
+
+
+async def _post_once(payload: dict) -> dict:
+    timeout = current_deadline().timeout(GROQ_TIMEOUT_SECONDS)
+    try:
+        async with groq_limiter:
+            start = time.perf_counter()
+            # wait_for bounds the whole exchange, not just each socket read.
+            response = await asyncio.wait_for(
+                get_http_client().post(
+                    GROQ_API_URL,
+                    headers={
+                        "Authorization": f"Bearer {GROQ_API_KEY}",
+                        "Content-Type": "application/json",
+                    },
+                    json=payload,
+                    timeout=timeout,
+                ),
+                timeout,
+            )
+        response.raise_for_status()
+    except Exception as e:
+        upstream_requests.inc("groq", _outcome(e))
+        raise
+    upstream_requests.inc("groq", "ok")
+    groq_latency.record(time.perf_counter() - start)
+    return response.json()
+
+
+async def _attempt(payload: dict) -> dict:
+    p95 = groq_latency.quantile(0.95) if GROQ_HEDGE else None
+    if p95 is None:
+        return await _post_once(payload)
+    delay = max(p95, GROQ_HEDGE_MIN_DELAY_MS / 1000)
+    return await hedged(lambda: _post_once(payload), delay, groq_counters)
+
+
+async def _chat_completion(payload: dict) -> dict:
+    try:
+        # The breaker counts calls that failed after their retries, so a
+        # flaky-but-up Groq doesn't trip it.
+        return await groq_breaker.call(
+            lambda: retry(lambda: _attempt(payload), _retryable, name="Groq"),
+            is_failure=_retryable,
+        )
+    except UpstreamUnavailable:
+        raise
+    except Exception as e:
+        if not _retryable(e):
+            raise
+        if current_deadline().remaining() <= 0:
+            raise DeadlineExceeded("Groq did not answer before the request deadline") from e
+        raise UpstreamUnavailable(f"Groq unavailable: {e!r}") from e
+
+
+def groq_stats() -> dict:
+    p95 = groq_latency.quantile(0.95)
+    return {
+        **groq_breaker.stats(),
+        **groq_counters,
+        "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+    }
+
+
+async def process_command(user_text: str):
+    """
+    Takes a shopping voice command as text and returns structured JSON
+    with product, quantity, category, action, status.
+    """
+
+    prompt = f"""
+You are AI working as a store assistant. 
+Parse the following user command into a JSON object with these exact fields:
+If u  find the command irrelevent and found no information from that so just put a error message in all the key of json
+
+
+- product: name of the item (string)
+- quantity: number (default = 1 if not mentioned; for remove/delete with no quantity mentioned use 0, meaning all of it)
+- category: guess item category (e.g., dairy, fruit, drinks, snacks, grains)
+- action: one of ["add", "remove", "delete"]
+- status: always "ai_generated"
+
+User command: "{user_text}"
+
+Return only valid JSON, no explanation.
+"""
+
+    try:
+        result = await _chat_completion({
+            "model": GROQ_MODEL,  # ✅ Groq recommended model
+            "messages": [
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": 0.2
+        })
+
+        if "choices" not in result or not result["choices"]:
+            return {"error": "Unexpected response from Groq", "raw": result}
+
+        content = result["choices"][0]["message"]["content"].strip()
+
+        # Extract JSON portion only
+        json_start = content.find("{")
+        json_end = content.rfind("}") + 1
+        if json_start != -1 and json_end != -1:
+            return json.loads(content[json_start:json_end])
+
+        return {"error": "Could not parse JSON", "raw": content}
+
+    except UpstreamUnavailable:
+        raise
+    except Exception as e:
+        return {"error": str(e)}
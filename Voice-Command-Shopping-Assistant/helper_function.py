@@ -1,7 +1,11 @@
+import re
+
 from rapidfuzz import fuzz, process
 
 # helper_functions.py
 
+_NON_WORD = re.compile(r"[^\w\s]")
+
 def validate_llm_response(llm_response: dict) -> bool:
     """
     Validate LLM shopping assistant response.
@@ -49,4 +53,26 @@ def find_closest_product(product_name, wishlist):
     )
     if score >= 70:  # threshold can be tuned
         return wishlist[idx]
-    return None
\ No newline at end of file
+    return None
+
+
+def singularize(word: str) -> str:
+    """
+    Cheap English singular form, good enough for grocery names
+    ("apples" -> "apple", "berries" -> "berry", "tomatoes" -> "tomato").
+    """
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-3] + "y"
+    if word.endswith(("oes", "ches", "shes", "xes")):
+        return word[:-2]
+    if word.endswith("s") and not word.endswith("ss") and len(word) > 3:
+        return word[:-1]
+    return word
+
+
+def normalize_product_name(name: str) -> str:
+    """
+    Normalized product name used as the store lookup key (`name_key`):
+    lower-case, punctuation removed, whitespace collapsed.
+    """
+    return " ".join(_NON_WORD.sub(" ", str(name).lower()).split())
@@ -0,0 +1,107 @@
+import base64
+import datetime
+import logging
+import os
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import CollectionInvalid, OperationFailure
+
+# history.py
+#
+# Append-only command history, one document per command:
+#   {username, ts (datetime), command (the parsed llm_response)}
+# It used to live in users.historylist, which grew without bound.
+#
+# HISTORY_RETENTION_DAYS > 0 expires old entries (TTL index, or
+# expireAfterSeconds on a time-series collection). Set
+# HISTORY_TIMESERIES=true to create the collection as time-series
+# (MongoDB 5.0+); otherwise it is a regular indexed collection.
+
+logger = logging.getLogger(__name__)
+
+HISTORY_RETENTION_DAYS = int(os.getenv("HISTORY_RETENTION_DAYS", "365"))
+HISTORY_TIMESERIES = os.getenv("HISTORY_TIMESERIES", "false").lower() == "true"
+HISTORY_PAGE_DEFAULT = 50
+HISTORY_PAGE_MAX = 200
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def ensure_history_collection(db, name: str = "history"):
+    """Creates the history collection and its indexes if missing."""
+    retention = HISTORY_RETENTION_DAYS * 86400
+    if HISTORY_TIMESERIES and name not in db.list_collection_names():
+        options = {"timeseries": {"timeField": "ts", "metaField": "username", "granularity": "seconds"}}
+        if retention:
+            options["expireAfterSeconds"] = retention
+        try:
+            db.create_collection(name, **options)
+            logger.info("🕒 Created time-series history collection")
+        except (CollectionInvalid, OperationFailure) as e:
+            logger.warning(f"⚠️ Time-series history unavailable ({e}), using a regular collection")
+
+    collection = db[name]
+    collection.create_index([("username", ASCENDING), ("ts", DESCENDING), ("_id", DESCENDING)], name="username_ts")
+    if retention and not HISTORY_TIMESERIES:
+        try:
+            collection.create_index("ts", name="ts_ttl", expireAfterSeconds=retention)
+        except OperationFailure as e:
+            # Retention changed since the index was created: update it in place.
+            logger.info(f"ℹ️ Updating history TTL to {HISTORY_RETENTION_DAYS} days ({e})")
+            db.command("collMod", name, index={"name": "ts_ttl", "expireAfterSeconds": retention})
+    return collection
+
+
+def history_entry(username: str, command: dict) -> dict:
+    ts = command.get("timestamp")
+    try:
+        ts = datetime.datetime.fromisoformat(ts) if isinstance(ts, str) else ts
+    except ValueError:
+        ts = None
+    return {
+        "username": username,
+        "ts": ts or datetime.datetime.utcnow(),
+        "command": {k: v for k, v in command.items() if k != "_id"},
+    }
+
+
+def record_history(collection, username: str, command: dict):
+    """Appends one command to the user's history."""
+    collection.insert_one(history_entry(username, command))
+
+
+def _encode_cursor(doc) -> str:
+    raw = f"{doc['ts'].isoformat()}|{doc['_id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_cursor(cursor: str):
+    try:
+        ts, oid = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.datetime.fromisoformat(ts), ObjectId(oid)
+    except Exception:
+        raise InvalidCursor("Invalid history cursor")
+
+
+def history_page(collection, username: str, limit: int = HISTORY_PAGE_DEFAULT, cursor: str = None):
+    """
+    Newest-first page of a user's history. Returns (items, next_cursor);
+    next_cursor is None on the last page.
+    """
+    limit = max(1, min(limit, HISTORY_PAGE_MAX))
+    query = {"username": username}
+    if cursor:
+        ts, oid = _decode_cursor(cursor)
+        query["$or"] = [{"ts": {"$lt": ts}}, {"ts": ts, "_id": {"$lt": oid}}]
+
+    docs = list(
+        collection.find(query)
+        .sort([("ts", DESCENDING), ("_id", DESCENDING)])
+        .limit(limit + 1)
+    )
+    next_cursor = _encode_cursor(docs[limit - 1]) if len(docs) > limit else None
+    items = [{**doc["command"], "recorded_at": doc["ts"].isoformat()} for doc in docs[:limit]]
+    return items, next_cursor
@@ -0,0 +1,147 @@
+import datetime
+import hashlib
+import json
+import logging
+import os
+import time
+
+from pymongo import ASCENDING
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+# idempotency.py
+#
+# Idempotency-Key support for the endpoints that move stock. The first
+# request with a key claims it (a "processing" document with a short
+# lease); when it succeeds its response is stored for
+# IDEMPOTENCY_TTL_SECONDS, and any retry with the same key gets that
+# response back instead of running again. A failed request releases the
+# key - nothing was applied (stock.run_grouped rolls failed updates back),
+# so the retry simply runs.
+#
+# A retry that arrives while the first request is still running gets a
+# 409; a key reused for a different request (other user, endpoint or
+# body) gets a 422. A claim whose lease ran out (the process died
+# mid-request) can be taken over. Documents expire through a TTL index
+# on expires_at.
+#
+# Storing the response is retried (IDEMPOTENCY_COMPLETE_ATTEMPTS): a claim
+# left "processing" after stock moved would let a retry take it over once
+# the lease ran out and apply the request a second time.
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+IDEMPOTENCY_LEASE_SECONDS = int(os.getenv("IDEMPOTENCY_LEASE_SECONDS", "120"))
+IDEMPOTENCY_COMPLETE_ATTEMPTS = int(os.getenv("IDEMPOTENCY_COMPLETE_ATTEMPTS", "5"))
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+
+class IdempotencyConflict(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def ensure_idempotency_collection(collection):
+    collection.create_index([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0)
+
+
+def request_fingerprint(*parts) -> str:
+    """Stable hash of a request's identifying parts (JSON-serialisable, or bytes digests)."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def validate_key(key: str):
+    if not key or len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise IdempotencyConflict(400, f"Idempotency-Key must be 1-{IDEMPOTENCY_KEY_MAX_LENGTH} characters")
+
+
+class IdempotencyStore:
+    def __init__(self, collection, ttl_seconds: int = IDEMPOTENCY_TTL_SECONDS,
+                 lease_seconds: int = IDEMPOTENCY_LEASE_SECONDS):
+        self.collection = collection
+        self.ttl = datetime.timedelta(seconds=ttl_seconds)
+        self.lease = datetime.timedelta(seconds=lease_seconds)
+        self.counters = {"claims": 0, "replays": 0, "conflicts": 0, "takeovers": 0}
+
+    def claim(self, scope: str, key: str, fingerprint: str):
+        """
+        Returns None when the caller now owns the key and should run the
+        request, or the stored (status_code, body) to replay.
+        Raises IdempotencyConflict.
+        """
+        validate_key(key)
+        doc_id = f"{scope}:{key}"
+        for _ in range(2):
+            now = datetime.datetime.utcnow()
+            try:
+                self.collection.insert_one({
+                    "_id": doc_id,
+                    "fingerprint": fingerprint,
+                    "state": "processing",
+                    "locked_until": now + self.lease,
+                    "expires_at": now + self.ttl,
+                })
+                self.counters["claims"] += 1
+                return None
+            except DuplicateKeyError:
+                pass
+
+            existing = self.collection.find_one({"_id": doc_id})
+            if existing is None:
+                continue  # released or expired in between
+            if existing["expires_at"] <= now:
+                # Expired, the TTL monitor just hasn't reaped it yet.
+                self.collection.delete_one({"_id": doc_id, "expires_at": existing["expires_at"]})
+                continue
+            if existing["fingerprint"] != fingerprint:
+                self.counters["conflicts"] += 1
+                raise IdempotencyConflict(422, "Idempotency-Key was already used for a different request")
+            if existing["state"] == "completed":
+                self.counters["replays"] += 1
+                logger.info(f"🔁 Replaying stored response for idempotency key {key!r}")
+                return existing["status_code"], existing["response"]
+
+            taken = self.collection.find_one_and_update(
+                {"_id": doc_id, "state": "processing", "locked_until": {"$lt": now}},
+                {"$set": {"locked_until": now + self.lease}},
+            )
+            if taken is not None:
+                self.counters["takeovers"] += 1
+                logger.warning(f"⚠️ Took over stale idempotency key {key!r}")
+                return None
+            self.counters["conflicts"] += 1
+            raise IdempotencyConflict(409, "A request with this Idempotency-Key is still being processed")
+        raise IdempotencyConflict(409, "A request with this Idempotency-Key is still being processed")
+
+    def complete(self, scope: str, key: str, status_code: int, body: dict,
+                 attempts: int = IDEMPOTENCY_COMPLETE_ATTEMPTS):
+        """Stores the response for replay, retrying with backoff: the update is idempotent."""
+        for attempt in range(1, attempts + 1):
+            try:
+                self.collection.update_one(
+                    {"_id": f"{scope}:{key}"},
+                    {
+                        "$set": {
+                            "state": "completed",
+                            "status_code": status_code,
+                            "response": body,
+                            "expires_at": datetime.datetime.utcnow() + self.ttl,
+                        },
+                        "$unset": {"locked_until": ""},
+                    },
+                )
+                return
+            except PyMongoError as e:
+                if attempt == attempts:
+                    logger.error(f"❌ Could not store the response for idempotency key {key!r}: {e}")
+                    raise
+                logger.warning(f"🔁 Storing idempotent response failed ({e!r}), retrying")
+                time.sleep(min(0.1 * 2 ** (attempt - 1), 2))
+
+    def release(self, scope: str, key: str):
+        self.collection.delete_one({"_id": f"{scope}:{key}", "state": "processing"})
+
+    def stats(self) -> dict:
+        return dict(self.counters)
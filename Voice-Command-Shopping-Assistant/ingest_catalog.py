@@ -0,0 +1,247 @@
+"""
+Loads or refreshes the store catalog from a CSV or JSONL file.
+
+    python ingest_catalog.py catalog.csv [--key name|sku] [--prune] [--skip-index] [--dry-run]
+
+Columns / fields: product, category, price, and optionally quantity and
+sku (.gz files are read transparently). Rows are streamed, so memory does
+not grow with the file, and written as unordered bulk upserts keyed on the
+normalized product name (or on sku with --key sku).
+
+Each stored product remembers a hash of the row it came from; a row whose
+hash is unchanged is not rewritten, so re-running an unchanged file costs
+one indexed lookup per batch and no writes. A changed row is $set as a
+whole - including quantity, which replaces the live stock level; leave the
+column out to keep stock as it is.
+
+Afterwards the FAISS snapshot (and its catalog checksum) is brought up to
+date in the same run: only products whose name changed are re-encoded,
+STORE_INDEX_ENCODE_BATCH at a time, through the shared embedding disk
+cache - so a running API picking up the same changes gets cache hits.
+--prune deletes store products that are not in the file.
+
+Stock reservations and the catalog resolver find products by normalized
+name, so --key sku refuses to write anything when two SKUs (in the file,
+or one in the file and one already stored) share a product name.
+"""
+import argparse
+import csv
+import gzip
+import hashlib
+import io
+import json
+import logging
+import time
+
+from pymongo import ASCENDING, UpdateOne
+
+from helper_function import normalize_product_name
+from store_listing import stamp_modified
+
+logger = logging.getLogger(__name__)
+
+INGEST_FIELDS = ("product", "category", "price", "quantity", "sku")
+KEY_FIELDS = {"name": "name_key", "sku": "sku"}
+
+
+class InvalidRow(ValueError):
+    pass
+
+
+def _open(path: str):
+    raw = gzip.open(path, "rb") if path.endswith(".gz") else open(path, "rb")
+    return io.TextIOWrapper(raw, encoding="utf-8", newline="")
+
+
+def read_rows(path: str, fmt: str = None):
+    """Yields raw row dicts from a CSV or JSONL file, one at a time."""
+    name = path[:-3] if path.endswith(".gz") else path
+    fmt = fmt or ("jsonl" if name.endswith((".jsonl", ".ndjson", ".json")) else "csv")
+    with _open(path) as f:
+        if fmt == "csv":
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def clean_row(raw: dict) -> dict:
+    """Normalizes one input row to the stored fields; raises InvalidRow."""
+    product = str(raw.get("product") or "").strip()
+    if not product:
+        raise InvalidRow("missing product")
+    row = {"product": product, "category": str(raw.get("category") or "").strip().lower() or "other"}
+    try:
+        price = float(raw.get("price") or 0)
+        row["price"] = int(price) if price.is_integer() else price
+        if raw.get("quantity") not in (None, ""):
+            row["quantity"] = int(float(raw["quantity"]))
+    except (TypeError, ValueError):
+        raise InvalidRow(f"bad price / quantity for {product!r}")
+    if raw.get("sku") not in (None, ""):
+        row["sku"] = str(raw["sku"]).strip()
+    row["name_key"] = normalize_product_name(product)
+    return row
+
+
+def row_hash(row: dict) -> str:
+    payload = json.dumps([row.get(field) for field in INGEST_FIELDS], default=str)
+    return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+
+
+def ensure_key_index(collection, key: str):
+    if key == "sku":
+        collection.create_index([("sku", ASCENDING)], name="sku", sparse=True)
+    else:
+        collection.create_index([("name_key", ASCENDING)], name="name_key")
+
+
+def _write_batch(collection, key_field: str, batch: dict, counters: dict, dry_run: bool):
+    """Upserts the rows of one batch ({key: row}) whose hash changed."""
+    existing = {
+        doc[key_field]: doc.get("ingest_hash")
+        for doc in collection.find({key_field: {"$in": list(batch)}}, {key_field: 1, "ingest_hash": 1})
+    }
+    operations = []
+    for key, row in batch.items():
+        digest = row_hash(row)
+        if existing.get(key, None) == digest:
+            counters["unchanged"] += 1
+            continue
+        if key in existing:
+            counters["updated"] += 1
+        else:
+            counters["inserted"] += 1
+        update = stamp_modified({"$set": {**row, "ingest_hash": digest}})
+        if "quantity" not in row:
+            update["$setOnInsert"] = {"quantity": 0}
+        operations.append(UpdateOne({key_field: key}, update, upsert=True))
+    if operations and not dry_run:
+        collection.bulk_write(operations, ordered=False)
+
+
+def ingest(rows, collection, key: str = "name", batch_size: int = 1000, dry_run: bool = False, seen=None):
+    """
+    Upserts an iterable of raw rows into `collection`. Returns counters;
+    `seen`, if given, collects every key in the input (for pruning).
+    """
+    key_field = KEY_FIELDS[key]
+    counters = {"rows": 0, "invalid": 0, "inserted": 0, "updated": 0, "unchanged": 0}
+    batch = {}
+    for raw in rows:
+        counters["rows"] += 1
+        try:
+            row = clean_row(raw)
+        except InvalidRow as e:
+            counters["invalid"] += 1
+            if counters["invalid"] <= 10:
+                logger.warning(f"⚠️ Skipping row {counters['rows']}: {e}")
+            continue
+        if key_field not in row:
+            counters["invalid"] += 1
+            continue
+        # Later rows win, as they would in sequential writes.
+        batch[row[key_field]] = row
+        if seen is not None:
+            seen.add(row[key_field])
+        if len(batch) >= batch_size:
+            _write_batch(collection, key_field, batch, counters, dry_run)
+            batch = {}
+    if batch:
+        _write_batch(collection, key_field, batch, counters, dry_run)
+    return counters
+
+
+def name_collisions(rows, collection, batch_size: int = 1000) -> dict:
+    """
+    For --key sku: {name_key: SKUs} for every normalized name that more
+    than one SKU would end up with, in the file or against the store.
+    """
+    skus = {}
+    for raw in rows:
+        try:
+            row = clean_row(raw)
+        except InvalidRow:
+            continue
+        if "sku" in row:
+            skus.setdefault(row["name_key"], set()).add(row["sku"])
+    names = list(skus)
+    for start in range(0, len(names), batch_size):
+        for doc in collection.find({"name_key": {"$in": names[start:start + batch_size]}}, {"name_key": 1, "sku": 1}):
+            skus[doc["name_key"]].add(doc.get("sku"))
+    return {name: found for name, found in skus.items() if len(found) > 1}
+
+
+def prune(collection, key: str, seen: set, batch_size: int = 1000, dry_run: bool = False) -> int:
+    """Deletes products whose key is not in `seen`."""
+    key_field = KEY_FIELDS[key]
+    stale = [doc["_id"] for doc in collection.find({}, {key_field: 1}) if doc.get(key_field) not in seen]
+    if not dry_run:
+        for start in range(0, len(stale), batch_size):
+            collection.delete_many({"_id": {"$in": stale[start:start + batch_size]}})
+    return len(stale)
+
+
+def refresh_index(collection):
+    """Loads the FAISS snapshot, re-encodes what changed and saves it; returns the StoreIndex."""
+    from embedding_cache import EmbeddingCache
+    from embedding_service import EMBEDDING_MODEL, EmbeddingService
+    from store_index import StoreIndex
+
+    # In-process model (no worker pool): batches are already large.
+    service = EmbeddingService(EMBEDDING_MODEL, workers=0)
+    cache = EmbeddingCache(EMBEDDING_MODEL, service.encode)
+    store_index = StoreIndex(collection, cache.encode, EMBEDDING_MODEL)
+    store_index.load_or_build()
+    return store_index, cache.stats()
+
+
+def main(args):
+    from db import store_collection
+
+    ensure_key_index(store_collection, args.key)
+    if args.key == "sku":
+        collisions = name_collisions(read_rows(args.path, args.format), store_collection, args.batch)
+        if collisions:
+            for name, skus in list(collisions.items())[:10]:
+                print(f"❌ {name!r} is used by SKUs {sorted(map(str, skus))}")
+            raise SystemExit(f"{len(collisions)} product names map to more than one SKU; "
+                             f"rename them so stock and the resolver can tell them apart")
+    start = time.perf_counter()
+    seen = set() if args.prune else None
+    counters = ingest(read_rows(args.path, args.format), store_collection, args.key,
+                      args.batch, args.dry_run, seen)
+    if args.prune:
+        counters["pruned"] = prune(store_collection, args.key, seen, args.batch, args.dry_run)
+    elapsed = time.perf_counter() - start
+    changed = counters["inserted"] + counters["updated"] + counters.get("pruned", 0)
+
+    prefix = "[dry-run] " if args.dry_run else ""
+    print(f"{prefix}✅ {counters['rows']} rows in {elapsed:.1f}s ({counters['rows'] / max(elapsed, 1e-9):,.0f} rows/s): "
+          f"{counters['inserted']} inserted, {counters['updated']} updated, {counters['unchanged']} unchanged, "
+          f"{counters['invalid']} invalid" + (f", {counters['pruned']} pruned" if args.prune else ""))
+
+    if args.dry_run or args.skip_index:
+        return
+    if not changed and not args.reindex:
+        print("ℹ️ Catalog unchanged, store index left as is (--reindex to force)")
+        return
+    index_start = time.perf_counter()
+    store_index, cache_stats = refresh_index(store_collection)
+    print(f"✅ Store index: {store_index.stats()['vectors']} vectors, checksum {store_index.checksum[:12]}, "
+          f"{cache_stats['misses']} encoded, {time.perf_counter() - index_start:.1f}s")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=("csv", "jsonl"), help="default: from the file extension")
+    parser.add_argument("--key", choices=tuple(KEY_FIELDS), default="name", help="upsert key")
+    parser.add_argument("--batch", type=int, default=1000, help="rows per bulk_write")
+    parser.add_argument("--prune", action="store_true", help="delete products missing from the file")
+    parser.add_argument("--skip-index", action="store_true", help="only write MongoDB")
+    parser.add_argument("--reindex", action="store_true", help="refresh the index even if nothing changed")
+    parser.add_argument("--dry-run", action="store_true")
+    main(parser.parse_args())
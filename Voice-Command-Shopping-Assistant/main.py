@@ -1,43 +1,46 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
-import assemblyai as aai
-import tempfile
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request, Response, WebSocket
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+import asyncio
 import os
+import threading
+import time
+from concurrent.futures import Future
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
-import json
-import requests
 import logging
-from helper_function import validate_llm_response, find_closest_product
+from typing import List, Optional
+from helper_function import validate_llm_response, find_closest_product, normalize_product_name
+from upstream import close_upstreams
+from audio_intake import receive_audio, audio_digest, AudioRejected
+from transcription import create_backend, TranscriptionError, TRANSCRIPTION_BACKEND
+from voice_stream import run_voice_stream
+from groq_client import process_command, groq_stats
+from metrics import MetricsMiddleware, register_stats, render_metrics, timed
+from resilience import DeadlineMiddleware, UpstreamUnavailable, DeadlineExceeded, db_cleanup, db_deadline
+from command_parser import LocalCommandParser, FALLBACK_MIN_CONFIDENCE
+from parse_cache import ParseCache
+from catalog_resolver import CatalogResolver, EXACT_TIERS, ensure_name_keys
+from history import ensure_history_collection, record_history, history_page, InvalidCursor, HISTORY_PAGE_DEFAULT
+from recommendations import RecommendationCache, recommend, wishlist_query_vector
+from wishlist import add_item, remove_item, wishlist_products, ensure_user_indexes
+from stock import reserve, release, run_grouped, InsufficientStock, ProductNotFound
+from idempotency import IdempotencyStore, IdempotencyConflict, ensure_idempotency_collection, request_fingerprint
 import datetime
-from db import user_collection, store_collection, client
-from sentence_transformers import SentenceTransformer
-import faiss
-from rapidfuzz import fuzz, process
+from db import user_collection, store_collection, history_collection, idempotency_collection, client, db as database
+from store_index import StoreIndex
+from store_listing import (
+    catalog_etag, etag_matches, ensure_store_indexes, projection_for, store_query, store_page, iter_store_ndjson,
+    InvalidStoreQuery, STORE_PAGE_DEFAULT,
+)
+from embedding_cache import EmbeddingCache
+from embedding_service import EmbeddingService, EmbeddingQueueFull, EMBEDDING_MODEL
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# =================== ML EMBEDDINGS ===================
-embedder = SentenceTransformer("all-MiniLM-L6-v2")
-
-def build_store_index():
-    store_products = list(store_collection.find({}, {"_id": 0, "product": 1, "category": 1, "price": 1}))
-    if not store_products:
-        return None, []
-
-    product_texts = [p["product"] for p in store_products]
-    vectors = embedder.encode(product_texts, convert_to_numpy=True)
-
-    dim = vectors.shape[1]
-    index = faiss.IndexFlatL2(dim)
-    index.add(vectors)
-
-    return index, store_products
-
-faiss_index, store_products = build_store_index()
-
-
 # ======================= ENVIRONMENT VARIABLES ======================
 load_dotenv()
 
@@ -48,7 +51,7 @@ if not GROQ_API_KEY:
     raise ValueError("GROQ_API_KEY environment variable is required")
 
 ASSEMBLYAI_API_KEY = os.getenv("ASSEMBLYAI_API_KEY")
-if not ASSEMBLYAI_API_KEY:
+if not ASSEMBLYAI_API_KEY and TRANSCRIPTION_BACKEND == "assemblyai":
     logger.error("ASSEMBLYAI_API_KEY environment variable is not set!")
     raise ValueError("ASSEMBLYAI_API_KEY environment variable is required")
 
@@ -57,71 +60,59 @@ if not MONGO_URI:
     logger.error("MONGO_URI environment variable is not set!")
     raise ValueError("MONGO_URI environment variable is required")
 
-GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
-def process_command(user_text: str):
-    """
-    Takes a shopping voice command as text and returns structured JSON
-    with product, quantity, category, action, status.
-    """
 
-    prompt = f"""
-You are AI working as a store assistant. 
-Parse the following user command into a JSON object with these exact fields:
-If u  find the command irrelevent and found no information from that so just put a error message in all the key of json
+# =================== ML EMBEDDINGS ===================
+# Model instances live in the embedding service's worker processes;
+# concurrent small requests are micro-batched into one encode() call.
+# Started by warm_up() (see WARM-UP below), not at import.
+embedding_service = EmbeddingService(EMBEDDING_MODEL)
 
+# Every embedding goes through the content-addressed cache, so catalog
+# products and repeated wishlists are only ever encoded once per node.
+embedding_cache = EmbeddingCache(EMBEDDING_MODEL, embedding_service.encode)
 
-- product: name of the item (string)
-- quantity: number (default = 1 if not mentioned)
-- category: guess item category (e.g., dairy, fruit, drinks, snacks, grains)
-- action: one of ["add", "remove", "delete"]
-- status: always "ai_generated"
 
-User command: "{user_text}"
+def encode_texts(texts):
+    return embedding_cache.encode(texts)
 
-Return only valid JSON, no explanation.
-"""
 
-    try:
-        response = requests.post(
-            GROQ_API_URL,
-            headers={
-                "Authorization": f"Bearer {GROQ_API_KEY}",
-                "Content-Type": "application/json",
-            },
-            json={
-                "model": "llama-3.3-70b-versatile",  # ✅ Groq recommended model
-                "messages": [
-                    {"role": "user", "content": prompt}
-                ],
-                "temperature": 0.2
-            }
-        )
+# Persistent FAISS index: loads the on-disk snapshot and re-encodes only
+# products that changed since it was written (in warm_up()).
+store_index = StoreIndex(store_collection, encode_texts, EMBEDDING_MODEL)
 
-        result = response.json()
+# Rule-based parser for common commands; the LLM only sees what it can't
+# parse confidently.
+command_parser = LocalCommandParser(store_index.catalog)
 
-        if "choices" not in result or not result["choices"]:
-            return {"error": "Unexpected response from Groq", "raw": result}
 
-        content = result["choices"][0]["message"]["content"].strip()
 
-        # Extract JSON portion only
-        json_start = content.find("{")
-        json_end = content.rfind("}") + 1
-        if json_start != -1 and json_end != -1:
-            return json.loads(content[json_start:json_end])
+def nearest_store_product(name: str):
+    """(cosine similarity, product name) of the semantically closest product."""
+    distances, products = store_index.search(encode_texts([name]), k=1)
+    if not products:
+        return None
+    # MiniLM vectors are unit-length, so squared L2 = 2 - 2·cos.
+    return 1 - distances[0] / 2, products[0]["product"]
 
-        return {"error": "Could not parse JSON", "raw": content}
 
-    except Exception as e:
-        return {"error": str(e)}
-    
+# Resolves parsed product names to canonical store items in memory.
+catalog_resolver = CatalogResolver(store_index.catalog, store_collection, nearest_store_product)
 
+# Per-user recommendations, dropped whenever that user's wishlist changes.
+recommendation_cache = RecommendationCache()
 
-# ======================= ASSEMBLY AI ===================
-aai.settings.api_key = ASSEMBLYAI_API_KEY
+# LLM results keyed by normalized transcript; identical concurrent commands
+# share one Groq call.
+parse_cache = ParseCache()
 
+# Stored responses for retried Idempotency-Key requests.
+idempotency_store = IdempotencyStore(idempotency_collection)
 
 
+# ======================= TRANSCRIPTION ===================
+# AssemblyAI or the local CPU engine, per TRANSCRIPTION_BACKEND; the SDK /
+# model is loaded by transcriber.start() in warm_up()
+transcriber = create_backend()
 
 
 # ======================= DATABASE INITIALIZATION ===================
@@ -138,6 +129,21 @@ def initialize_database():
         
         if store_count == 0:
             logger.warning("⚠️ Store collection is empty. Please run seed_store.py to populate the store.")
+
+        # Normalized-name index for catalog lookups
+        ensure_name_keys(store_collection)
+
+        # One user document per username (wishlist upserts rely on it)
+        ensure_user_indexes(user_collection)
+
+        # Append-only command history (indexes + retention)
+        ensure_history_collection(database)
+
+        # Filtered / paginated /store listings
+        ensure_store_indexes(store_collection)
+
+        # Idempotency keys expire on their own (TTL index)
+        ensure_idempotency_collection(idempotency_collection)
         
         # Check if user collection exists
         user_count = user_collection.count_documents({})
@@ -160,6 +166,74 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-request time budget shared by the ASR, LLM and DB stages
+app.add_middleware(DeadlineMiddleware)
+
+# Outermost: per-route latency and the Server-Timing header
+app.add_middleware(MetricsMiddleware)
+
+
+@app.exception_handler(UpstreamUnavailable)
+async def upstream_unavailable_handler(request: Request, exc: UpstreamUnavailable):
+    status_code = 504 if isinstance(exc, DeadlineExceeded) else 503
+    logger.error(f"⏱️ {request.url.path} failed fast: {exc}")
+    return JSONResponse({"detail": str(exc)}, status_code=status_code)
+
+
+# ======================= WARM-UP ===================
+# The FAISS index, the transcription engine and then the embedding model
+# load in a background thread once the app has started, so /health, /store,
+# /wishlist and /history answer right away. Routes that need them wait up
+# to WARMUP_WAIT_SECONDS for warm-up, then answer 503 with Retry-After.
+WARMUP_WAIT_SECONDS = float(os.getenv("WARMUP_WAIT_SECONDS", "20"))
+
+# Resolves once everything is loaded (or with the error that stopped it)
+warmup = Future()
+warmup_state = {"state": "pending", "seconds": None, "error": None}
+
+
+def warm_up():
+    start = time.perf_counter()
+    warmup_state["state"] = "loading"
+    try:
+        embedding_service.start()
+        store_index.load_or_build()
+        store_index.start_updater()
+        transcriber.start()
+    except Exception as e:
+        logger.error(f"❌ Warm-up failed: {e}")
+        warmup_state.update(state="failed", error=str(e))
+        warmup.set_exception(e)
+        return
+    warmup_state.update(state="ready", seconds=round(time.perf_counter() - start, 3))
+    logger.info(f"🔥 Store index and transcription ready after {warmup_state['seconds']}s")
+    warmup.set_result(True)
+
+    # A current snapshot needs no encoding, so the embedding model may not be
+    # loaded yet: load it now rather than in the first request that needs it.
+    try:
+        embedding_service.encode(["warm up"], timeout=None)
+    except Exception as e:
+        logger.warning(f"⚠️ Embedding model preload failed: {e}")
+
+
+async def models_ready() -> bool:
+    """True once warm-up succeeded, waiting up to WARMUP_WAIT_SECONDS for it."""
+    if not warmup.done():
+        try:
+            await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(warmup)), WARMUP_WAIT_SECONDS)
+        except Exception:
+            pass  # timed out, or failed: checked below
+    return warmup.done() and warmup.exception() is None
+
+
+async def require_models():
+    """Dependency for routes that use the store index, the embedder or the ASR engine."""
+    if not await models_ready():
+        detail = f"Warm-up failed: {warmup_state['error']}" if warmup_state["state"] == "failed" else "Models are still loading"
+        raise HTTPException(status_code=503, detail=detail, headers={"Retry-After": "5"})
+
+
 # Initialize database on startup
 @app.on_event("startup")
 async def startup_event():
@@ -167,23 +241,57 @@ async def startup_event():
     if not initialize_database():
         logger.error("❌ Failed to initialize database. Please check your MongoDB connection.")
         raise Exception("Database initialization failed")
-    logger.info("✅ API startup completed successfully")
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    logger.info("✅ API startup completed successfully (models warming up in the background)")
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    store_index.stop_updater()
+    transcriber.stop()
+    embedding_service.stop()
+    await close_upstreams()
+    logger.info("👋 Upstream connections closed")
+
+
+# Component counters, reported by /health and exported on /metrics
+COMPONENT_STATS = {
+    "embedding_cache": embedding_cache.stats,
+    "embedding_service": embedding_service.stats,
+    "command_fast_path": command_parser.stats,
+    "parse_cache": parse_cache.stats,
+    "catalog_resolver": catalog_resolver.stats,
+    "recommendation_cache": recommendation_cache.stats,
+    "store_index": store_index.stats,
+    "transcription": transcriber.stats,
+    "groq": groq_stats,
+    "idempotency": idempotency_store.stats,
+}
+for _name, _stats in COMPONENT_STATS.items():
+    register_stats(_name, _stats)
+
+
+def _health_snapshot():
+    client.admin.command('ping')
+    return store_collection.count_documents({}), user_collection.count_documents({})
 
 
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
     try:
-        # Test database connection
-        client.admin.command('ping')
-        store_count = store_collection.count_documents({})
-        user_count = user_collection.count_documents({})
-        
+        # Test database connection (off the event loop, pymongo is blocking)
+        store_count, user_count = await run_in_threadpool(_health_snapshot)
+        if warmup_state["state"] == "failed":
+            raise RuntimeError(f"warm-up failed: {warmup_state['error']}")
+
         return {
-            "status": "healthy",
+            "status": "healthy" if warmup.done() else "warming_up",
             "database": "connected",
+            "warm_up": warmup_state,
             "store_items": store_count,
             "users": user_count,
+            **{name: stats() for name, stats in COMPONENT_STATS.items()},
             "timestamp": datetime.datetime.utcnow().isoformat()
         }
     except Exception as e:
@@ -191,50 +299,66 @@ async def health_check():
         raise HTTPException(status_code=503, detail=f"Service unhealthy: {str(e)}")
 
 
-@app.post("/recognise_text_to_llm")
-async def recognise_text_to_llm(file: UploadFile = File(...)):
+@app.get("/metrics")
+def metrics_endpoint():
+    """Prometheus scrape target: request/stage latency histograms, upstream outcomes, component stats."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+async def interpret_transcript(text: str):
+    """Local fast path first, LLM when unsure. None if the result isn't a valid command."""
+    with timed("parse"):
+        llm_response = command_parser.parse(text)
+    if llm_response is not None:
+        logger.info(f"⚡ Fast-path parse: {llm_response}")
+    else:
+        try:
+            with timed("llm"):
+                llm_response = await parse_cache.get_or_parse(text, process_command)
+            logger.info(f"🤖 LLM response: {llm_response}")
+        except UpstreamUnavailable as e:
+            # LLM down or out of time: an exact catalog match from the local
+            # parser beats an error; anything fuzzier is left to fail (503 / 504)
+            fallback, confidence = command_parser.analyse(text)
+            if fallback is None or confidence < FALLBACK_MIN_CONFIDENCE:
+                raise
+            logger.warning(f"🛟 LLM unavailable ({e}), using local parse (confidence {confidence:.2f})")
+            llm_response = {**fallback, "source": "local_fallback"}
+    return llm_response if validate_llm_response(llm_response) else None
+
+
+@app.post("/recognise_text_to_llm", dependencies=[Depends(require_models)])
+async def recognise_text_to_llm(request: Request):
+    """
+    Accepts the recording either as the raw request body (audio/* content
+    type) or as the `file` part of a multipart form.
+    """
     try:
         logger.info("🎤 Voice recognition request initiated")
-        
-        # Validate file
-        if not file.filename:
-            raise HTTPException(status_code=400, detail="No file provided")
-        
-        if not file.filename.lower().endswith(('.webm', '.wav', '.mp3', '.m4a')):
-            raise HTTPException(status_code=400, detail="Unsupported audio format. Please use .webm, .wav, .mp3, or .m4a")
-        
-        # Save audio temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".webm") as temp_file:
-            content = await file.read()
-            if len(content) == 0:
-                raise HTTPException(status_code=400, detail="Empty audio file")
-            
-            temp_file.write(content)
-            temp_path = temp_file.name
-            logger.info(f"📁 Audio file saved temporarily: {temp_path}")
 
+        # Stream the upload into a spooled buffer (size-capped, format sniffed)
         try:
-            # AssemblyAI transcription (English only)
-            transcriber = aai.Transcriber()
-            transcript = transcriber.transcribe(
-                temp_path,
-                config=aai.TranscriptionConfig(language_code="en")
-            )
+            with timed("upload"):
+                audio = await receive_audio(request)
+        except AudioRejected as e:
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
 
-            if transcript.status == aai.TranscriptStatus.error:
-                logger.error(f"❌ Transcription failed: {transcript.error}")
-                raise HTTPException(status_code=500, detail=f"Transcription failed: {transcript.error}")
+        try:
+            # Transcription (English only), off the event loop
+            try:
+                with timed("asr"):
+                    text = await transcriber.transcribe(audio)
+            except TranscriptionError as e:
+                logger.error(f"❌ Transcription failed: {e}")
+                raise HTTPException(status_code=500, detail=f"Transcription failed: {e}")
 
-            logger.info(f"📝 Transcribed text: {transcript.text}")
+            logger.info(f"📝 Transcribed text: {text}")
             
-            # Process command with LLM
-            llm_response = process_command(transcript.text)
-            logger.info(f"🤖 LLM response: {llm_response}")
-            
-            if validate_llm_response(llm_response):
+            llm_response = await interpret_transcript(text)
+            if llm_response is not None:
                 logger.info("✅ Voice command processed successfully")
                 return {
-                    "recognized_text": transcript.text,
+                    "recognized_text": text,
                     "llm_response": llm_response
                 }
             else:
@@ -242,14 +366,10 @@ async def recognise_text_to_llm(file: UploadFile = File(...)):
                 raise HTTPException(status_code=400, detail="Invalid AI response format")
 
         finally:
-            # Clean up temporary file
-            try:
-                os.unlink(temp_path)
-                logger.info(f"🗑️ Temporary file cleaned up: {temp_path}")
-            except Exception as e:
-                logger.warning(f"⚠️ Failed to clean up temporary file: {e}")
+            # Releases the in-memory buffer (or its spill file)
+            audio.file.close()
 
-    except HTTPException:
+    except (HTTPException, UpstreamUnavailable):
         raise
     except Exception as e:
         logger.error(f"❌ Voice recognition failed: {str(e)}")
@@ -258,6 +378,29 @@ async def recognise_text_to_llm(file: UploadFile = File(...)):
 
 
 
+@app.websocket("/ws/recognise_text_to_llm")
+async def recognise_text_stream(websocket: WebSocket):
+    """
+    Streaming variant: PCM16 frames in, partial transcripts and then the
+    parsed command out (protocol in voice_stream.py).
+    """
+    logger.info("🎤 Streaming voice recognition session opened")
+    if not await models_ready():
+        await websocket.accept()
+        await websocket.send_json({"type": "error", "detail": "Models are still loading"})
+        await websocket.close(code=1013)  # try again later
+        return
+    await run_voice_stream(websocket, transcriber, interpret_transcript)
+
+
+def log_command(username: str, llm_response: dict):
+    """Appends a command to the history store; never fails the command itself."""
+    try:
+        record_history(history_collection, username, llm_response)
+    except Exception as e:
+        logger.warning(f"⚠️ Failed to record history for {username}: {str(e)}")
+
+
 def update_wishlist(username: str, llm_response: dict):
     try:
         logger.info(f"🔄 Updating wishlist for user: {username}")
@@ -273,94 +416,122 @@ def update_wishlist(username: str, llm_response: dict):
 
         # ======================= ADD =======================
         if action == "add":
-            # 🔎 Step 1: Check product in store
-            store_item = store_collection.find_one(
-                {"product": {"$regex": f"^{llm_response['product']}$", "$options": "i"}}
-            )
-
-            if not store_item:
+            # 🔎 Step 1: Resolve the product against the catalog
+            match = catalog_resolver.resolve(llm_response["product"])
+            if not match:
                 logger.error(f"❌ Product not found in store: {llm_response['product']}")
                 return {"error": f"No item '{llm_response['product']}' found in store"}
 
-            logger.info(f"🏪 Found store item: {store_item}")
-            store_quantity = store_item.get("quantity", 0)
+            logger.info(f"🧭 Resolved '{llm_response['product']}' → '{match.item['product']}' ({match.tier}, {match.confidence})")
             requested_quantity = int(llm_response.get("quantity", 1))
+            reserved = {}
+
+            def add_operation(session):
+                # 🔒 Step 2: Reserve stock - the conditional decrement is the stock check
+                store_item = reserve(store_collection, match.item["name_key"], requested_quantity, session)
+                reserved["item"] = store_item
+
+                # ✅ Step 3: Add to wishlist (one entry per product, quantities summed)
+                add_item(user_collection, username, {
+                    "product": store_item["product"],  # consistent name
+                    "name_key": store_item["name_key"],  # what stock is released by
+                    "quantity": requested_quantity,
+                    "category": store_item.get("category", llm_response["category"]),
+                    "action": "add",
+                    "status": llm_response["status"],
+                    "timestamp": llm_response["timestamp"]
+                }, session=session)
+                return store_item
+
+            def undo_reservation():
+                if "item" in reserved:
+                    release(store_collection, reserved["item"]["name_key"], requested_quantity)
 
-            # 🔎 Step 2: Validate stock
-            if requested_quantity > store_quantity:
-                logger.warning(f"⚠️ Insufficient stock: requested {requested_quantity}, available {store_quantity}")
-                return {
-                    "error": f"Only {store_quantity} × {store_item['product']} available in store"
-                }
+            try:
+                store_item = run_grouped(client, add_operation, undo_reservation)
+            except ProductNotFound:
+                logger.error(f"❌ Product no longer in store: {match.item['product']}")
+                return {"error": f"No item '{llm_response['product']}' found in store"}
+            except InsufficientStock as e:
+                logger.warning(f"⚠️ Insufficient stock: requested {requested_quantity}, available {e.available}")
+                return {"error": str(e)}
 
-            # ✅ Step 3: Add to wishlist + history
-            result = user_collection.update_one(
-                {"username": username},
-                {
-                    "$push": {
-                        "wishlist": {
-                            "product": store_item["product"],  # consistent name
-                            "quantity": requested_quantity,
-                            "category": store_item.get("category", llm_response["category"]),
-                            "action": "add",
-                            "status": llm_response["status"],
-                            "timestamp": llm_response["timestamp"]
-                        },
-                        "historylist": llm_response
-                    }
-                },
-                upsert=True
-            )
-            
-            # ✅ Step 4: Update store stock by reducing quantity
-            store_update_result = store_collection.update_one(
-                {"product": store_item["product"]},
-                {"$inc": {"quantity": -requested_quantity}}
-            )
-            
-            logger.info(f"✅ Wishlist updated successfully. Modified count: {result.modified_count}")
-            logger.info(f"✅ Store stock updated. Reduced {requested_quantity} units. Modified count: {store_update_result.modified_count}")
-            
-            return {"message": "Product added to wishlist and stock updated", "data": llm_response}
+            recommendation_cache.invalidate(username)
+            log_command(username, llm_response)
+            logger.info(f"✅ Wishlist updated and {requested_quantity} × {store_item['product']} reserved. Stock left: {store_item['quantity']}")
+
+            return {
+                "message": "Product added to wishlist and stock updated",
+                "data": llm_response,
+                "match": {"product": store_item["product"], "tier": match.tier, "confidence": match.confidence},
+            }
 
         # =================== REMOVE / DELETE ==================
         elif action in ["remove", "delete"]:
-            user = user_collection.find_one({"username": username})
-            if not user or "wishlist" not in user:
-                logger.error(f"❌ No wishlist found for user: {username}")
-                return {"error": "No wishlist found"}
-
-            wishlist = user.get("wishlist", [])
-            logger.info(f"📋 Current wishlist items: {[item['product'] for item in wishlist]}")
-            
-            closest = find_closest_product(llm_response["product"], wishlist)
-
-            if not closest:
-                logger.error(f"❌ No matching product found for: {llm_response['product']}")
-                return {"error": f"No matching product found for '{llm_response['product']}'"}
+            # "remove N" / "delete N" take N units; no quantity (0) drops the whole entry
+            remove_quantity = max(int(llm_response.get("quantity") or 0), 0)
+
+            removed = {}
+
+            def remove_operation(session):
+                units = remove_item(user_collection, username, removed["product"], remove_quantity, session)
+                removed["units"] = units
+                if units:
+                    # ✅ Restore stock for exactly what left the wishlist
+                    release(store_collection, removed["name_key"], units, session)
+                return units
+
+            def restore_wishlist_item():
+                if removed.get("units"):
+                    add_item(user_collection, username, {
+                        "product": removed["product"],
+                        "name_key": removed["name_key"],
+                        "quantity": removed["units"],
+                        "category": llm_response["category"],
+                        "action": "add",
+                        "status": llm_response["status"],
+                        "timestamp": llm_response["timestamp"]
+                    })
+
+            # 🔎 Canonical store name first: no need to read the wishlist. Only an
+            # exact name picks what to delete - a fuzzy or semantic guess could
+            # be a different product the user owns ("peanut butter" → "Butter").
+            match = catalog_resolver.resolve(llm_response["product"])
+            exact = match is not None and match.tier in EXACT_TIERS
+            units = None
+            if exact:
+                removed["product"] = match.item["product"]
+                removed["name_key"] = match.item["name_key"]
+                units = run_grouped(client, remove_operation, restore_wishlist_item)
+
+            if units is None:
+                # Not a (current) catalog name: fuzzy-match against wishlist product names
+                closest = find_closest_product(llm_response["product"], wishlist_products(user_collection, username))
+                if not closest or closest["product"] == removed.get("product"):
+                    if match and not exact:
+                        logger.info(f"🤔 Remove of '{llm_response['product']}' only matched '{match.item['product']}' ({match.tier}), asking for confirmation")
+                        return {
+                            "status": "needs_confirmation",
+                            "message": f"Did you mean '{match.item['product']}'? Send it as the product to remove it",
+                            "match": {"product": match.item["product"], "tier": match.tier, "confidence": match.confidence},
+                            "data": llm_response,
+                        }
+                    logger.error(f"❌ No matching product found for: {llm_response['product']}")
+                    return {"error": f"No matching product found for '{llm_response['product']}'"}
+                removed["product"] = closest["product"]
+                # Entries from before name_key was stored: it is derived from the name
+                removed["name_key"] = closest.get("name_key") or normalize_product_name(closest["product"])
+                units = run_grouped(client, remove_operation, restore_wishlist_item)
+                if units is None:
+                    return {"error": f"No matching product found for '{llm_response['product']}'"}
+
+            recommendation_cache.invalidate(username)
+            log_command(username, llm_response)
+            logger.info(f"✅ Removed {units} × {removed['product']} and returned them to stock")
 
-            logger.info(f"🎯 Removing product: {closest['product']}")
-            
-            # ✅ Remove matched product and add to history
-            result = user_collection.update_one(
-                {"username": username},
-                {
-                    "$pull": {"wishlist": {"product": closest["product"]}},
-                    "$push": {"historylist": llm_response}
-                }
-            )
-            
-            # ✅ Restore stock when item is removed from wishlist
-            store_restore_result = store_collection.update_one(
-                {"product": closest["product"]},
-                {"$inc": {"quantity": closest["quantity"]}}
-            )
-            
-            logger.info(f"✅ Product removed successfully. Modified count: {result.modified_count}")
-            logger.info(f"✅ Store stock restored. Added back {closest['quantity']} units. Modified count: {store_restore_result.modified_count}")
-            
             return {
-                "message": f"Product '{closest['product']}' removed from wishlist and stock restored",
+                "message": f"Product '{removed['product']}' removed from wishlist and stock restored",
+                "removed_quantity": units,
                 "data": llm_response
             }
 
@@ -375,26 +546,140 @@ def update_wishlist(username: str, llm_response: dict):
 
     
 
-@app.post("/update_wishlist/{username}")
-async def update_wishlist_route(username: str, llm_response: dict):
+async def run_idempotent(scope: str, key: Optional[str], fingerprint: str, handler):
+    """
+    Runs `await handler()` at most once per Idempotency-Key: a successful
+    response is stored and replayed to retries, a failure (HTTPException or
+    otherwise) releases the key so the retry runs again.
+    """
+    if key is None:
+        return await handler()
+    try:
+        stored = await run_in_threadpool(idempotency_store.claim, scope, key, fingerprint)
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    if stored is not None:
+        status_code, body = stored
+        return JSONResponse(body, status_code=status_code, headers={"Idempotent-Replayed": "true"})
+
+    try:
+        body = jsonable_encoder(await handler())
+    except Exception:
+        await run_in_threadpool(idempotency_store.release, scope, key)
+        raise
+    # Cancelled mid-update: the claim is left to lapse, the update may still land.
+    # The update has been applied, so storing its response gets its own time
+    # budget rather than whatever is left of the request's.
+    await run_in_threadpool(db_cleanup, idempotency_store.complete, scope, key, 200, body)
+    return body
+
+
+@app.post("/update_wishlist/{username}", dependencies=[Depends(require_models)])
+async def update_wishlist_route(username: str, llm_response: dict, idempotency_key: Optional[str] = Header(None)):
     """
     Confirmed action from frontend → update MongoDB wishlist/history.
+    With an Idempotency-Key header, retries return the first result
+    instead of reserving stock again.
     """
+    async def apply():
+        try:
+            logger.info(f"📝 Wishlist update request for user: {username}")
+            with timed("db"):
+                result = await run_in_threadpool(db_deadline, update_wishlist, username, llm_response)
+            
+            if "error" in result:
+                logger.error(f"❌ Wishlist update failed: {result['error']}")
+                raise HTTPException(status_code=400, detail=result["error"])
+            
+            logger.info(f"✅ Wishlist update successful: {result['message']}")
+            return result
+        except (HTTPException, UpstreamUnavailable):
+            raise
+        except Exception as e:
+            logger.error(f"❌ Unexpected error in wishlist update: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+    fingerprint = request_fingerprint(username, llm_response)
+    return await run_idempotent(f"update_wishlist:{username}", idempotency_key, fingerprint, apply)
+
+
+def command_confidence(llm_response: dict):
+    """
+    (confidence, catalog match) for a parsed command: the lower of the
+    parser's own score (fast path only) and the catalog match's.
+    Confidence is None when neither is known.
+    """
+    scores = [float(llm_response["confidence"])] if "confidence" in llm_response else []
+    match = catalog_resolver.resolve(llm_response["product"])
+    if match:
+        scores.append(match.confidence)
+    return (min(scores) if scores else None), match
+
+
+@app.post("/voice_command/{username}", dependencies=[Depends(require_models)])
+async def voice_command(username: str, request: Request,
+                        confirm_below: Optional[float] = Query(None, ge=0, le=1),
+                        idempotency_key: Optional[str] = Header(None)):
+    """
+    One round trip for a voice command: transcribe, parse, resolve and
+    apply it to the wishlist. Audio is sent as for /recognise_text_to_llm.
+
+    With confirm_below, a command whose confidence is lower is returned
+    as "needs_confirmation" without touching the wishlist (confirm it via
+    /update_wishlist); everything else comes back "applied". With an
+    Idempotency-Key header, retries get the first response back.
+    """
+    logger.info(f"🎤 One-shot voice command for user: {username}")
     try:
-        logger.info(f"📝 Wishlist update request for user: {username}")
-        result = update_wishlist(username, llm_response)
-        
+        with timed("upload"):
+            audio = await receive_audio(request)
+    except AudioRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+    async def run():
+        try:
+            with timed("asr"):
+                text = await transcriber.transcribe(audio)
+        except TranscriptionError as e:
+            logger.error(f"❌ Transcription failed: {e}")
+            raise HTTPException(status_code=500, detail=f"Transcription failed: {e}")
+        logger.info(f"📝 Transcribed text: {text}")
+
+        llm_response = await interpret_transcript(text)
+        if llm_response is None:
+            logger.error("❌ Invalid LLM response format")
+            raise HTTPException(status_code=400, detail="Invalid AI response format")
+
+        confidence, match = await run_in_threadpool(command_confidence, llm_response)
+        response = {"recognized_text": text, "llm_response": llm_response, "confidence": confidence}
+        if match:
+            response["match"] = {"product": match.item["product"], "tier": match.tier, "confidence": match.confidence}
+        if confirm_below is not None and confidence is not None and confidence < confirm_below:
+            logger.info(f"🤔 Confidence {confidence} below {confirm_below}, asking for confirmation")
+            return {"status": "needs_confirmation", **response}
+
+        with timed("db"):
+            result = await run_in_threadpool(db_deadline, update_wishlist, username, llm_response)
         if "error" in result:
             logger.error(f"❌ Wishlist update failed: {result['error']}")
             raise HTTPException(status_code=400, detail=result["error"])
-        
-        logger.info(f"✅ Wishlist update successful: {result['message']}")
-        return result
-    except HTTPException:
+        if result.get("status") == "needs_confirmation":
+            return {**response, "status": "needs_confirmation", "match": result["match"], "message": result["message"]}
+        logger.info(f"✅ Voice command applied: {result['message']}")
+        return {"status": "applied", **response, "result": result}
+
+    try:
+        fingerprint = None
+        if idempotency_key is not None:
+            fingerprint = request_fingerprint(username, confirm_below, await run_in_threadpool(audio_digest, audio))
+        return await run_idempotent(f"voice_command:{username}", idempotency_key, fingerprint, run)
+    except (HTTPException, UpstreamUnavailable):
         raise
     except Exception as e:
-        logger.error(f"❌ Unexpected error in wishlist update: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+        logger.error(f"❌ Voice command failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Voice command failed: {str(e)}")
+    finally:
+        audio.file.close()
 
 
 @app.get("/wishlist/{username}")
@@ -402,7 +687,9 @@ async def get_wishlist(username: str):
     try:
         logger.info(f"📋 Fetching wishlist for user: {username}")
         
-        user = user_collection.find_one({"username": username}, {"_id": 0, "wishlist": 1})
+        user = await run_in_threadpool(
+            user_collection.find_one, {"username": username}, {"_id": 0, "wishlist": 1}
+        )
         if not user:
             logger.info(f"👤 User not found: {username}, returning empty wishlist")
             return {"wishlist": []}  # empty if user not found
@@ -415,12 +702,39 @@ async def get_wishlist(username: str):
         raise HTTPException(status_code=500, detail=f"Failed to fetch wishlist: {str(e)}")
 
 
-@app.get("/recommendations/{username}")
-def get_recommendations(username: str):
+@app.get("/history/{username}")
+async def get_history(username: str, limit: int = HISTORY_PAGE_DEFAULT, cursor: str = None):
+    """Newest-first command history, paginated with an opaque cursor."""
+    try:
+        logger.info(f"📜 Fetching history for user: {username}")
+        items, next_cursor = await run_in_threadpool(
+            history_page, history_collection, username, limit, cursor
+        )
+        return {"history": items, "next_cursor": next_cursor}
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"❌ Failed to fetch history: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to fetch history: {str(e)}")
+
+
+@app.get("/recommendations/{username}", dependencies=[Depends(require_models)])
+def get_recommendations(username: str, category: Optional[List[str]] = Query(None),
+                        exclude_category: Optional[List[str]] = Query(None)):
     try:
         logger.info(f"🎯 Fetching recommendations for user: {username}")
-        
-        user = user_collection.find_one({"username": username}, {"wishlist": 1})
+
+        # Only unfiltered results are cached; filtered ones are one-off views.
+        filtered = bool(category or exclude_category)
+        catalog_version = store_index.version
+        cached = None if filtered else recommendation_cache.get(username, catalog_version)
+        if cached is not None:
+            logger.info(f"⚡ Recommendations served from cache for user: {username}")
+            return {"recommendations": cached}
+        generation = recommendation_cache.generation(username)
+
+        with timed("db"):
+            user = user_collection.find_one({"username": username}, {"wishlist": 1})
         if not user or "wishlist" not in user:
             logger.info(f"👤 No wishlist found for user: {username}")
             return {"recommendations": [], "note": "No wishlist found"}
@@ -430,40 +744,73 @@ def get_recommendations(username: str):
             logger.info(f"📋 Empty wishlist for user: {username}")
             return {"recommendations": [], "note": "Wishlist empty"}
 
-        wishlist_products = [item["product"] for item in wishlist]
-        wishlist_text = " ".join(wishlist_products)
-        logger.info(f"📝 Wishlist text for recommendations: {wishlist_text}")
+        # Query vector from the items' stored vectors - no model inference
+        query_vector = wishlist_query_vector(store_index, wishlist)
+        if query_vector is None:
+            # None of the items are in the catalog any more: embed the names instead
+            with timed("embed"):
+                query_vector = encode_texts([" ".join(item["product"] for item in wishlist)])
 
-        query_vector = embedder.encode([wishlist_text], convert_to_numpy=True)
-        distances, indices = faiss_index.search(query_vector, k=10)
-
-        recs = []
-        for idx in indices[0]:
-            candidate = store_products[idx]
-            if candidate["product"] not in wishlist_products:
-                recs.append(candidate)
-
-        logger.info(f"✅ Generated {len(recs[:5])} recommendations")
-        return {"recommendations": recs[:5]}
+        with timed("search"):
+            recs = recommend(
+                store_index, wishlist, query_vector, categories=category, exclude_categories=exclude_category
+            )
+        if not filtered:
+            recommendation_cache.put(username, catalog_version, recs, generation)
+
+        logger.info(f"✅ Generated {len(recs)} recommendations")
+        return {"recommendations": recs}
+    except (EmbeddingQueueFull, TimeoutError) as e:
+        detail = str(e) or "Embedding timed out"
+        logger.warning(f"⚠️ Recommendations shed under load: {detail}")
+        raise HTTPException(status_code=503, detail=detail)
     except Exception as e:
         logger.error(f"❌ Failed to generate recommendations: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to generate recommendations: {str(e)}")
 
 
 @app.get("/store")
-def get_store_items():
-    """Get all available products in the store"""
+def get_store_items(request: Request, response: Response, limit: int = STORE_PAGE_DEFAULT, cursor: Optional[str] = None,
+                    category: Optional[List[str]] = Query(None), min_price: Optional[float] = None,
+                    max_price: Optional[float] = None, fields: Optional[str] = None, format: str = "json"):
+    """
+    Store products, one page at a time (follow `next_cursor`), optionally
+    filtered by category / price range and projected to `fields`.
+    format=ndjson streams every matching product instead of paging.
+    """
     try:
         logger.info("🏪 Fetching store items")
-        
-        store_items = list(store_collection.find({}, {"_id": 0}))
+
+        # Revalidate every time; unchanged catalogs answer 304 without
+        # reading the page.
+        etag = catalog_etag(store_collection)
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+
+        query = store_query(category, min_price, max_price)
+        projection = projection_for(fields)
+
+        if format == "ndjson":
+            return StreamingResponse(
+                iter_store_ndjson(store_collection, query, projection),
+                media_type="application/x-ndjson",
+                headers=headers,
+            )
+        if format != "json":
+            raise InvalidStoreQuery("format must be json or ndjson")
+
+        store_items, next_cursor = store_page(store_collection, query, projection, limit, cursor)
         logger.info(f"✅ Store items fetched successfully. Count: {len(store_items)}")
-        
-        if len(store_items) == 0:
+        response.headers.update(headers)
+
+        if len(store_items) == 0 and not (cursor or query):
             logger.warning("⚠️ Store is empty. Please run seed_store.py to populate the store.")
-            return {"store_items": [], "note": "Store is empty. Please seed the database."}
-        
-        return {"store_items": store_items}
+            return {"store_items": [], "next_cursor": None, "note": "Store is empty. Please seed the database."}
+
+        return {"store_items": store_items, "next_cursor": next_cursor}
+    except InvalidStoreQuery as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"❌ Failed to fetch store items: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to fetch store items: {str(e)}")
@@ -0,0 +1,228 @@
+import bisect
+import contextvars
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+# metrics.py
+#
+# In-process metrics, exposed in the Prometheus text format on /metrics
+# (no client library needed):
+#
+#   Counter / Gauge / Histogram   labelled metric families, safe to update
+#                                 from the event loop and worker threads
+#   timed(stage)                  times one pipeline stage (upload, asr,
+#                                 llm, db, search, ...) into
+#                                 voice_stage_duration_seconds and the
+#                                 request's Server-Timing header
+#   MetricsMiddleware             per-route latency, in-flight requests and
+#                                 the Server-Timing header itself
+#   register_stats(name, fn)      exports a component's stats() numbers at
+#                                 scrape time (caches, index, breakers...)
+#
+# An observation is a bisect and a few integer updates under a lock, so
+# it stays on in production.
+
+SERVER_TIMING_HEADER = os.getenv("SERVER_TIMING_HEADER", "true").lower() == "true"
+
+_INVALID_NAME_CHARS = re.compile(r"[^a-zA-Z0-9_]")
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _format_value(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return self._header() + [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in items
+        ]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels):
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                # per-bucket counts (last one is +Inf), sum
+                series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][slot] += 1
+            series[1] += value
+
+    def render(self):
+        with self._lock:
+            items = sorted((labels, (list(counts), total)) for labels, (counts, total) in self._values.items())
+        lines = self._header()
+        for labels, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total!r}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+REGISTRY = []
+_stats_sources = {}
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "route", "status"))
+http_requests_in_flight = Gauge("http_requests_in_flight", "HTTP requests being served")
+stage_duration = Histogram(
+    "voice_stage_duration_seconds", "Time spent per pipeline stage", ("stage",))
+stages_in_flight = Gauge("voice_stages_in_flight", "Pipeline stages currently running", ("stage",))
+upstream_requests = Counter(
+    "upstream_requests_total", "Calls to Groq / AssemblyAI by outcome", ("upstream", "outcome"))
+
+
+# ===================== STAGE TIMING ======================
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+@contextmanager
+def timed(stage: str):
+    """Times the block as `stage`; works in run_in_threadpool too (the contextvar follows)."""
+    stages_in_flight.inc(stage)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stages_in_flight.dec(stage)
+        stage_duration.observe(elapsed, stage)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((stage, elapsed))
+
+
+def server_timing(timings, total: float) -> str:
+    parts = [f"{stage};dur={elapsed * 1000:.1f}" for stage, elapsed in timings]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+class MetricsMiddleware:
+    """Per-route latency and in-flight counts, plus the Server-Timing header (plain ASGI)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        timings = []
+        token = _request_timings.set(timings)
+        status = {"code": 500}
+        http_requests_in_flight.inc()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                if SERVER_TIMING_HEADER:
+                    value = server_timing(timings, time.perf_counter() - start)
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"server-timing", value.encode("latin-1")),
+                    ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_timings.reset(token)
+            http_requests_in_flight.dec()
+            route = scope.get("route")
+            http_request_duration.observe(
+                time.perf_counter() - start,
+                scope["method"],
+                route.path if route is not None else "unmatched",
+                str(status["code"]),
+            )
+
+
+# ===================== COMPONENT STATS =====================
+def register_stats(name: str, fn):
+    """Exports fn()'s numbers as app_<name>_<key> at scrape time; strings become a label."""
+    _stats_sources[name] = fn
+
+
+def _flatten(prefix, stats, out):
+    for key, value in stats.items():
+        metric = f"{prefix}_{_INVALID_NAME_CHARS.sub('_', str(key))}"
+        if isinstance(value, dict):
+            _flatten(metric, value, out)
+        elif isinstance(value, bool):
+            out.append(f"{metric} {int(value)}")
+        elif isinstance(value, (int, float)):
+            out.append(f"{metric} {_format_value(value)}")
+        elif value is not None:
+            out.append(f'{metric}_info{{value="{_escape(value)}"}} 1')
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    for name, fn in _stats_sources.items():
+        _flatten(f"app_{name}", fn(), lines)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,103 @@
+"""
+Moves users.historylist arrays into the history collection.
+
+    python migrate_history.py [--dry-run] [--batch-size 500]
+
+Safe to re-run: each entry is upserted under the user it came from and
+its position in historylist, so a run interrupted part-way inserts the
+rest without duplicating what was already copied. Once all of a user's
+entries are in, the user is marked history_migrated and only then is
+historylist removed. Entries older than HISTORY_RETENTION_DAYS are
+migrated too but will be expired by the TTL monitor shortly after.
+"""
+import argparse
+
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import OperationFailure
+
+from db import db, user_collection, history_collection
+from history import ensure_history_collection, history_entry
+
+
+def is_timeseries(collection) -> bool:
+    info = next(iter(collection.database.list_collections(filter={"name": collection.name})), None)
+    return (info or {}).get("type") == "timeseries"
+
+
+def copy_entries(entries, batch_size: int, upsert: bool) -> int:
+    """
+    Writes entries keyed by (migrated_from, migrated_index); returns how many
+    were new. Time-series collections can't upsert, so there the keys
+    already present are read first and only the missing entries inserted.
+    """
+    if not upsert:
+        done = set(history_collection.distinct("migrated_index", {"migrated_from": entries[0]["migrated_from"]}))
+        entries = [e for e in entries if e["migrated_index"] not in done]
+        for start in range(0, len(entries), batch_size):
+            history_collection.insert_many(entries[start:start + batch_size], ordered=False)
+        return len(entries)
+
+    inserted = 0
+    for start in range(0, len(entries), batch_size):
+        result = history_collection.bulk_write([
+            UpdateOne(
+                {"migrated_from": e["migrated_from"], "migrated_index": e["migrated_index"]},
+                {"$setOnInsert": e},
+                upsert=True,
+            )
+            for e in entries[start:start + batch_size]
+        ], ordered=False)
+        inserted += result.upserted_count
+    return inserted
+
+
+def migrate(dry_run=False, batch_size=500):
+    ensure_history_collection(db)
+    upsert = not is_timeseries(history_collection)
+    try:
+        history_collection.create_index(
+            [("migrated_from", ASCENDING), ("migrated_index", ASCENDING)],
+            name="migrated_from_index",
+            unique=upsert,
+            partialFilterExpression={"migrated_from": {"$exists": True}},
+        )
+    except OperationFailure as e:
+        print(f"⚠️ Could not create migration index ({e}), continuing without it")
+    users = user_collection.find(
+        {"historylist": {"$exists": True}}, {"username": 1, "historylist": 1, "history_migrated": 1}
+    )
+    migrated_users, migrated_entries = 0, 0
+
+    for user in users:
+        entries = [
+            {**history_entry(user.get("username"), command), "migrated_from": user["_id"], "migrated_index": i}
+            for i, command in enumerate(user.get("historylist") or [])
+            if isinstance(command, dict)
+        ]
+        done = user.get("history_migrated", False)
+
+        if dry_run:
+            print(f"[dry-run] {user.get('username')}: {0 if done else len(entries)} entries")
+            migrated_entries += 0 if done else len(entries)
+        else:
+            if not done:
+                if entries:
+                    migrated_entries += copy_entries(entries, batch_size, upsert)
+                # Every entry is in: mark the user before touching historylist.
+                user_collection.update_one({"_id": user["_id"]}, {"$set": {"history_migrated": True}})
+            user_collection.update_one(
+                {"_id": user["_id"], "history_migrated": True}, {"$unset": {"historylist": ""}}
+            )
+
+        migrated_users += 1
+
+    verb = "Would migrate" if dry_run else "Migrated"
+    print(f"✅ {verb} {migrated_entries} history entries from {migrated_users} users")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+    migrate(dry_run=args.dry_run, batch_size=args.batch_size)
@@ -0,0 +1,38 @@
+"""
+Collapses duplicate wishlist entries into one entry per product.
+
+    python migrate_wishlist.py [--dry-run]
+
+Older versions pushed a new entry for every "add"; the wishlist is now kept
+as one entry per product with the summed quantity. Safe to re-run.
+"""
+import argparse
+
+from db import user_collection
+from wishlist import aggregate_entries
+
+
+def migrate(dry_run=False):
+    changed = 0
+    for user in user_collection.find({"wishlist.1": {"$exists": True}}, {"username": 1, "wishlist": 1}):
+        merged = aggregate_entries(user["wishlist"])
+        if len(merged) == len(user["wishlist"]):
+            continue
+        changed += 1
+        if dry_run:
+            print(f"[dry-run] {user.get('username')}: {len(user['wishlist'])} → {len(merged)} entries")
+        else:
+            # Only replace the array we read, so a concurrent add is not lost.
+            user_collection.update_one(
+                {"_id": user["_id"], "wishlist": user["wishlist"]},
+                {"$set": {"wishlist": merged}},
+            )
+
+    verb = "Would aggregate" if dry_run else "Aggregated"
+    print(f"✅ {verb} wishlists for {changed} users")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true")
+    migrate(dry_run=parser.parse_args().dry_run)
@@ -0,0 +1,201 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+
+from command_parser import NUMBER_WORDS, HOMOPHONES, parse_quantity, normalize_transcript
+from helper_function import validate_llm_response
+
+# parse_cache.py
+#
+# Cache of LLM-parsed commands keyed by the normalized transcript, so
+# "Add two milk." and "add 2 milk" share one entry. Concurrent identical
+# commands are coalesced into a single upstream call (single flight); if
+# the request making that call is cancelled, a waiting one takes it over.
+#
+# The default backend is in-process. Set PARSE_CACHE_REDIS_URL (and
+# `pip install redis`) to share the cache between workers.
+
+logger = logging.getLogger(__name__)
+
+PARSE_CACHE_TTL_SECONDS = int(os.getenv("PARSE_CACHE_TTL_SECONDS", "86400"))
+PARSE_CACHE_MAX_ITEMS = int(os.getenv("PARSE_CACHE_MAX_ITEMS", "10000"))
+PARSE_CACHE_REDIS_URL = os.getenv("PARSE_CACHE_REDIS_URL")
+PARSE_CACHE_PREFIX = "parse:"
+
+# Words that are too ambiguous to rewrite as digits ("add a milk", "add to milk").
+_AMBIGUOUS_NUMBERS = {"a", "an"} | HOMOPHONES
+
+
+def normalize_command_key(text: str) -> str:
+    """
+    Cache key for a transcript: lower-cased, punctuation and extra
+    whitespace removed, number words rewritten as digits.
+    """
+    tokens = normalize_transcript(text).split()
+    out, i = [], 0
+    while i < len(tokens):
+        if tokens[i] in NUMBER_WORDS and tokens[i] not in _AMBIGUOUS_NUMBERS:
+            quantity, used = parse_quantity(tokens, i)
+            if isinstance(quantity, int) and used:
+                out.append(str(quantity))
+                i += used
+                continue
+        out.append(tokens[i])
+        i += 1
+    return " ".join(out)
+
+
+class MemoryBackend:
+    """In-process TTL + LRU store."""
+
+    def __init__(self, max_items: int = PARSE_CACHE_MAX_ITEMS):
+        self.max_items = max_items
+        self._items = OrderedDict()  # key -> (expires_at, value)
+
+    async def get(self, key):
+        entry = self._items.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            self._items.pop(key, None)
+            return None
+        self._items.move_to_end(key)
+        return value
+
+    async def set(self, key, value, ttl):
+        self._items[key] = (time.monotonic() + ttl, value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_items:
+            self._items.popitem(last=False)
+
+    async def delete(self, key):
+        self._items.pop(key, None)
+
+    def __len__(self):
+        return len(self._items)
+
+
+class RedisBackend:
+    """
+    Any Redis-protocol server. TTL is per key; LRU eviction is the server's
+    job (run it with maxmemory-policy allkeys-lru).
+    """
+
+    def __init__(self, url: str):
+        import redis.asyncio as redis
+        self._redis = redis.from_url(url)
+
+    async def get(self, key):
+        value = await self._redis.get(PARSE_CACHE_PREFIX + key)
+        return value.decode() if isinstance(value, bytes) else value
+
+    async def set(self, key, value, ttl):
+        await self._redis.set(PARSE_CACHE_PREFIX + key, value, ex=ttl)
+
+    async def delete(self, key):
+        await self._redis.delete(PARSE_CACHE_PREFIX + key)
+
+    def __len__(self):
+        return -1  # unknown without a round trip
+
+
+def default_backend():
+    if PARSE_CACHE_REDIS_URL:
+        try:
+            return RedisBackend(PARSE_CACHE_REDIS_URL)
+        except ImportError:
+            logger.error("❌ PARSE_CACHE_REDIS_URL is set but the redis package is not installed, using in-process cache")
+    return MemoryBackend()
+
+
+class ParseCache:
+    def __init__(self, backend=None, ttl: int = PARSE_CACHE_TTL_SECONDS):
+        self.backend = backend if backend is not None else default_backend()
+        self.ttl = ttl
+        self._inflight = {}  # key -> asyncio.Future
+        self.counters = {"hits": 0, "misses": 0, "coalesced": 0, "invalid": 0, "backend_errors": 0}
+
+    async def _lookup(self, key):
+        try:
+            raw = await self.backend.get(key)
+        except Exception as e:
+            self.counters["backend_errors"] += 1
+            logger.warning(f"⚠️ Parse cache read failed: {e}")
+            return None
+        if raw is None:
+            return None
+        try:
+            cached = json.loads(raw)
+        except ValueError:
+            cached = None
+        if not validate_llm_response(cached):
+            self.counters["invalid"] += 1
+            await self.backend.delete(key)
+            return None
+        return cached
+
+    async def get_or_parse(self, user_text: str, parse_fn):
+        """
+        Returns the parsed command for user_text, calling `await
+        parse_fn(user_text)` only on a miss. Only responses that pass
+        validate_llm_response() are cached.
+        """
+        key = normalize_command_key(user_text)
+
+        while True:
+            cached = await self._lookup(key)
+            if cached is not None:
+                self.counters["hits"] += 1
+                return cached
+
+            pending = self._inflight.get(key)
+            if pending is None:
+                break
+            self.counters["coalesced"] += 1
+            try:
+                return json.loads(await asyncio.shield(pending))
+            except asyncio.CancelledError:
+                # The leader's request went away, not ours: look again, and
+                # the first waiter through takes over the parse.
+                if not pending.cancelled() or asyncio.current_task().cancelling():
+                    raise
+
+        self.counters["misses"] += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await parse_fn(user_text)
+            encoded = json.dumps(result)
+            if validate_llm_response(result):
+                try:
+                    await self.backend.set(key, encoded, self.ttl)
+                except Exception as e:
+                    self.counters["backend_errors"] += 1
+                    logger.warning(f"⚠️ Parse cache write failed: {e}")
+            future.set_result(encoded)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            # Waiters get the exception; make sure it's never "unretrieved".
+            future.exception()
+            raise
+        except BaseException:
+            future.cancel()
+            raise
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def stats(self) -> dict:
+        c = dict(self.counters)
+        lookups = c["hits"] + c["misses"] + c["coalesced"]
+        return {
+            **c,
+            "hit_rate": round((c["hits"] + c["coalesced"]) / lookups, 4) if lookups else 0.0,
+            "items": len(self.backend),
+            "ttl_seconds": self.ttl,
+        }
@@ -0,0 +1,114 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# recommendations.py
+#
+# Wishlist-based recommendations built from the vectors already stored in
+# the FAISS index: the user's query vector is the quantity-weighted mean of
+# their wishlist items, so no model inference runs per request. Results are
+# cached per user and dropped whenever that user's wishlist changes.
+
+RECOMMENDATION_COUNT = 5
+RECOMMENDATION_CACHE_TTL_SECONDS = float(os.getenv("RECOMMENDATION_CACHE_TTL_SECONDS", "300"))
+RECOMMENDATION_CACHE_MAX_USERS = int(os.getenv("RECOMMENDATION_CACHE_MAX_USERS", "50000"))
+
+
+def wishlist_query_vector(store_index, wishlist):
+    """Quantity-weighted, unit-length mean of the wishlist items' stored vectors."""
+    weights = {}
+    for item in wishlist:
+        weights[item["product"]] = weights.get(item["product"], 0) + max(int(item.get("quantity", 1)), 1)
+    names, vectors = store_index.vectors_for(list(weights))
+    if not names:
+        return None
+    w = np.asarray([weights[name] for name in names], dtype="float32")
+    query = (vectors * w[:, None]).sum(axis=0) / w.sum()
+    norm = np.linalg.norm(query)
+    return (query / norm if norm else query).reshape(1, -1).astype("float32")
+
+
+def recommend(store_index, wishlist, query_vector, count: int = RECOMMENDATION_COUNT,
+              categories=None, exclude_categories=None):
+    """
+    Nearest catalog products that aren't already in the wishlist, optionally
+    limited to / excluding some categories. The search widens until `count`
+    of them are found or the catalog is exhausted.
+    """
+    exclude = {item["product"] for item in wishlist}
+    total = store_index.index.ntotal if store_index.index is not None else 0
+    k = count + len(exclude)
+    while True:
+        _, candidates = store_index.search(
+            query_vector, k=k, categories=categories, exclude_categories=exclude_categories
+        )
+        recs = [c for c in candidates if c["product"] not in exclude]
+        if len(recs) >= count or k >= total:
+            return recs[:count]
+        k = min(k * 2, total)
+
+
+class RecommendationCache:
+    """
+    username -> recommendations. Entries are dropped on wishlist changes
+    (invalidate), when the catalog version moves on, and after the TTL; the
+    TTL bounds staleness for updates that went through another worker.
+
+    Take generation(username) before reading the wishlist and hand it to
+    put(): if the user was invalidated in between, the result is dropped
+    rather than cached over the newer wishlist.
+    """
+
+    def __init__(self, ttl: float = RECOMMENDATION_CACHE_TTL_SECONDS,
+                 max_users: int = RECOMMENDATION_CACHE_MAX_USERS):
+        self.ttl = ttl
+        self.max_users = max_users
+        self._entries = OrderedDict()  # username -> (expires_at, catalog version, recs)
+        self._seq = 0  # bumped by every invalidate()
+        self._invalidated = OrderedDict()  # username -> seq of its last invalidate()
+        self._forgotten = 0  # highest seq evicted from _invalidated
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def get(self, username: str, catalog_version):
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None or entry[0] < time.monotonic() or entry[1] != catalog_version:
+                self.counters["misses"] += 1
+                return None
+            self._entries.move_to_end(username)
+            self.counters["hits"] += 1
+            return entry[2]
+
+    def generation(self, username: str) -> int:
+        with self._lock:
+            return self._invalidated.get(username, self._forgotten)
+
+    def put(self, username: str, catalog_version, recs, generation: int):
+        with self._lock:
+            if generation != self._invalidated.get(username, self._forgotten):
+                return  # invalidated while these were being built
+            self._entries[username] = (time.monotonic() + self.ttl, catalog_version, recs)
+            self._entries.move_to_end(username)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, username: str):
+        with self._lock:
+            self._seq += 1
+            self._invalidated[username] = self._seq
+            self._invalidated.move_to_end(username)
+            while len(self._invalidated) > self.max_users:
+                # Forgetting a user's seq raises the floor, which only ever
+                # makes put() drop more, never cache something stale.
+                _, seq = self._invalidated.popitem(last=False)
+                self._forgotten = max(self._forgotten, seq)
+            if self._entries.pop(username, None) is not None:
+                self.counters["invalidations"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self.counters, "users": len(self._entries), "ttl_seconds": self.ttl}
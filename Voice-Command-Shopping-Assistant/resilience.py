@@ -0,0 +1,271 @@
+import asyncio
+import contextvars
+import logging
+import os
+import random
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# resilience.py
+#
+# Keeps a slow or failing upstream (Groq, AssemblyAI, Mongo) from holding a
+# request hostage:
+#
+#   Deadline        per-request time budget, carried in a contextvar through
+#                   ASR -> LLM -> DB (it follows run_in_threadpool and new
+#                   tasks); each call's timeout is min(its own cap, what's left)
+#   retry()         exponential backoff with full jitter on retryable errors,
+#                   never sleeping past the deadline
+#   CircuitBreaker  after BREAKER_FAILURE_THRESHOLD consecutive failures the
+#                   upstream is skipped (CircuitOpen) for BREAKER_RESET_SECONDS,
+#                   then a single probe decides whether it is back
+#   hedged()        sends a second identical request once the first has taken
+#                   longer than the upstream's recent p95; first answer wins
+#
+# Upstream trouble surfaces as UpstreamUnavailable (503) or its subclass
+# DeadlineExceeded (504), so callers can fall back or fail fast.
+
+logger = logging.getLogger(__name__)
+
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "20"))
+UPSTREAM_RETRY_ATTEMPTS = int(os.getenv("UPSTREAM_RETRY_ATTEMPTS", "3"))
+UPSTREAM_RETRY_BASE_DELAY = float(os.getenv("UPSTREAM_RETRY_BASE_DELAY", "0.1"))
+UPSTREAM_RETRY_MAX_DELAY = float(os.getenv("UPSTREAM_RETRY_MAX_DELAY", "2"))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+# Own budget for undoing a partly applied write (see db_cleanup)
+DB_CLEANUP_TIMEOUT_SECONDS = float(os.getenv("DB_CLEANUP_TIMEOUT_SECONDS", "5"))
+
+
+class UpstreamUnavailable(Exception):
+    pass
+
+
+class DeadlineExceeded(UpstreamUnavailable):
+    pass
+
+
+class CircuitOpen(UpstreamUnavailable):
+    pass
+
+
+# ======================= DEADLINES =======================
+class Deadline:
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def timeout(self, cap: float = None) -> float:
+        """Timeout for the next call: the remaining budget, at most `cap`."""
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"Request deadline of {self.seconds}s exceeded")
+        return remaining if cap is None else min(cap, remaining)
+
+
+_current_deadline = contextvars.ContextVar("request_deadline", default=None)
+
+
+def current_deadline() -> Deadline:
+    """The running request's deadline (a fresh default one outside a request)."""
+    return _current_deadline.get() or Deadline(REQUEST_DEADLINE_SECONDS)
+
+
+@contextmanager
+def request_deadline(seconds: float = REQUEST_DEADLINE_SECONDS):
+    token = _current_deadline.set(Deadline(seconds))
+    try:
+        yield _current_deadline.get()
+    finally:
+        _current_deadline.reset(token)
+
+
+class DeadlineMiddleware:
+    """
+    Gives every HTTP request a fresh deadline (plain ASGI, so it reaches the
+    endpoint's context). WebSocket handlers set their own: see voice_stream.
+    """
+
+    def __init__(self, app, seconds: float = REQUEST_DEADLINE_SECONDS):
+        self.app = app
+        self.seconds = seconds
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        with request_deadline(self.seconds):
+            await self.app(scope, receive, send)
+
+
+def db_deadline(fn, *args, **kwargs):
+    """Runs a blocking Mongo operation with pymongo's timeout set to the remaining budget."""
+    import pymongo
+
+    with pymongo.timeout(current_deadline().timeout()):
+        return fn(*args, **kwargs)
+
+
+def db_cleanup(fn, *args, seconds: float = DB_CLEANUP_TIMEOUT_SECONDS, **kwargs):
+    """
+    Runs a blocking Mongo cleanup (compensation) with its own budget of
+    `seconds`. An expired request deadline is the usual reason a cleanup
+    runs at all, and nested pymongo.timeout() blocks can only shorten the
+    outer one, so it runs in a fresh context without the request's deadline.
+    """
+    import pymongo
+
+    def run():
+        with request_deadline(seconds), pymongo.timeout(seconds):
+            return fn(*args, **kwargs)
+
+    return contextvars.Context().run(run)
+
+
+# ======================= RETRIES =======================
+async def retry(call, retryable, name: str, attempts: int = None,
+                base_delay: float = None, max_delay: float = None):
+    """
+    `await call()` until it succeeds, raises something `retryable(e)`
+    rejects, runs out of attempts, or the next backoff would overrun the
+    deadline. The last error is re-raised.
+    """
+    attempts = attempts or UPSTREAM_RETRY_ATTEMPTS
+    base_delay = UPSTREAM_RETRY_BASE_DELAY if base_delay is None else base_delay
+    max_delay = UPSTREAM_RETRY_MAX_DELAY if max_delay is None else max_delay
+    for attempt in range(1, attempts + 1):
+        try:
+            return await call()
+        except Exception as e:
+            if attempt == attempts or not retryable(e):
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+            if delay >= current_deadline().remaining():
+                raise
+            logger.warning(f"🔁 {name} attempt {attempt} failed ({e!r}), retrying in {delay * 1000:.0f}ms")
+            await asyncio.sleep(delay)
+
+
+# ======================= CIRCUIT BREAKER =======================
+class CircuitBreaker:
+    """Consecutive-failure breaker; used from the event loop only."""
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self.counters = {"opened": 0, "rejected": 0}
+
+    def _allow(self):
+        if self.state == "open":
+            if time.monotonic() - self._opened_at < self.reset_seconds:
+                self.counters["rejected"] += 1
+                raise CircuitOpen(f"{self.name} is unavailable (circuit open)")
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self._probing:
+                self.counters["rejected"] += 1
+                raise CircuitOpen(f"{self.name} is unavailable (circuit half-open, probe in flight)")
+            self._probing = True
+
+    def _success(self):
+        if self.state != "closed":
+            logger.info(f"✅ {self.name} circuit closed")
+        self.state = "closed"
+        self._failures = 0
+        self._probing = False
+
+    def _failure(self):
+        self._failures += 1
+        self._probing = False
+        if self.state == "half_open" or self._failures >= self.failure_threshold:
+            if self.state != "open":
+                self.counters["opened"] += 1
+                logger.error(f"🚫 {self.name} circuit opened after {self._failures} failures")
+            self.state = "open"
+            self._opened_at = time.monotonic()
+
+    async def call(self, fn, is_failure=lambda e: True):
+        """
+        `await fn()` through the breaker; errors that aren't `is_failure` count
+        as the upstream being up. DeadlineExceeded says nothing about the
+        upstream (our own budget ran out), so it is neutral and a half-open
+        breaker just waits for the next probe.
+        """
+        self._allow()
+        try:
+            result = await fn()
+        except DeadlineExceeded:
+            self._probing = False
+            raise
+        except Exception as e:
+            if is_failure(e):
+                self._failure()
+            else:
+                self._success()
+            raise
+        except BaseException:
+            self._probing = False
+            raise
+        self._success()
+        return result
+
+    def stats(self) -> dict:
+        return {"state": self.state, "consecutive_failures": self._failures, **self.counters}
+
+
+# ======================= HEDGING =======================
+class LatencyTracker:
+    """Recent successful call latencies, for the hedging delay."""
+
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self._samples = deque(maxlen=size)
+        self.min_samples = min_samples
+
+    def record(self, seconds: float):
+        self._samples.append(seconds)
+
+    def quantile(self, q: float):
+        """None until there are min_samples latencies."""
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def hedged(call, delay: float, counters: dict = None):
+    """
+    Runs `await call()`; if it hasn't finished after `delay` seconds a
+    second `call()` races it. The first success wins and the other is
+    cancelled; if both fail, the last error is raised.
+    """
+    tasks = {asyncio.create_task(call())}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done:
+            if counters is not None:
+                counters["hedged"] += 1
+            hedge = asyncio.create_task(call())
+            tasks.add(hedge)
+        error = None
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if counters is not None and len(tasks) > 1 and task is hedge:
+                        counters["hedge_wins"] += 1
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
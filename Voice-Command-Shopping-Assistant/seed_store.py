@@ -1,4 +1,7 @@
 from db import store_collection
+from ingest_catalog import ingest
+
+# Demo catalog for a fresh database; real catalogs go through ingest_catalog.py.
 
 products = [
     # Dairy
@@ -32,8 +35,9 @@ products = [
     {"product": "Barley", "category": "grains", "price": 75, "quantity": 160},
 ]
 
-if store_collection.count_documents({}) == 0:
-    store_collection.insert_many(products)
-    print("✅ Store seeded with demo products!")
-else:
-    print("⚠️ Store already has data, skipping seeding.")
+if __name__ == "__main__":
+    if store_collection.count_documents({}) == 0:
+        ingest(products, store_collection)
+        print("✅ Store seeded with demo products!")
+    else:
+        print("⚠️ Store already has data, skipping seeding.")
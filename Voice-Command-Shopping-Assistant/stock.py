@@ -0,0 +1,105 @@
+import logging
+import os
+
+from pymongo import ReturnDocument
+
+from resilience import db_cleanup
+from store_listing import stamp_modified
+
+# stock.py
+#
+# Store stock reservations.
+#
+# A reservation is a single conditional update: the decrement only matches
+# when quantity >= requested, so the update result *is* the stock check and
+# concurrent adds can never oversell a SKU.
+#
+# The store write and the matching user write are grouped with
+# run_grouped(): a multi-document transaction when the deployment supports
+# one (replica set / sharded), otherwise the caller's compensation runs if
+# the second write fails.
+
+logger = logging.getLogger(__name__)
+
+# auto: use transactions when the topology supports them; on/off: force.
+STOCK_TRANSACTIONS = os.getenv("STOCK_TRANSACTIONS", "auto").lower()
+
+_TRANSACTION_TOPOLOGIES = {"ReplicaSetWithPrimary", "Sharded", "LoadBalanced"}
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product: str, available: int):
+        super().__init__(f"Only {available} × {product} available in store")
+        self.product = product
+        self.available = available
+
+
+class ProductNotFound(Exception):
+    pass
+
+
+def reserve(collection, name_key: str, quantity: int, session=None) -> dict:
+    """
+    Atomically takes `quantity` units of the product with `name_key`.
+    Returns the store document after the decrement.
+    """
+    doc = collection.find_one_and_update(
+        {"name_key": name_key, "quantity": {"$gte": quantity}},
+        stamp_modified({"$inc": {"quantity": -quantity}}),
+        projection={"_id": 1, "product": 1, "category": 1, "quantity": 1, "name_key": 1},
+        return_document=ReturnDocument.AFTER,
+        session=session,
+    )
+    if doc is not None:
+        return doc
+    # Failure path only: find out why, for the error message.
+    current = collection.find_one({"name_key": name_key}, {"product": 1, "quantity": 1}, session=session)
+    if current is None:
+        raise ProductNotFound(name_key)
+    raise InsufficientStock(current["product"], current.get("quantity", 0))
+
+
+def release(collection, name_key: str, quantity: int, session=None):
+    """
+    Returns `quantity` units to the product with `name_key` - the indexed
+    key reserve() matched on (wishlist entries carry it).
+    """
+    return collection.update_one(
+        {"name_key": name_key}, stamp_modified({"$inc": {"quantity": quantity}}), session=session
+    )
+
+
+def transactions_supported(client) -> bool:
+    if STOCK_TRANSACTIONS in ("on", "true"):
+        return True
+    if STOCK_TRANSACTIONS in ("off", "false"):
+        return False
+    try:
+        return client.topology_description.topology_type_name in _TRANSACTION_TOPOLOGIES
+    except Exception:
+        return False
+
+
+def run_grouped(client, operation, compensate=None):
+    """
+    Runs `operation(session)` so its store and user writes commit together.
+
+    With transactions, `operation` runs inside with_transaction() (which
+    also retries transient errors). Without them it runs with session=None;
+    if it raises, `compensate()` undoes whatever it already applied - with
+    its own time budget, since the request's may be what just ran out.
+    Compensations that fail are logged loudly for manual repair.
+    """
+    if transactions_supported(client):
+        with client.start_session() as session:
+            return session.with_transaction(operation)
+
+    try:
+        return operation(None)
+    except Exception:
+        if compensate is not None:
+            try:
+                db_cleanup(compensate)
+            except Exception as e:
+                logger.critical(f"🚨 Stock compensation failed, manual repair needed: {e}")
+        raise
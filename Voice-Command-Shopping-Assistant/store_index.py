@@ -0,0 +1,457 @@
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import numpy as np
+from pymongo.errors import OperationFailure, PyMongoError
+
+from vector_index import STORE_INDEX_FP16, STORE_INDEX_TYPE, VectorIndex
+
+# store_index.py
+#
+# Persistent, incrementally maintained FAISS index over store_collection.
+# Vectors are keyed by a stable 63-bit id derived from each product's Mongo
+# _id, so single products can be added, re-encoded or removed without
+# touching the rest of the index. The ANN backend (flat / HNSW / IVF-PQ)
+# comes from vector_index.py; when an IVF-PQ or fp16 index is rebuilt it
+# gets the original float32 vectors back through `encode` (embedding cache
+# hits), not the quantized ones it stores.
+#
+# The snapshot (index, ids, meta) is shared by every worker on the node and
+# by ingest_catalog.py: writers build it under per-process temp names and
+# swap it in under an exclusive flock, readers load it under a shared one.
+# All three files carry the same snapshot id; a snapshot that doesn't
+# agree with itself is ignored and rebuilt from Mongo.
+#
+# Live updates follow the store's change stream, filtered to the changes
+# that affect the index (stock-only updates are dropped server-side). A
+# broken stream is reopened with backoff from its resume token; only a
+# server without change streams (standalone) falls back to polling.
+
+logger = logging.getLogger(__name__)
+
+STORE_INDEX_DIR = os.getenv("STORE_INDEX_DIR", os.path.join(os.path.dirname(__file__), "index_cache"))
+STORE_INDEX_POLL_SECONDS = float(os.getenv("STORE_INDEX_POLL_SECONDS", "30"))
+# Texts per encode() call when (re)building, so a large catalog never holds
+# all of its new vectors in memory at once.
+STORE_INDEX_ENCODE_BATCH = int(os.getenv("STORE_INDEX_ENCODE_BATCH", "4096"))
+
+# Backoff between attempts to reopen a failed change stream
+STORE_INDEX_WATCH_BACKOFF_SECONDS = float(os.getenv("STORE_INDEX_WATCH_BACKOFF_SECONDS", "1"))
+STORE_INDEX_WATCH_MAX_BACKOFF_SECONDS = float(os.getenv("STORE_INDEX_WATCH_MAX_BACKOFF_SECONDS", "60"))
+
+STORE_FIELDS = {"_id": 1, "product": 1, "category": 1, "price": 1}
+
+# Change-stream events that can change the index: anything but updates
+# that touch none of the indexed fields (e.g. stock reservations).
+_INDEXED_FIELDS = [f for f in STORE_FIELDS if f != "_id"]
+WATCH_PIPELINE = [{"$match": {"$or": [
+    {"operationType": {"$in": ["insert", "delete", "replace"]}},
+    {"operationType": "update", "$or": [
+        *({f"updateDescription.updatedFields.{f}": {"$exists": True}} for f in _INDEXED_FIELDS),
+        {"updateDescription.removedFields": {"$in": _INDEXED_FIELDS}},
+    ]},
+]}}]
+_CHANGE_STREAMS_UNSUPPORTED = 40573  # "$changeStream is only supported on replica sets"
+_CHANGE_STREAM_HISTORY_LOST = (280, 286)  # resume token no longer in the oplog
+
+
+def product_vector_id(mongo_id) -> int:
+    """Stable int64 id for a store document, usable as a FAISS label."""
+    digest = hashlib.blake2b(str(mongo_id).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") & 0x7FFFFFFFFFFFFFFF
+
+
+def product_text(doc: dict) -> str:
+    """The text that gets embedded for a store product."""
+    return doc.get("product", "")
+
+
+def catalog_checksum(entries: dict) -> str:
+    """Checksum over (vector id, embedded text) pairs of the whole catalog."""
+    h = hashlib.sha256()
+    for vid in sorted(entries):
+        h.update(f"{vid}\x00{entries[vid]['text']}\x01".encode())
+    return h.hexdigest()
+
+
+class StoreIndex:
+    """
+    FAISS index + product metadata for the store catalog.
+
+    `encode` is any callable mapping a list of texts to an (n, dim) float32
+    array. On load the on-disk snapshot is memory-mapped and only products
+    whose embedded text changed since the snapshot are re-encoded.
+    """
+
+    def __init__(self, collection, encode, model_name: str, index_dir: str = STORE_INDEX_DIR):
+        self.collection = collection
+        self.encode = encode
+        self.model_name = model_name
+        self.index_dir = index_dir
+        self.index = None  # VectorIndex
+        self.products = {}  # vector id -> {"product", "category", "price", "text"}
+        self.checksum = None
+        self.version = 0  # bumped on every in-memory catalog change
+        self._name_map = (None, {})  # (version, product name -> vector id)
+        self._category_codes = {}  # category -> integer tag in the vector index
+        self._lock = threading.RLock()
+        self._updater = None
+        self._stop = threading.Event()
+        self._resume_token = None  # last change-stream position seen
+
+    # ---------------------- persistence ----------------------
+    @property
+    def _index_path(self):
+        return os.path.join(self.index_dir, "store.faiss")
+
+    @property
+    def _ids_path(self):
+        return os.path.join(self.index_dir, "store_ids.npz")
+
+    @property
+    def _meta_path(self):
+        return os.path.join(self.index_dir, "store_meta.json")
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool):
+        """Cross-process lock over the snapshot files: one writer or many readers."""
+        os.makedirs(self.index_dir, exist_ok=True)
+        with open(os.path.join(self.index_dir, "store.lock"), "a") as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            yield
+
+    def _load_snapshot(self) -> bool:
+        if not all(os.path.exists(p) for p in (self._index_path, self._ids_path, self._meta_path)):
+            return False
+        try:
+            with self._file_lock(exclusive=False):
+                with open(self._meta_path) as f:
+                    meta = json.load(f)
+                if meta.get("model") != self.model_name:
+                    logger.info("🔁 Store index snapshot was built with another model, rebuilding")
+                    return False
+                if meta.get("index_type") != STORE_INDEX_TYPE or meta.get("fp16") != STORE_INDEX_FP16:
+                    logger.info(f"🔁 Store index snapshot is not a {STORE_INDEX_TYPE} index, rebuilding")
+                    return False
+                index = VectorIndex.load(self._index_path, self._ids_path, source=self._source_vectors)
+            products = {int(vid): item for vid, item in meta["products"].items()}
+            if meta.get("snapshot") is None or index.snapshot_id != meta["snapshot"]:
+                raise ValueError("id file and meta file come from different saves")
+            if set(products) != set(index.labels[index.live].tolist()):
+                raise ValueError(f"{len(products)} products in meta, {index.ntotal} live vectors")
+        except Exception as e:
+            logger.warning(f"⚠️ Could not load store index snapshot, rebuilding: {e}")
+            return False
+
+        self.index = index
+        self.products = products
+        self.checksum = meta.get("checksum")
+        self._category_codes = meta.get("category_codes", {})
+        self.version += 1
+        logger.info(f"📦 Loaded store index snapshot with {self.index.ntotal} vectors")
+        return True
+
+    def save(self):
+        with self._lock:
+            if self.index is None:
+                return
+            os.makedirs(self.index_dir, exist_ok=True)
+            snapshot_id = uuid.uuid4().hex
+            suffix = f".tmp.{os.getpid()}"
+            tmp_index = self._index_path + suffix
+            tmp_ids = self._ids_path + suffix
+            tmp_meta = self._meta_path + suffix
+            self.index.save(tmp_index, tmp_ids, snapshot_id)
+            with open(tmp_meta, "w") as f:
+                json.dump({
+                    "model": self.model_name,
+                    "snapshot": snapshot_id,
+                    "index_type": STORE_INDEX_TYPE,
+                    "fp16": STORE_INDEX_FP16,
+                    "checksum": self.checksum,
+                    "category_codes": self._category_codes,
+                    "products": {str(vid): item for vid, item in self.products.items()},
+                }, f)
+            # A crash between the renames leaves files with different
+            # snapshot ids, which only costs a rebuild on the next start.
+            with self._file_lock(exclusive=True):
+                os.replace(tmp_index, self._index_path)
+                os.replace(tmp_ids, self._ids_path)
+                os.replace(tmp_meta, self._meta_path)
+
+    # ------------------------ sync ---------------------------
+    def _scan_catalog(self):
+        """Returns {vector id: entry} for every store product."""
+        entries = {}
+        for doc in self.collection.find({}, STORE_FIELDS):
+            vid = product_vector_id(doc["_id"])
+            entries[vid] = {
+                "product": doc.get("product"),
+                "category": doc.get("category"),
+                "price": doc.get("price"),
+                "text": product_text(doc),
+            }
+        return entries
+
+    def _ensure_index(self, dim: int):
+        if self.index is None:
+            self.index = VectorIndex(dim, source=self._source_vectors)
+
+    def _source_vectors(self, ids):
+        """Full-precision vectors for a rebuild, re-encoded from the product texts."""
+        texts = [self.products[vid]["text"] for vid in ids]
+        return np.concatenate([
+            np.asarray(self.encode(texts[start:start + STORE_INDEX_ENCODE_BATCH]), dtype="float32")
+            for start in range(0, len(texts), STORE_INDEX_ENCODE_BATCH)
+        ])
+
+    def _category_tag(self, category) -> int:
+        key = str(category)
+        if key not in self._category_codes:
+            self._category_codes[key] = len(self._category_codes)
+        return self._category_codes[key]
+
+    def _retag(self, entries: dict):
+        """Keeps the index's category tags in step with metadata-only updates."""
+        changed = [vid for vid, entry in entries.items()
+                   if vid in self.products and self.products[vid].get("category") != entry.get("category")]
+        if changed and self.index is not None:
+            self.index.set_tags(changed, [self._category_tag(entries[vid].get("category")) for vid in changed])
+
+    def upsert(self, entries: dict):
+        """Adds or re-encodes the given products ({vector id: entry}), STORE_INDEX_ENCODE_BATCH at a time."""
+        ids = list(entries)
+        for start in range(0, len(ids), STORE_INDEX_ENCODE_BATCH):
+            chunk = ids[start:start + STORE_INDEX_ENCODE_BATCH]
+            vectors = np.asarray(self.encode([entries[vid]["text"] for vid in chunk]), dtype="float32")
+            with self._lock:
+                self._ensure_index(vectors.shape[1])
+                tags = [self._category_tag(entries[vid].get("category")) for vid in chunk]
+                # Before add(): a rebuild it triggers reads the texts back.
+                self.products.update((vid, entries[vid]) for vid in chunk)
+                self.index.add(vectors, chunk, tags)
+                self.version += 1
+
+    def remove(self, ids):
+        ids = [vid for vid in ids if vid in self.products]
+        if not ids:
+            return
+        with self._lock:
+            self.index.remove(ids)
+            for vid in ids:
+                self.products.pop(vid, None)
+            self.version += 1
+
+    def sync(self) -> bool:
+        """
+        Brings the index in line with store_collection.
+        Only products whose embedded text changed are re-encoded; price or
+        category changes just update the metadata. Returns True if anything
+        changed.
+        """
+        entries = self._scan_catalog()
+        checksum = catalog_checksum(entries)
+
+        with self._lock:
+            current = dict(self.products)
+        added_or_changed = {
+            vid: entry for vid, entry in entries.items()
+            if vid not in current or current[vid]["text"] != entry["text"]
+        }
+        removed = [vid for vid in current if vid not in entries]
+        meta_changed = any(
+            vid in current and current[vid] != entry
+            for vid, entry in entries.items() if vid not in added_or_changed
+        )
+
+        if not (added_or_changed or removed or meta_changed):
+            self.checksum = checksum
+            return False
+
+        self.upsert(added_or_changed)
+        self.remove(removed)
+        with self._lock:
+            self._retag(entries)
+            self.products.update(entries)
+            self.checksum = checksum
+            self.version += 1
+        logger.info(
+            f"🔄 Store index synced: {len(added_or_changed)} encoded, "
+            f"{len(removed)} removed, {self.index.ntotal if self.index else 0} total"
+        )
+        return True
+
+    def load_or_build(self):
+        """Loads the persisted snapshot (if any) and re-encodes only what changed."""
+        start = time.perf_counter()
+        self._load_snapshot()
+        if self.sync():
+            self.save()
+        logger.info(f"✅ Store index ready in {time.perf_counter() - start:.2f}s")
+
+    def catalog(self):
+        """Returns (version, list of products) as a consistent snapshot."""
+        with self._lock:
+            return self.version, list(self.products.values())
+
+    def vectors_for(self, names):
+        """
+        Stored vectors for the given product names, without running the model.
+        Returns (names found, (n, dim) array); unknown names are skipped.
+        """
+        with self._lock:
+            version, name_map = self._name_map
+            if version != self.version:
+                name_map = {item["product"]: vid for vid, item in self.products.items()}
+                self._name_map = (self.version, name_map)
+            found = [name for name in names if name in name_map]
+            if not found or self.index is None:
+                return [], None
+            vectors = np.stack([self.index.reconstruct(name_map[name]) for name in found])
+        return found, vectors
+
+    # ----------------------- search --------------------------
+    def search(self, query_vectors, k: int, categories=None, exclude_categories=None):
+        """
+        Returns (distances, products) for the first query vector, optionally
+        restricted to `categories` and/or leaving out `exclude_categories`.
+        """
+        with self._lock:
+            if self.index is None or self.index.ntotal == 0:
+                return [], []
+            include = exclude = None
+            if categories is not None:
+                include = [self._category_codes[c] for c in categories if c in self._category_codes]
+                if not include:
+                    return [], []
+            if exclude_categories is not None:
+                exclude = [self._category_codes[c] for c in exclude_categories if c in self._category_codes]
+            distances, labels = self.index.search(
+                query_vectors, min(k, self.index.ntotal), include=include, exclude=exclude
+            )
+            results = []
+            for distance, vid in zip(distances[0], labels[0]):
+                if vid == -1 or int(vid) not in self.products:
+                    continue
+                item = self.products[int(vid)]
+                results.append((float(distance), {
+                    "product": item["product"],
+                    "category": item["category"],
+                    "price": item["price"],
+                }))
+        return [d for d, _ in results], [p for _, p in results]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "index_type": STORE_INDEX_TYPE,
+                "built_as": self.index.built_kind if self.index is not None else None,
+                "fp16": STORE_INDEX_FP16,
+                "vectors": self.index.ntotal if self.index is not None else 0,
+                "tombstones": int(len(self.index.labels) - self.index.ntotal) if self.index is not None else 0,
+            }
+
+    # ---------------------- updater --------------------------
+    def _apply_change(self, change: dict) -> bool:
+        """Applies one change-stream event; returns True if the index needs saving."""
+        op = change.get("operationType")
+        vid = product_vector_id(change["documentKey"]["_id"])
+        if op == "delete":
+            self.remove([vid])
+            return True
+        doc = change.get("fullDocument")
+        if doc is None:
+            return False
+        entry = {
+            "product": doc.get("product"),
+            "category": doc.get("category"),
+            "price": doc.get("price"),
+            "text": product_text(doc),
+        }
+        with self._lock:
+            current = self.products.get(vid)
+        if current is None or current["text"] != entry["text"]:
+            self.upsert({vid: entry})
+        elif current != entry:
+            with self._lock:
+                self._retag({vid: entry})
+                self.products[vid] = entry
+                self.version += 1
+        else:
+            # Stock-only update (reservations): nothing indexed changed.
+            return False
+        return True
+
+    def _follow(self, stream):
+        """Applies change-stream events until stopped, tracking the resume token."""
+        while not self._stop.is_set():
+            change = stream.try_next()
+            self._resume_token = stream.resume_token or self._resume_token
+            if change is None:
+                self._stop.wait(1)
+                continue
+            if self._apply_change(change):
+                self.save()
+
+    def _watch(self):
+        """Follows the Mongo change stream, reopening it with backoff; polls only without one."""
+        delay = STORE_INDEX_WATCH_BACKOFF_SECONDS
+        while not self._stop.is_set():
+            try:
+                stream = self.collection.watch(
+                    WATCH_PIPELINE, full_document="updateLookup", resume_after=self._resume_token
+                )
+            except Exception as e:
+                if not isinstance(e, PyMongoError) or getattr(e, "code", None) == _CHANGE_STREAMS_UNSUPPORTED:
+                    # Change streams need a replica set; standalone servers land here.
+                    logger.info(f"ℹ️ Change stream unavailable ({e}), polling every {STORE_INDEX_POLL_SECONDS}s")
+                    return self._poll()
+                error = e
+            else:
+                try:
+                    with stream:
+                        logger.info("👀 Watching store_collection change stream")
+                        delay = STORE_INDEX_WATCH_BACKOFF_SECONDS
+                        self._follow(stream)
+                    return
+                except Exception as e:
+                    error = e
+
+            if isinstance(error, OperationFailure) and error.code in _CHANGE_STREAM_HISTORY_LOST:
+                self._resume_token = None
+            logger.warning(f"⚠️ Store change stream failed ({error}), reopening in {delay:.1f}s")
+            if self._stop.wait(delay):
+                return
+            delay = min(delay * 2, STORE_INDEX_WATCH_MAX_BACKOFF_SECONDS)
+            if self._resume_token is None:
+                # Nothing to resume from: catch up on what the gap missed.
+                try:
+                    if self.sync():
+                        self.save()
+                except Exception as e:
+                    logger.warning(f"⚠️ Store index catch-up failed: {e}")
+
+    def _poll(self):
+        """Rescans the catalog every STORE_INDEX_POLL_SECONDS."""
+        while not self._stop.wait(STORE_INDEX_POLL_SECONDS):
+            try:
+                if self.sync():
+                    self.save()
+            except Exception as e:
+                logger.warning(f"⚠️ Store index poll failed: {e}")
+
+    def start_updater(self):
+        if self._updater is None or not self._updater.is_alive():
+            self._stop.clear()
+            self._updater = threading.Thread(target=self._watch, name="store-index-updater", daemon=True)
+            self._updater.start()
+
+    def stop_updater(self):
+        self._stop.set()
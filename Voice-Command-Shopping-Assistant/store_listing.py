@@ -0,0 +1,125 @@
+import base64
+import json
+import logging
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ASCENDING, DESCENDING
+
+# store_listing.py
+#
+# Read side of GET /store: cursor pagination over store_collection (ordered
+# by _id), server-side category / price filters, field projection, and an
+# NDJSON export that streams straight off the Mongo cursor.
+#
+# Responses carry an ETag built from Mongo itself, so every worker agrees
+# on it: each write to a store document stamps `modified` with a server
+# Timestamp in the same update (stamp_modified()), and the tag is the
+# newest stamp plus the document count (deletes leave no stamp). Unchanged
+# catalogs answer If-None-Match with a 304 after one indexed lookup.
+
+logger = logging.getLogger(__name__)
+
+STORE_PAGE_DEFAULT = 100
+STORE_PAGE_MAX = 1000
+STORE_PUBLIC_FIELDS = ("product", "category", "price", "quantity")
+STORE_EXPORT_BATCH = 1000
+
+class InvalidStoreQuery(ValueError):
+    pass
+
+
+def ensure_store_indexes(collection):
+    """Indexes behind the category-filtered and price-filtered pages and the ETag lookup."""
+    collection.create_index([("category", ASCENDING), ("_id", ASCENDING)], name="category_id")
+    collection.create_index([("price", ASCENDING)], name="price")
+    collection.create_index([("modified", DESCENDING)], name="modified")
+
+
+def stamp_modified(update: dict) -> dict:
+    """Adds the `modified` stamp catalog_etag() reads to a store document update."""
+    return {**update, "$currentDate": {"modified": {"$type": "timestamp"}}}
+
+
+def catalog_etag(collection) -> str:
+    latest = collection.find_one({}, {"_id": 0, "modified": 1}, sort=[("modified", DESCENDING)])
+    modified = (latest or {}).get("modified")
+    stamp = f"{modified.time}.{modified.inc}" if modified is not None else "0"
+    return f'"{stamp}-{collection.estimated_document_count()}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    # Proxies may weaken the tag (W/"..."); If-None-Match uses weak comparison.
+    return "*" in candidates or etag in [tag[2:] if tag.startswith("W/") else tag for tag in candidates]
+
+
+def projection_for(fields: str = None) -> dict:
+    """Mongo projection for a comma-separated `fields` list (default: all public fields)."""
+    if not fields:
+        selected = STORE_PUBLIC_FIELDS
+    else:
+        selected = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = [f for f in selected if f not in STORE_PUBLIC_FIELDS]
+        if unknown or not selected:
+            raise InvalidStoreQuery(
+                f"Unknown store fields: {', '.join(unknown) or fields!r}; "
+                f"expected any of {', '.join(STORE_PUBLIC_FIELDS)}"
+            )
+    return {"_id": 0, **{field: 1 for field in selected}}
+
+
+def store_query(categories=None, min_price: float = None, max_price: float = None) -> dict:
+    query = {}
+    if categories:
+        query["category"] = categories[0] if len(categories) == 1 else {"$in": list(categories)}
+    if min_price is not None or max_price is not None:
+        if min_price is not None and max_price is not None and min_price > max_price:
+            raise InvalidStoreQuery("min_price must not exceed max_price")
+        query["price"] = {}
+        if min_price is not None:
+            query["price"]["$gte"] = min_price
+        if max_price is not None:
+            query["price"]["$lte"] = max_price
+    return query
+
+
+def _encode_cursor(oid) -> str:
+    return base64.urlsafe_b64encode(str(oid).encode()).decode()
+
+
+def _decode_cursor(cursor: str):
+    try:
+        return ObjectId(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (InvalidId, ValueError, TypeError):
+        raise InvalidStoreQuery("Invalid store cursor")
+
+
+def store_page(collection, query: dict, projection: dict, limit: int = STORE_PAGE_DEFAULT, cursor: str = None):
+    """
+    One page of store items in _id order. Returns (items, next_cursor);
+    next_cursor is None on the last page.
+    """
+    limit = max(1, min(limit, STORE_PAGE_MAX))
+    if cursor:
+        query = {**query, "_id": {"$gt": _decode_cursor(cursor)}}
+    # _id is projected in only to build the next cursor.
+    docs = list(
+        collection.find(query, {**projection, "_id": 1})
+        .sort("_id", ASCENDING)
+        .limit(limit + 1)
+    )
+    next_cursor = _encode_cursor(docs[limit - 1]["_id"]) if len(docs) > limit else None
+    items = [{k: v for k, v in doc.items() if k != "_id"} for doc in docs[:limit]]
+    return items, next_cursor
+
+
+def iter_store_ndjson(collection, query: dict, projection: dict):
+    """Yields the matching items as NDJSON lines, one cursor batch in memory at a time."""
+    count = 0
+    for doc in collection.find(query, projection).sort("_id", ASCENDING).batch_size(STORE_EXPORT_BATCH):
+        count += 1
+        yield json.dumps(doc, default=str) + "\n"
+    logger.info(f"📤 Streamed {count} store items")
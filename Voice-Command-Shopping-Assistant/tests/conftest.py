@@ -0,0 +1,33 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# tests/conftest.py
+#
+# Mongo-backed tests use mongomock unless MONGO_TEST_URI points at a real
+# deployment (CI runs them against a single-node replica set, so the
+# transaction path in stock.run_grouped is exercised too). Everything else
+# runs against in-process fakes; no API keys or network needed.
+
+MONGO_TEST_URI = os.getenv("MONGO_TEST_URI")
+
+
+@pytest.fixture
+def mongo():
+    """(client, database) for one test; the database is dropped afterwards."""
+    if MONGO_TEST_URI:
+        from pymongo import MongoClient
+
+        client = MongoClient(MONGO_TEST_URI, serverSelectionTimeoutMS=10_000)
+    else:
+        import mongomock
+
+        client = mongomock.MongoClient()
+    try:
+        yield client, client["voice_shopping_test"]
+    finally:
+        client.drop_database("voice_shopping_test")
+        client.close()
@@ -0,0 +1,95 @@
+import asyncio
+import time
+import tracemalloc
+
+import pytest
+
+from audio_intake import AudioRejected, audio_digest, detect_audio_format, spool_audio
+
+WAV_HEADER = b"RIFF\x24\x00\x00\x00WAVEfmt "
+
+
+async def chunks(*parts):
+    for part in parts:
+        yield part
+
+
+def spool(*parts, **kwargs):
+    return asyncio.run(spool_audio(chunks(*parts), **kwargs))
+
+
+def test_detects_format_from_header():
+    assert detect_audio_format(WAV_HEADER) == "wav"
+    assert detect_audio_format(b"\x1a\x45\xdf\xa3" + b"\x00" * 8) == "webm"
+    assert detect_audio_format(b"OggS" + b"\x00" * 8) == "ogg"
+    assert detect_audio_format(b"<html><body>") is None
+
+
+def test_spools_audio_in_memory_then_to_disk():
+    audio = spool(WAV_HEADER, b"\x00" * 100, spool_bytes=1024)
+    assert (audio.size, audio.format) == (len(WAV_HEADER) + 100, "wav")
+    assert not audio.file._rolled
+    assert audio.file.read(4) == b"RIFF"
+    audio.file.close()
+
+    audio = spool(WAV_HEADER, b"\x00" * 4096, spool_bytes=1024)
+    assert audio.file._rolled
+    assert len(audio_digest(audio)) == 64 and audio.file.tell() == 0
+    audio.file.close()
+
+
+def test_rejects_oversized_upload_while_streaming():
+    with pytest.raises(AudioRejected) as e:
+        spool(WAV_HEADER, b"\x00" * 600, b"\x00" * 600, max_bytes=1000)
+    assert e.value.status_code == 413
+
+
+def test_rejects_non_audio_and_empty_bodies():
+    with pytest.raises(AudioRejected) as e:
+        spool(b"<html><body>", b"x" * 100)
+    assert e.value.status_code == 415
+    with pytest.raises(AudioRejected) as e:
+        spool(b"", b"")
+    assert e.value.status_code == 400
+
+
+MB = 1024 * 1024
+
+
+async def large_upload(total_bytes, chunk_bytes=64 * 1024, pulled=None):
+    """A WAV body of `total_bytes`, produced chunk by chunk like a request stream."""
+    yield WAV_HEADER
+    sent = len(WAV_HEADER)
+    while sent < total_bytes:
+        chunk = bytes(min(chunk_bytes, total_bytes - sent))
+        sent += len(chunk)
+        if pulled is not None:
+            pulled.append(len(chunk))
+        yield chunk
+
+
+def test_large_upload_memory_stays_near_the_spool_threshold():
+    spool_bytes = 1 * MB
+    tracemalloc.start()
+    try:
+        start = time.perf_counter()
+        audio = asyncio.run(spool_audio(large_upload(16 * MB), max_bytes=32 * MB, spool_bytes=spool_bytes))
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    try:
+        assert audio.size == 16 * MB and audio.file._rolled
+        # Peak is the in-memory spool plus its copy at rollover, not the upload.
+        assert peak < 3 * spool_bytes
+        assert elapsed < 5
+    finally:
+        audio.file.close()
+
+
+def test_large_upload_is_rejected_once_past_the_cap():
+    pulled = []
+    with pytest.raises(AudioRejected) as e:
+        asyncio.run(spool_audio(large_upload(16 * MB, pulled=pulled), max_bytes=4 * MB, spool_bytes=1 * MB))
+    assert e.value.status_code == 413
+    assert sum(pulled) <= 4 * MB + 64 * 1024  # stopped reading at the cap
@@ -0,0 +1,19 @@
+import numpy as np
+
+from embedding_cache import KEY_BYTES, DiskArena
+
+
+def key(i):
+    return i.to_bytes(KEY_BYTES, "big")
+
+
+def test_oversized_batch_keeps_the_arena_within_its_bound(tmp_path):
+    arena = DiskArena(str(tmp_path), max_items=10)
+    arena.put_many([(key(i), np.full(4, i, dtype="float32")) for i in range(3)])
+
+    evicted = arena.put_many([(key(i), np.full(4, i, dtype="float32")) for i in range(100, 125)])
+    assert len(arena.rows) == arena._keys_seen == 10
+    assert evicted == 15 + 3  # the batch's oldest 15, and everything already stored
+    found = arena.get_many([key(i) for i in range(100, 125)])
+    assert sorted(found) == [key(i) for i in range(115, 125)]
+    assert found[key(120)][0] == 120
@@ -0,0 +1,134 @@
+import time
+
+import numpy as np
+import pytest
+
+import embedding_service
+from embedding_service import EmbeddingQueueFull, EmbeddingService
+
+
+class SlowModel:
+    def encode(self, texts, convert_to_numpy=True):
+        time.sleep(0.1)
+        return np.zeros((len(texts), 4), dtype="float32")
+
+
+def test_stop_with_a_full_queue_does_not_hang(monkeypatch):
+    monkeypatch.setattr(embedding_service, "_load_model", lambda name: SlowModel())
+    service = EmbeddingService("test", workers=0, max_batch=2, wait_ms=1, queue_max=4)
+    service.start()
+    futures = []
+    with pytest.raises(EmbeddingQueueFull):
+        for _ in range(20):
+            futures.append(service.submit(["milk"]))
+
+    start = time.perf_counter()
+    service.stop()
+    assert time.perf_counter() - start < 1
+    # Everything queued is answered: encoded, or failed because the service stopped.
+    assert all(f.done() for f in futures)
+    assert any(isinstance(f.exception(), RuntimeError) for f in futures)
+    assert service.encode(["milk"]).shape == (1, 4)  # stopped: encodes in-process
+
+
+class RecordingModel:
+    """Encodes each text as [len(text)] and records every batch it saw."""
+
+    def __init__(self):
+        self.batches = []
+
+    def encode(self, texts, convert_to_numpy=True):
+        self.batches.append(list(texts))
+        time.sleep(0.02)
+        return np.array([[len(t)] for t in texts], dtype="float32")
+
+
+class FailingModel:
+    def encode(self, texts, convert_to_numpy=True):
+        raise ValueError("model crashed")
+
+
+def test_concurrent_requests_share_one_batch_and_get_their_own_rows(monkeypatch):
+    model = RecordingModel()
+    monkeypatch.setattr(embedding_service, "_load_model", lambda name: model)
+    service = EmbeddingService("test", workers=0, max_batch=16, wait_ms=100, queue_max=16)
+    service.start()
+    try:
+        requests = [["a"], ["bb", "ccc"], ["dddd"]]
+        futures = [service.submit(texts) for texts in requests]
+        results = [f.result(timeout=2) for f in futures]
+    finally:
+        service.stop()
+
+    assert model.batches == [["a", "bb", "ccc", "dddd"]]
+    assert [r[:, 0].tolist() for r in results] == [[1], [2, 3], [4]]
+    assert service.stats()["batches"] == 1
+
+
+def test_failing_encode_fails_every_waiting_caller(monkeypatch):
+    monkeypatch.setattr(embedding_service, "_load_model", lambda name: FailingModel())
+    service = EmbeddingService("test", workers=0, max_batch=16, wait_ms=50, queue_max=16)
+    service.start()
+    try:
+        futures = [service.submit(["milk"]), service.submit(["eggs"])]
+        for future in futures:
+            with pytest.raises(ValueError):
+                future.result(timeout=2)
+    finally:
+        service.stop()
+
+
+def test_dispatch_error_does_not_kill_the_collector(monkeypatch):
+    model = RecordingModel()
+    monkeypatch.setattr(embedding_service, "_load_model", lambda name: model)
+    service = EmbeddingService("test", workers=0, max_batch=16, wait_ms=1, queue_max=16)
+    real_encode_now = service._encode_now
+    calls = []
+
+    def flaky_encode_now(texts):
+        calls.append(texts)
+        if len(calls) == 1:
+            raise RuntimeError("pool broken")
+        return real_encode_now(texts)
+
+    monkeypatch.setattr(service, "_encode_now", flaky_encode_now)
+    service.start()
+    try:
+        with pytest.raises(RuntimeError, match="pool broken"):
+            service.encode(["milk"], timeout=2)
+        assert service._collector.is_alive()
+        assert service.encode(["eggs"], timeout=2)[:, 0].tolist() == [4]
+    finally:
+        service.stop()
+
+
+def test_broken_pool_is_replaced(monkeypatch):
+    class BrokenPool:
+        def submit(self, fn, *args):
+            raise embedding_service.BrokenProcessPool("worker died")
+
+        def shutdown(self, wait=True, cancel_futures=False):
+            pass
+
+    class WorkingPool(BrokenPool):
+        def submit(self, fn, *args):
+            future = embedding_service.Future()
+            future.set_result(np.zeros((len(args[0]), 4), dtype="float32"))
+            return future
+
+    service = EmbeddingService("test", workers=1)
+    service._pool = BrokenPool()
+    monkeypatch.setattr(service, "_new_pool", WorkingPool)
+    assert service.encode(["milk"], timeout=2).shape == (1, 4)
+    assert isinstance(service._pool, WorkingPool)
+
+
+def test_encode_times_out_instead_of_hanging(monkeypatch):
+    monkeypatch.setattr(embedding_service, "_load_model", lambda name: SlowModel())
+    service = EmbeddingService("test", workers=0, max_batch=16, wait_ms=1, queue_max=16)
+    service.start()
+    try:
+        with pytest.raises(TimeoutError):
+            service.encode(["milk"], timeout=0.01)
+    finally:
+        service.stop()
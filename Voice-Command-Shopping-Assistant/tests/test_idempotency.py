@@ -0,0 +1,42 @@
+import pytest
+from pymongo.errors import AutoReconnect
+
+import idempotency
+from idempotency import IdempotencyStore
+
+
+class FlakyCollection:
+    """Fails the first `failures` update_one calls, like a primary stepping down."""
+
+    def __init__(self, collection, failures):
+        self._collection = collection
+        self.failures = failures
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+    def update_one(self, *args, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            raise AutoReconnect("primary stepped down")
+        return self._collection.update_one(*args, **kwargs)
+
+
+def test_complete_is_retried_so_the_claim_cannot_be_taken_over(mongo, monkeypatch):
+    _, db = mongo
+    monkeypatch.setattr(idempotency.time, "sleep", lambda seconds: None)
+    store = IdempotencyStore(FlakyCollection(db.idempotency, failures=2), lease_seconds=0)
+
+    assert store.claim("update_wishlist:bob", "key-1", "fp") is None
+    store.complete("update_wishlist:bob", "key-1", 200, {"message": "added"})
+    # The lease has run out: an unfinished claim would be taken over here.
+    assert store.claim("update_wishlist:bob", "key-1", "fp") == (200, {"message": "added"})
+
+
+def test_complete_gives_up_after_its_attempts(mongo, monkeypatch):
+    _, db = mongo
+    monkeypatch.setattr(idempotency.time, "sleep", lambda seconds: None)
+    store = IdempotencyStore(FlakyCollection(db.idempotency, failures=10))
+    store.claim("update_wishlist:bob", "key-1", "fp")
+    with pytest.raises(AutoReconnect):
+        store.complete("update_wishlist:bob", "key-1", 200, {}, attempts=3)
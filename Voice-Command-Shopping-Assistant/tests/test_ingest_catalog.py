@@ -0,0 +1,18 @@
+from ingest_catalog import name_collisions
+
+
+def test_sku_mode_flags_names_shared_by_two_skus(mongo):
+    _, db = mongo
+    db.store.insert_many([
+        {"product": "Milk", "name_key": "milk", "sku": "M-1"},
+        {"product": "Bread", "name_key": "bread"},  # from before SKUs
+    ])
+    rows = [
+        {"product": "Milk", "sku": "M-1"},
+        {"product": "Eggs", "sku": "E-1"},
+        {"product": "eggs", "sku": "E-2"},
+        {"product": "Bread", "sku": "B-1"},
+        {"product": "Cheese", "sku": "C-1"},
+    ]
+    collisions = name_collisions(rows, db.store, batch_size=2)
+    assert collisions == {"eggs": {"E-1", "E-2"}, "bread": {"B-1", None}}
@@ -0,0 +1,46 @@
+import asyncio
+
+from parse_cache import MemoryBackend, ParseCache
+
+COMMAND = {"product": "milk", "quantity": 2, "category": "dairy", "action": "add", "status": "ai_generated"}
+
+
+def test_identical_commands_share_one_parse():
+    cache = ParseCache(MemoryBackend())
+    calls = []
+
+    async def parse(text):
+        calls.append(text)
+        await asyncio.sleep(0.01)
+        return dict(COMMAND)
+
+    async def scenario():
+        results = await asyncio.gather(*[cache.get_or_parse(t, parse) for t in ("add two milk", "Add 2 milk.", "add two milk")])
+        assert all(r == COMMAND for r in results)
+        assert await cache.get_or_parse("add 2 milk", parse) == COMMAND
+
+    asyncio.run(scenario())
+    assert len(calls) == 1
+    assert (cache.counters["misses"], cache.counters["coalesced"], cache.counters["hits"]) == (1, 2, 1)
+
+
+def test_cancelled_leader_hands_the_parse_to_a_waiter():
+    cache = ParseCache(MemoryBackend())
+    calls = []
+
+    async def parse(text):
+        calls.append(text)
+        await asyncio.sleep(0.05)
+        return dict(COMMAND)
+
+    async def scenario():
+        leader = asyncio.create_task(cache.get_or_parse("add two milk", parse))
+        await asyncio.sleep(0.01)
+        waiters = [asyncio.create_task(cache.get_or_parse("add two milk", parse)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()  # e.g. the client disconnected
+        assert await asyncio.gather(*waiters) == [COMMAND] * 3
+        assert leader.cancelled()
+
+    asyncio.run(scenario())
+    assert len(calls) == 2  # the cancelled parse, then one retry for all waiters
@@ -0,0 +1,23 @@
+from recommendations import RecommendationCache
+
+
+def test_put_after_invalidate_is_dropped():
+    cache = RecommendationCache(ttl=60, max_users=10)
+    generation = cache.generation("alice")  # request starts reading the wishlist
+    cache.invalidate("alice")  # ...which another request changes meanwhile
+    cache.put("alice", 1, ["stale"], generation)
+    assert cache.get("alice", 1) is None
+
+    cache.put("alice", 1, ["fresh"], cache.generation("alice"))
+    assert cache.get("alice", 1) == ["fresh"]
+    assert cache.get("alice", 2) is None  # catalog moved on
+
+
+def test_forgotten_invalidations_still_drop_stale_puts():
+    cache = RecommendationCache(ttl=60, max_users=2)
+    generation = cache.generation("alice")
+    cache.invalidate("alice")
+    cache.invalidate("bob")
+    cache.invalidate("carol")  # evicts alice's invalidation
+    cache.put("alice", 1, ["stale"], generation)
+    assert cache.get("alice", 1) is None
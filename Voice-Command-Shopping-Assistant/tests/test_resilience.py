@@ -0,0 +1,208 @@
+import asyncio
+import socket
+import threading
+import time
+from types import SimpleNamespace
+
+import httpx
+import pytest
+import uvicorn
+
+import groq_client
+import resilience
+from resilience import (
+    CircuitBreaker, CircuitOpen, DeadlineExceeded, UpstreamUnavailable, current_deadline, db_cleanup,
+    request_deadline,
+)
+
+COMPLETION = {"choices": [{"message": {"content": '{"product": "milk"}'}}]}
+
+
+class Boom(Exception):
+    pass
+
+
+def test_breaker_opens_and_fails_fast():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_seconds=0.05)
+    calls = []
+
+    async def failing():
+        calls.append(1)
+        raise Boom()
+
+    async def ok():
+        return "ok"
+
+    async def scenario():
+        for _ in range(2):
+            with pytest.raises(Boom):
+                await breaker.call(failing)
+        assert breaker.state == "open"
+        with pytest.raises(CircuitOpen):
+            await breaker.call(failing)
+        assert len(calls) == 2  # rejected without calling the upstream
+
+        await asyncio.sleep(0.06)
+        assert await breaker.call(ok) == "ok"  # the half-open probe
+        assert breaker.state == "closed"
+
+    asyncio.run(scenario())
+    assert breaker.stats()["opened"] == 1 and breaker.stats()["rejected"] == 1
+
+
+def test_deadline_exceeded_neither_closes_nor_trips_the_breaker():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_seconds=0)
+    breaker.state = "open"
+
+    async def out_of_time():
+        raise DeadlineExceeded("request deadline exceeded")
+
+    async def scenario():
+        for _ in range(3):
+            with pytest.raises(DeadlineExceeded):
+                await breaker.call(out_of_time)
+            assert breaker.state == "half_open"  # no probe reached the upstream
+        assert await breaker.call(lambda: asyncio.sleep(0, "ok")) == "ok"
+        assert breaker.state == "closed"
+
+    asyncio.run(scenario())
+    assert breaker.stats()["opened"] == 0
+
+
+@pytest.fixture
+def groq(monkeypatch):
+    """Routes Groq calls to `handler` (set by the test) with a fresh breaker and fast backoff."""
+    state = {"handler": None, "requests": 0}
+
+    async def handle(request):
+        state["requests"] += 1
+        return await state["handler"](state["requests"])
+
+    monkeypatch.setattr(resilience, "UPSTREAM_RETRY_BASE_DELAY", 0.001)
+    monkeypatch.setattr(groq_client, "groq_breaker", CircuitBreaker("Groq", failure_threshold=2))
+    monkeypatch.setattr(groq_client, "groq_latency", resilience.LatencyTracker())
+    monkeypatch.setattr(groq_client, "groq_counters", {"hedged": 0, "hedge_wins": 0})
+    monkeypatch.setattr(groq_client, "get_http_client",
+                        lambda: httpx.AsyncClient(transport=httpx.MockTransport(handle)))
+    return state
+
+
+def test_retries_transient_groq_errors(groq):
+    async def handler(n):
+        if n == 1:
+            raise httpx.ConnectError("connection reset")
+        if n == 2:
+            return httpx.Response(503)
+        return httpx.Response(200, json=COMPLETION)
+
+    groq["handler"] = handler
+    assert asyncio.run(groq_client.process_command("add milk")) == {"product": "milk"}
+    assert groq["requests"] == 3
+    assert groq_client.groq_breaker.state == "closed"
+
+
+def test_groq_outage_opens_the_breaker(groq):
+    async def handler(n):
+        return httpx.Response(500)
+
+    groq["handler"] = handler
+    for _ in range(2):
+        with pytest.raises(UpstreamUnavailable):
+            asyncio.run(groq_client.process_command("add milk"))
+    sent = groq["requests"]
+    with pytest.raises(CircuitOpen):
+        asyncio.run(groq_client.process_command("add milk"))
+    assert groq["requests"] == sent
+
+
+def test_hedged_request_wins_over_a_stalled_one(groq, monkeypatch):
+    monkeypatch.setattr(groq_client, "GROQ_HEDGE", True)
+    monkeypatch.setattr(groq_client, "GROQ_HEDGE_MIN_DELAY_MS", 20)
+    for _ in range(groq_client.groq_latency.min_samples):
+        groq_client.groq_latency.record(0.01)
+
+    async def handler(n):
+        if n == 1:
+            await asyncio.sleep(5)  # stalled
+        return httpx.Response(200, json=COMPLETION)
+
+    groq["handler"] = handler
+    start = time.perf_counter()
+    assert asyncio.run(groq_client.process_command("add milk")) == {"product": "milk"}
+    assert time.perf_counter() - start < 1
+    assert groq_client.groq_counters == {"hedged": 1, "hedge_wins": 1}
+
+
+@pytest.fixture
+def stub_groq(monkeypatch):
+    """benchmarks/stub_upstreams.py served on a local port; Groq calls go to it over real HTTP."""
+    from benchmarks import stub_upstreams
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(stub_upstreams.app, host="127.0.0.1", port=port, log_level="warning",
+                                           timeout_graceful_shutdown=0.5))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+
+    url = f"http://127.0.0.1:{port}"
+    monkeypatch.setattr(stub_upstreams, "FAULTS", {**stub_upstreams.FAULTS, "groq_latency_ms": 5})
+    monkeypatch.setattr(resilience, "UPSTREAM_RETRY_BASE_DELAY", 0.001)
+    monkeypatch.setattr(groq_client, "GROQ_API_URL", f"{url}/openai/v1/chat/completions")
+    monkeypatch.setattr(groq_client, "groq_breaker", CircuitBreaker("Groq", failure_threshold=2, reset_seconds=0.1))
+    monkeypatch.setattr(groq_client, "groq_latency", resilience.LatencyTracker())
+    monkeypatch.setattr(groq_client, "groq_counters", {"hedged": 0, "hedge_wins": 0})
+    monkeypatch.setattr(groq_client, "get_http_client", lambda: httpx.AsyncClient())
+
+    def set_faults(**faults):
+        reset = {"groq_error_rate": 0, "groq_stall_rate": 0}
+        httpx.post(f"{url}/_faults", json={**reset, **faults}).raise_for_status()
+
+    yield set_faults
+    server.should_exit = True
+    thread.join(timeout=5)
+
+
+def test_stub_outage_opens_the_breaker_and_recovery_closes_it(stub_groq):
+    stub_groq(groq_error_rate=1)
+    for _ in range(2):
+        with pytest.raises(UpstreamUnavailable):
+            asyncio.run(groq_client.process_command("add milk"))
+    assert groq_client.groq_breaker.state == "open"
+    start = time.perf_counter()
+    with pytest.raises(CircuitOpen):
+        asyncio.run(groq_client.process_command("add milk"))
+    assert time.perf_counter() - start < 0.05  # failed fast, no request sent
+
+    stub_groq(groq_error_rate=0)
+    time.sleep(0.15)
+    assert asyncio.run(groq_client.process_command("add milk"))["product"] == "Milk"
+    assert groq_client.groq_breaker.state == "closed"
+
+
+def test_stub_stalls_are_hedged(stub_groq, monkeypatch):
+    from benchmarks import stub_upstreams
+
+    monkeypatch.setattr(groq_client, "GROQ_HEDGE", True)
+    monkeypatch.setattr(groq_client, "GROQ_HEDGE_MIN_DELAY_MS", 20)
+    for _ in range(groq_client.groq_latency.min_samples):
+        groq_client.groq_latency.record(0.01)
+    stub_groq(groq_stall_rate=0.5, groq_stall_ms=5000)
+    # The stub draws twice per request (error, then stall): stall only the first.
+    draws = iter([0.9, 0.0] + [0.9] * 10)
+    monkeypatch.setattr(stub_upstreams, "random", SimpleNamespace(random=lambda: next(draws)))
+
+    start = time.perf_counter()
+    assert asyncio.run(groq_client.process_command("add milk"))["product"] == "Milk"
+    assert time.perf_counter() - start < 1
+    assert groq_client.groq_counters == {"hedged": 1, "hedge_wins": 1}
+
+
+def test_cleanup_gets_its_own_budget_after_the_deadline():
+    with request_deadline(0.01):
+        time.sleep(0.02)
+        assert current_deadline().remaining() == 0
+        assert db_cleanup(lambda: current_deadline().remaining(), seconds=5) > 4
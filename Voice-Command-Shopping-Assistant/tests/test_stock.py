@@ -0,0 +1,126 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from benchmarks.stock_contention import legacy_add
+from stock import InsufficientStock, ProductNotFound, release, reserve, run_grouped, transactions_supported
+from wishlist import add_item, ensure_user_indexes
+
+
+@pytest.fixture
+def store(mongo):
+    client, db = mongo
+    db.store.insert_one({"product": "Milk", "name_key": "milk", "category": "dairy", "quantity": 20})
+    ensure_user_indexes(db.users)
+    return client, db
+
+
+def add(client, db, username, quantity):
+    """The add flow from main.py: reserve, then write the wishlist entry, as one group."""
+    reserved = {}
+
+    def operation(session):
+        item = reserve(db.store, "milk", quantity, session)
+        reserved["item"] = item
+        add_item(db.users, username, {"product": item["product"], "name_key": item["name_key"],
+                                      "quantity": quantity}, session=session)
+        return item
+
+    def compensate():
+        if "item" in reserved:
+            release(db.store, reserved["item"]["name_key"], quantity)
+
+    try:
+        run_grouped(client, operation, compensate)
+        return True
+    except InsufficientStock:
+        return False
+
+
+def listed_units(db):
+    return sum(e["quantity"] for user in db.users.find() for e in user.get("wishlist", []))
+
+
+def test_reserve_decrements_and_reports_shortfall(store):
+    _, db = store
+    assert reserve(db.store, "milk", 5)["quantity"] == 15
+    with pytest.raises(InsufficientStock) as e:
+        reserve(db.store, "milk", 16)
+    assert e.value.available == 15
+    with pytest.raises(ProductNotFound):
+        reserve(db.store, "bread", 1)
+    assert db.store.find_one({"name_key": "milk"})["quantity"] == 15
+
+
+def test_concurrent_adds_never_exceed_stock(store):
+    client, db = store
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        accepted = sum(pool.map(lambda i: add(client, db, f"user{i % 8}", 1), range(60)))
+    assert accepted == 20
+    assert db.store.find_one({"name_key": "milk"})["quantity"] == 0
+    assert listed_units(db) == 20
+
+
+def test_concurrent_adds_from_coroutines_never_exceed_stock(store):
+    client, db = store
+
+    async def hammer():
+        # How the routes call it: many coroutines, each add in the threadpool.
+        return await asyncio.gather(*[asyncio.to_thread(add, client, db, f"user{i % 8}", 1) for i in range(60)])
+
+    assert sum(asyncio.run(hammer())) == 20
+    assert db.store.find_one({"name_key": "milk"})["quantity"] == 0
+    assert listed_units(db) == 20
+
+
+class CountingCollection:
+    """Counts the operations (round trips) sent through a collection."""
+
+    def __init__(self, collection, counts):
+        self._collection = collection
+        self._counts = counts
+
+    def __getattr__(self, name):
+        method = getattr(self._collection, name)
+
+        def counted(*args, **kwargs):
+            self._counts.append(name)
+            return method(*args, **kwargs)
+        return counted
+
+
+def test_reservation_takes_fewer_round_trips_than_check_then_decrement(store):
+    client, db = store
+    counts = []
+    db.users.insert_one({"username": "bob", "wishlist": [{"product": "Milk", "name_key": "milk", "quantity": 1}]})
+
+    legacy_db = type("Db", (), {"store": CountingCollection(db.store, counts),
+                                "users": CountingCollection(db.users, counts)})
+    assert legacy_add(legacy_db, "alice", 1)
+    legacy = len(counts)
+
+    counts.clear()
+    item = reserve(CountingCollection(db.store, counts), "milk", 1)
+    add_item(CountingCollection(db.users, counts), "bob", {"product": item["product"], "quantity": 1})
+    assert counts == ["find_one_and_update", "update_one"]
+    assert (legacy, len(counts)) == (3, 2)
+
+
+def test_failed_user_write_returns_the_stock(store):
+    client, db = store
+    compensated = []
+
+    def operation(session):
+        reserve(db.store, "milk", 3, session)
+        raise RuntimeError("user write failed")
+
+    def compensate():
+        compensated.append(True)
+        release(db.store, "milk", 3)
+
+    with pytest.raises(RuntimeError):
+        run_grouped(client, operation, compensate)
+    assert db.store.find_one({"name_key": "milk"})["quantity"] == 20
+    # A transaction rolls the reservation back by itself.
+    assert compensated == ([] if transactions_supported(client) else [True])
@@ -0,0 +1,104 @@
+import threading
+
+import mongomock
+from pymongo.errors import AutoReconnect, OperationFailure
+
+import store_index
+from store_index import WATCH_PIPELINE, StoreIndex
+
+
+def test_watch_pipeline_drops_stock_only_updates():
+    events = mongomock.MongoClient().db.events
+    events.insert_many([
+        {"_id": "insert", "operationType": "insert"},
+        {"_id": "delete", "operationType": "delete"},
+        {"_id": "rename", "operationType": "update",
+         "updateDescription": {"updatedFields": {"product": "Oat Milk"}, "removedFields": []}},
+        {"_id": "uncategorize", "operationType": "update",
+         "updateDescription": {"updatedFields": {}, "removedFields": ["category"]}},
+        {"_id": "reserve", "operationType": "update",
+         "updateDescription": {"updatedFields": {"quantity": 3, "modified": 1}, "removedFields": []}},
+    ])
+    kept = [e["_id"] for e in events.aggregate(WATCH_PIPELINE)]
+    assert kept == ["insert", "delete", "rename", "uncategorize"]
+
+
+class FakeStream:
+    def __init__(self, index, changes):
+        self.index, self.changes = index, list(changes)
+        self.resume_token = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def try_next(self):
+        if not self.changes:
+            self.index._stop.set()
+            return None
+        change = self.changes.pop(0)
+        self.resume_token = {"_data": change["documentKey"]["_id"]}
+        return change
+
+
+class FakeCollection:
+    """watch() raises each of `errors` in turn, then streams `changes`."""
+
+    def __init__(self, errors, changes=()):
+        self.errors, self.changes = list(errors), changes
+        self.calls = []
+        self.index = None
+
+    def watch(self, pipeline, full_document=None, resume_after=None):
+        self.calls.append(resume_after)
+        if self.errors:
+            raise self.errors.pop(0)
+        return FakeStream(self.index, self.changes)
+
+
+def index_over(collection, tmp_path):
+    index = StoreIndex(collection, encode=None, model_name="test", index_dir=str(tmp_path))
+    collection.index = index
+    applied, synced = [], []
+    index._apply_change = lambda change: applied.append(change["documentKey"]["_id"]) or False
+    index.sync = lambda: synced.append(True) or False
+    return index, applied, synced
+
+
+def run_watch(index):
+    thread = threading.Thread(target=index._watch, daemon=True)
+    thread.start()
+    thread.join(timeout=5)
+    assert not thread.is_alive()
+
+
+def test_transient_errors_reopen_the_stream(tmp_path, monkeypatch):
+    monkeypatch.setattr(store_index, "STORE_INDEX_WATCH_BACKOFF_SECONDS", 0.01)
+    change = {"operationType": "insert", "documentKey": {"_id": "milk"}}
+    collection = FakeCollection([AutoReconnect("primary stepped down"), AutoReconnect("still down")], [change])
+    index, applied, synced = index_over(collection, tmp_path)
+    index.save = lambda: None
+
+    run_watch(index)
+    assert len(collection.calls) == 3
+    assert applied == ["milk"]
+    assert synced  # caught up on the gap before the stream opened
+
+
+def test_standalone_server_falls_back_to_polling(tmp_path, monkeypatch):
+    monkeypatch.setattr(store_index, "STORE_INDEX_POLL_SECONDS", 0.01)
+    error = OperationFailure("The $changeStream stage is only supported on replica sets", code=40573)
+    collection = FakeCollection([error])
+    index, _, synced = index_over(collection, tmp_path)
+
+    def sync():
+        synced.append(True)
+        index._stop.set()
+        return False
+
+    index.sync = sync
+    run_watch(index)
+    assert collection.calls == [None]
+    assert synced == [True]
@@ -0,0 +1,40 @@
+import os
+
+import pytest
+
+from stock import release, reserve
+from store_listing import catalog_etag, etag_matches, ensure_store_indexes
+
+
+def test_etag_matching():
+    assert etag_matches('"a-1"', '"a-1"')
+    assert etag_matches('W/"a-1", "b-2"', '"a-1"')
+    assert etag_matches("*", '"a-1"')
+    assert not etag_matches('"a-2"', '"a-1"')
+    assert not etag_matches(None, '"a-1"')
+
+
+# mongomock can't sort BSON Timestamps; CI runs this against a replica set.
+@pytest.mark.skipif(not os.getenv("MONGO_TEST_URI"), reason="needs a real MongoDB (MONGO_TEST_URI)")
+def test_etag_follows_writes_from_any_client(mongo):
+    from pymongo import MongoClient
+
+    client, db = mongo
+    ensure_store_indexes(db.store)
+    db.store.insert_many([{"product": "Milk", "name_key": "milk", "quantity": 5},
+                          {"product": "Bread", "name_key": "bread", "quantity": 5}])
+    other = MongoClient(os.getenv("MONGO_TEST_URI"))[db.name].store  # another worker
+    tags = [catalog_etag(db.store)]
+
+    reserve(db.store, "milk", 1)
+    tags.append(catalog_etag(db.store))
+    assert catalog_etag(other) == tags[-1]
+
+    release(db.store, "bread", 1)
+    release(db.store, "milk", 1)
+    tags.append(catalog_etag(db.store))
+
+    db.store.delete_one({"name_key": "bread"})
+    tags.append(catalog_etag(db.store))
+    assert len(set(tags)) == len(tags)
+    other.database.client.close()
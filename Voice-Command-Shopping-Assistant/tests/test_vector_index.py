@@ -0,0 +1,24 @@
+import numpy as np
+
+import vector_index
+from vector_index import VectorIndex
+
+
+def test_ivfpq_rebuild_retrains_from_source_vectors(monkeypatch):
+    monkeypatch.setattr(vector_index, "STORE_INDEX_IVF_MIN_TRAIN", 500)
+    vectors = np.random.default_rng(0).standard_normal((1500, 16)).astype("float32")
+    requested = []
+
+    def source(labels):
+        requested.append(list(labels))
+        return vectors[labels]
+
+    index = VectorIndex(16, "ivfpq", source=source)
+    index.add(vectors, np.arange(1500), np.zeros(1500))
+    assert index.built_kind == "ivfpq" and not requested  # trained on the vectors it was given
+
+    index.remove(np.arange(1000, 1500))  # past the tombstone fraction: rebuild
+    assert requested == [list(range(1000))]
+    assert len(index.labels) == index.ntotal == 1000
+    _, labels = index.search(vectors[:1], 1)
+    assert labels[0, 0] == 0
@@ -0,0 +1,147 @@
+import asyncio
+
+import numpy as np
+
+from resilience import current_deadline
+from voice_stream import Endpointer, run_voice_stream
+
+FRAME_SAMPLES = 320  # 20 ms at 16 kHz
+SPEECH = np.full(FRAME_SAMPLES, 4000, dtype="<i2").tobytes()
+SILENCE = bytes(FRAME_SAMPLES * 2)
+
+
+def test_endpointer_ends_after_trailing_silence():
+    endpointer = Endpointer(end_silence_ms=200, speech_rms=500, max_seconds=15)
+    assert not any(endpointer.feed(SILENCE) for _ in range(50))  # no speech yet
+    assert not any(endpointer.feed(SPEECH) for _ in range(10))
+    assert not any(endpointer.feed(SILENCE) for _ in range(9))
+    assert endpointer.feed(SILENCE)
+    assert endpointer.speech_seen
+
+
+def test_endpointer_caps_utterance_length():
+    endpointer = Endpointer(end_silence_ms=200, speech_rms=500, max_seconds=1)
+    ended = [endpointer.feed(SPEECH) for _ in range(50)]
+    assert ended.index(True) == 49
+
+
+class FakeWebSocket:
+    def __init__(self, frames):
+        self.inbound = asyncio.Queue()
+        for frame in frames:
+            self.inbound.put_nowait({"type": "websocket.receive", "bytes": frame})
+        self.sent = []
+
+    async def accept(self):
+        pass
+
+    async def receive(self):
+        return await self.inbound.get()
+
+    async def send_json(self, message):
+        self.sent.append(message)
+
+    async def close(self):
+        pass
+
+
+class FakeSession:
+    """ASR session that has heard `partial` by the end of speech and settles on `final`."""
+
+    def __init__(self, partial, final):
+        self.partial, self.final = partial, final
+        self.events = asyncio.Queue()
+        self.frames = 0
+        self.closed = False
+
+    async def start(self):
+        pass
+
+    async def feed(self, pcm):
+        self.frames += 1
+        if self.frames == 5:
+            self.events.put_nowait(("partial", self.partial))
+
+    async def end_utterance(self):
+        await asyncio.sleep(0.05)  # backend settling the final transcript
+        self.events.put_nowait(("final", self.final))
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeTranscriber:
+    def __init__(self, session):
+        self.session = session
+
+    def open_stream(self):
+        return self.session
+
+
+def stream(partial, final):
+    session = FakeSession(partial, final)
+    websocket = FakeWebSocket([SPEECH] * 10 + [SILENCE] * 40)
+    calls = []
+
+    async def interpret(text):
+        calls.append(text)
+        await asyncio.sleep(0.02)
+        return {"product": text}
+
+    asyncio.run(run_voice_stream(websocket, FakeTranscriber(session), interpret))
+    assert session.closed
+    return websocket.sent, calls
+
+
+def test_early_parse_is_used_when_final_matches():
+    sent, calls = stream("add two milk", "Add 2 milk.")
+    assert [m["type"] for m in sent] == ["ready", "partial", "transcript", "result"]
+    assert calls == ["add two milk"]
+    assert sent[-1] == {"type": "result", "recognized_text": "Add 2 milk.", "llm_response": {"product": "add two milk"}}
+
+
+def test_final_transcript_is_parsed_when_it_differs():
+    sent, calls = stream("add two milk", "add two mangoes")
+    assert calls == ["add two milk", "add two mangoes"]
+    assert sent[-1]["llm_response"] == {"product": "add two mangoes"}
+
+
+def test_stream_runs_under_a_request_deadline():
+    session = FakeSession("add milk", "add milk")
+    websocket = FakeWebSocket([SPEECH] * 10 + [SILENCE] * 40)
+    budgets = []
+
+    async def interpret(text):
+        budgets.append(current_deadline().seconds)
+        return {"product": text}
+
+    asyncio.run(run_voice_stream(websocket, FakeTranscriber(session), interpret, deadline_seconds=3))
+    assert budgets == [3]
+
+
+def run(websocket, session, interpret=None):
+    async def echo(text):
+        return {"product": text}
+
+    asyncio.run(run_voice_stream(websocket, FakeTranscriber(session), interpret or echo))
+    assert session.closed
+    return websocket.sent
+
+
+def test_client_stop_ends_the_utterance():
+    websocket = FakeWebSocket([SPEECH] * 6)
+    websocket.inbound.put_nowait({"type": "websocket.receive", "text": '{"type": "stop"}'})
+    sent = run(websocket, FakeSession("add milk", "add milk"))
+    assert sent[-1]["type"] == "result"
+
+
+def test_malformed_frame_is_an_error():
+    sent = run(FakeWebSocket([SPEECH, b"\x00" * 3]), FakeSession("add milk", "add milk"))
+    assert sent[-1]["type"] == "error" and "PCM16" in sent[-1]["detail"]
+
+
+def test_disconnect_mid_utterance_sends_no_result():
+    websocket = FakeWebSocket([SPEECH] * 3)
+    websocket.inbound.put_nowait({"type": "websocket.disconnect"})
+    sent = run(websocket, FakeSession("add milk", "add milk"))
+    assert [m["type"] for m in sent] == ["ready"]
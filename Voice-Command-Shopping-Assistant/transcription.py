@@ -0,0 +1,407 @@
+import asyncio
+import io
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import httpx
+import numpy as np
+from dotenv import load_dotenv
+from starlette.concurrency import run_in_threadpool
+
+from metrics import upstream_requests
+from resilience import CircuitBreaker, DeadlineExceeded, UpstreamUnavailable, current_deadline, retry
+from upstream import run_asr
+
+# transcription.py
+#
+# Speech-to-text backends for the voice pipeline. TRANSCRIPTION_BACKEND
+# picks one:
+#   assemblyai  upload + poll through the AssemblyAI SDK (default)
+#   local       faster-whisper (CTranslate2, int8-quantized Whisper) on the
+#               CPU, no network round trip. The model is loaded once per
+#               worker process of a dedicated pool, so decoding never holds
+#               up the event loop or the API's threads. Needs
+#               `pip install faster-whisper`; TRANSCRIPTION_LOCAL_MODEL is a
+#               model size ("tiny.en", "base.en", ...) or a local model dir.
+#
+# Both take an audio_intake.AudioUpload, return the transcript text and
+# raise TranscriptionError when the audio can't be transcribed, or
+# resilience.UpstreamUnavailable / DeadlineExceeded when the engine can't
+# answer in time. Calls are bounded by the request deadline; AssemblyAI
+# calls are also retried on transport errors / 429 / 5xx behind a circuit
+# breaker.
+#
+# For the WebSocket endpoint each backend also opens streaming sessions
+# (open_stream()): raw 16 kHz PCM16 frames go in, ("partial", text),
+# ("final", text) and ("error", detail) events come out of session.events.
+#   assemblyai  AssemblyAI's streaming API (turn-based, partials as the
+#               words arrive; ASSEMBLYAI_STREAMING_HOST overrides the host)
+#   local       re-decodes the buffered audio every
+#               TRANSCRIPTION_STREAM_PARTIAL_MS of new audio for partials,
+#               and once more for the final transcript
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+TRANSCRIPTION_BACKEND = os.getenv("TRANSCRIPTION_BACKEND", "assemblyai").lower()
+TRANSCRIPTION_LANGUAGE = "en"
+TRANSCRIPTION_LOCAL_MODEL = os.getenv("TRANSCRIPTION_LOCAL_MODEL", "base.en")
+TRANSCRIPTION_LOCAL_COMPUTE_TYPE = os.getenv("TRANSCRIPTION_LOCAL_COMPUTE_TYPE", "int8")
+TRANSCRIPTION_LOCAL_WORKERS = int(os.getenv("TRANSCRIPTION_LOCAL_WORKERS", "1"))
+TRANSCRIPTION_LOCAL_THREADS = int(os.getenv("TRANSCRIPTION_LOCAL_THREADS", "2"))  # per worker
+TRANSCRIPTION_LOCAL_BEAM_SIZE = int(os.getenv("TRANSCRIPTION_LOCAL_BEAM_SIZE", "1"))
+TRANSCRIPTION_STREAM_PARTIAL_MS = int(os.getenv("TRANSCRIPTION_STREAM_PARTIAL_MS", "800"))
+ASSEMBLYAI_STREAMING_HOST = os.getenv("ASSEMBLYAI_STREAMING_HOST", "streaming.assemblyai.com")
+ASSEMBLYAI_TIMEOUT_SECONDS = float(os.getenv("ASSEMBLYAI_TIMEOUT_SECONDS", "15"))  # upload + poll
+ASSEMBLYAI_HTTP_TIMEOUT_SECONDS = float(os.getenv("ASSEMBLYAI_HTTP_TIMEOUT_SECONDS", "10"))  # per HTTP call
+
+# Streaming sessions take raw little-endian 16-bit mono PCM at this rate.
+STREAM_SAMPLE_RATE = 16000
+STREAM_BYTES_PER_MS = STREAM_SAMPLE_RATE * 2 // 1000
+
+BACKENDS = ("assemblyai", "local")
+
+
+class TranscriptionError(Exception):
+    pass
+
+
+class _BackendStats:
+    def __init__(self):
+        self.counters = {"requests": 0, "errors": 0, "total_ms": 0.0, "streams": 0}
+
+    def record(self, start: float, ok: bool):
+        self.counters["requests"] += 1
+        self.counters["errors"] += 0 if ok else 1
+        self.counters["total_ms"] += (time.perf_counter() - start) * 1000
+
+    def snapshot(self, name: str) -> dict:
+        requests = self.counters["requests"]
+        return {
+            "backend": name,
+            "requests": requests,
+            "errors": self.counters["errors"],
+            "avg_ms": round(self.counters["total_ms"] / requests, 1) if requests else None,
+            "streams": self.counters["streams"],
+        }
+
+
+# ====================== ASSEMBLY AI ======================
+class AssemblyAIBackend:
+    name = "assemblyai"
+
+    def __init__(self, api_key: str = None, base_url: str = None):
+        self.api_key = api_key or os.getenv("ASSEMBLYAI_API_KEY")
+        self.base_url = base_url or os.getenv("ASSEMBLYAI_BASE_URL")
+        self._stats = _BackendStats()
+        self._breaker = CircuitBreaker("AssemblyAI")
+
+    def start(self):
+        """Imports and configures the SDK (slow to import, so not at module load)."""
+        import assemblyai as aai
+
+        aai.settings.api_key = self.api_key
+        if self.base_url:
+            aai.settings.base_url = self.base_url
+        # Bounds each SDK HTTP call, so a hung connection can't pin an ASR thread.
+        aai.settings.http_timeout = ASSEMBLYAI_HTTP_TIMEOUT_SECONDS
+
+    def stop(self):
+        pass
+
+    @staticmethod
+    def _transcribe_blocking(audio_file, timeout: float):
+        """Upload + poll; the SDK streams the upload straight from the file object."""
+        import assemblyai as aai
+
+        audio_file.seek(0)  # a retry uploads from the start again
+        return aai.Transcriber().transcribe(
+            audio_file,
+            config=aai.TranscriptionConfig(language_code=TRANSCRIPTION_LANGUAGE),
+            poll_timeout=timeout,
+        )
+
+    @staticmethod
+    def _retryable(e: Exception) -> bool:
+        # Only errors raised by the SDK thread itself: after a wait_for timeout
+        # that thread may still be reading the upload, so no second attempt.
+        from assemblyai.types import AssemblyAIError
+
+        if isinstance(e, AssemblyAIError):
+            return e.status_code is not None and (e.status_code == 429 or e.status_code >= 500)
+        return isinstance(e, httpx.TransportError)
+
+    async def _attempt(self, audio_file):
+        from assemblyai.types import AssemblyAIError
+
+        timeout = current_deadline().timeout(ASSEMBLYAI_TIMEOUT_SECONDS)
+        try:
+            transcript = await asyncio.wait_for(run_asr(self._transcribe_blocking, audio_file, timeout), timeout)
+        except asyncio.TimeoutError:
+            upstream_requests.inc("assemblyai", "timeout")
+            if current_deadline().remaining() <= 0:
+                raise DeadlineExceeded("Transcription did not finish before the request deadline")
+            raise UpstreamUnavailable(f"AssemblyAI did not answer within {timeout:.1f}s")
+        except AssemblyAIError as e:
+            upstream_requests.inc("assemblyai", f"http_{e.status_code}" if e.status_code else "error")
+            raise
+        except Exception:
+            upstream_requests.inc("assemblyai", "error")
+            raise
+        upstream_requests.inc("assemblyai", "ok")
+        return transcript
+
+    async def transcribe(self, audio) -> str:
+        from assemblyai import TranscriptStatus
+
+        start, ok = time.perf_counter(), False
+        try:
+            transcript = await self._breaker.call(
+                lambda: retry(lambda: self._attempt(audio.file), self._retryable, name="AssemblyAI"),
+                is_failure=lambda e: self._retryable(e) or isinstance(e, UpstreamUnavailable),
+            )
+            if transcript.status == TranscriptStatus.error:
+                raise TranscriptionError(transcript.error)
+            ok = True
+            return transcript.text or ""
+        except (TranscriptionError, UpstreamUnavailable):
+            raise
+        except Exception as e:
+            if self._retryable(e):
+                raise UpstreamUnavailable(f"AssemblyAI unavailable: {e!r}") from e
+            raise TranscriptionError(str(e)) from e
+        finally:
+            self._stats.record(start, ok)
+
+    def open_stream(self):
+        self._stats.counters["streams"] += 1
+        return AssemblyAIStream(self.api_key)
+
+    def stats(self) -> dict:
+        return {**self._stats.snapshot(self.name), "circuit": self._breaker.stats()}
+
+
+class AssemblyAIStream:
+    """One streaming session: an AssemblyAI turn is one spoken command."""
+
+    def __init__(self, api_key: str, host: str = ASSEMBLYAI_STREAMING_HOST):
+        from assemblyai.streaming.v3 import AsyncRealTimeTranscriber, RealTimeTranscriberOptions
+
+        self.events = asyncio.Queue()
+        self._client = AsyncRealTimeTranscriber(RealTimeTranscriberOptions(api_key=api_key, api_host=host))
+        self._done = False
+
+    def _on_turn(self, client, turn):
+        if self._done or (not turn.transcript and not turn.end_of_turn):
+            return
+        if turn.end_of_turn:
+            self._done = True
+            self.events.put_nowait(("final", turn.transcript))
+        else:
+            self.events.put_nowait(("partial", turn.transcript))
+
+    def _on_error(self, client, error):
+        if not self._done:
+            self._done = True
+            self.events.put_nowait(("error", f"Streaming transcription failed: {error}"))
+
+    async def start(self):
+        from assemblyai.streaming.v3 import Encoding, RealTimeEvents, RealTimeParameters
+
+        self._client.on(RealTimeEvents.Turn, self._on_turn)
+        self._client.on(RealTimeEvents.Error, self._on_error)
+        # A failed handshake is reported through _on_error, not raised.
+        await self._client.connect(RealTimeParameters(
+            sample_rate=STREAM_SAMPLE_RATE, encoding=Encoding.pcm_s16le, format_turns=False,
+        ))
+
+    async def feed(self, pcm: bytes):
+        await self._client.stream(pcm)
+
+    async def end_utterance(self):
+        """Asks the service to close the turn now rather than wait out its own silence timer."""
+        if not self._done:
+            await self._client.force_endpoint()
+
+    async def close(self):
+        self._done = True
+        await self._client.disconnect(terminate=True)
+
+
+# ===================== LOCAL WHISPER =====================
+_worker_model = None
+
+
+def _load_worker_model(model: str, compute_type: str, threads: int):
+    """Pool initializer: each worker loads the model exactly once."""
+    global _worker_model
+    from faster_whisper import WhisperModel
+
+    _worker_model = WhisperModel(model, device="cpu", compute_type=compute_type, cpu_threads=threads)
+
+
+def _warm_up():
+    return os.getpid()
+
+
+def _transcribe_in_worker(data: bytes, beam_size: int) -> str:
+    return _decode(io.BytesIO(data), beam_size)
+
+
+def _transcribe_pcm_in_worker(pcm: bytes, beam_size: int) -> str:
+    """Raw 16 kHz PCM16 from a streaming session, no container to parse."""
+    return _decode(np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768.0, beam_size)
+
+
+def _decode(audio, beam_size: int) -> str:
+    segments, _ = _worker_model.transcribe(
+        audio,
+        language=TRANSCRIPTION_LANGUAGE,
+        beam_size=beam_size,
+        vad_filter=True,  # trims the silence around a short command
+        condition_on_previous_text=False,
+        without_timestamps=True,
+    )
+    return " ".join(segment.text.strip() for segment in segments).strip()
+
+
+class LocalWhisperBackend:
+    name = "local"
+
+    def __init__(self, model: str = TRANSCRIPTION_LOCAL_MODEL, workers: int = TRANSCRIPTION_LOCAL_WORKERS,
+                 threads: int = TRANSCRIPTION_LOCAL_THREADS, compute_type: str = TRANSCRIPTION_LOCAL_COMPUTE_TYPE,
+                 beam_size: int = TRANSCRIPTION_LOCAL_BEAM_SIZE):
+        self.model = model
+        self.workers = max(workers, 1)
+        self.threads = threads
+        self.compute_type = compute_type
+        self.beam_size = beam_size
+        self._pool = None
+        self._stats = _BackendStats()
+
+    def start(self):
+        """Spawns the workers and has each load the model before the first command."""
+        if self._pool is not None:
+            return
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_load_worker_model,
+            initargs=(self.model, self.compute_type, self.threads),
+        )
+        try:
+            for future in [self._pool.submit(_warm_up) for _ in range(self.workers)]:
+                future.result()
+        except Exception as e:
+            self.stop()
+            raise RuntimeError(f"Could not load local transcription model {self.model!r} (see worker log): {e}") from e
+        logger.info(f"🗣️ Local transcription ready: {self.model} ({self.compute_type}) × {self.workers} workers")
+
+    def stop(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def transcribe(self, audio) -> str:
+        if self._pool is None:
+            raise TranscriptionError("Local transcription backend is not started")
+        start, ok = time.perf_counter(), False
+        try:
+            # Commands are a few hundred KB at most; the bytes cross to the worker once.
+            data = await run_in_threadpool(audio.file.read)
+            loop = asyncio.get_running_loop()
+            text = await asyncio.wait_for(
+                loop.run_in_executor(self._pool, _transcribe_in_worker, data, self.beam_size),
+                current_deadline().timeout(),
+            )
+            ok = True
+            return text
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded("Transcription did not finish before the request deadline")
+        except (TranscriptionError, UpstreamUnavailable):
+            raise
+        except Exception as e:
+            raise TranscriptionError(f"Local transcription failed: {e}") from e
+        finally:
+            self._stats.record(start, ok)
+
+    async def decode_pcm(self, pcm: bytes) -> str:
+        if self._pool is None:
+            raise TranscriptionError("Local transcription backend is not started")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, _transcribe_pcm_in_worker, pcm, self.beam_size)
+
+    def open_stream(self):
+        self._stats.counters["streams"] += 1
+        return LocalWhisperStream(self)
+
+    def stats(self) -> dict:
+        return {**self._stats.snapshot(self.name), "model": self.model, "workers": self.workers}
+
+
+class LocalWhisperStream:
+    """
+    Whisper has no incremental decoder, so partials come from re-decoding
+    the audio buffered so far - at most one such decode in flight, so a
+    slow CPU drops partials instead of queueing them ahead of the final.
+    """
+
+    def __init__(self, backend: LocalWhisperBackend, partial_ms: int = TRANSCRIPTION_STREAM_PARTIAL_MS):
+        self.events = asyncio.Queue()
+        self._backend = backend
+        self._partial_bytes = partial_ms * STREAM_BYTES_PER_MS
+        self._pcm = bytearray()
+        self._decoded_bytes = 0
+        self._partial_task = None
+        self._done = False
+
+    async def start(self):
+        pass
+
+    async def feed(self, pcm: bytes):
+        if self._done:
+            return
+        self._pcm += pcm
+        idle = self._partial_task is None or self._partial_task.done()
+        if idle and len(self._pcm) - self._decoded_bytes >= self._partial_bytes:
+            self._decoded_bytes = len(self._pcm)
+            self._partial_task = asyncio.create_task(self._partial(bytes(self._pcm)))
+
+    async def _partial(self, pcm: bytes):
+        try:
+            text = await self._backend.decode_pcm(pcm)
+        except Exception as e:
+            logger.warning(f"⚠️ Partial transcription failed: {e}")
+            return
+        if not self._done and text:
+            self.events.put_nowait(("partial", text))
+
+    async def end_utterance(self):
+        if self._done:
+            return
+        self._done = True
+        if self._partial_task is not None:
+            self._partial_task.cancel()
+        try:
+            text = await self._backend.decode_pcm(bytes(self._pcm))
+        except Exception as e:
+            self.events.put_nowait(("error", f"Local transcription failed: {e}"))
+            return
+        self.events.put_nowait(("final", text))
+
+    async def close(self):
+        self._done = True
+        if self._partial_task is not None:
+            self._partial_task.cancel()
+
+
+def create_backend(name: str = TRANSCRIPTION_BACKEND):
+    if name == "assemblyai":
+        return AssemblyAIBackend()
+    if name == "local":
+        return LocalWhisperBackend()
+    raise ValueError(f"Unknown TRANSCRIPTION_BACKEND {name!r}, expected one of {', '.join(BACKENDS)}")
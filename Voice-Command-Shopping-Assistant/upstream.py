@@ -0,0 +1,72 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+# upstream.py
+#
+# Shared plumbing for the outbound calls the voice pipeline makes (Groq for
+# command parsing, AssemblyAI for transcription). Everything here is built so
+# that a slow upstream only ever occupies a coroutine, never the event loop.
+
+GROQ_MAX_CONCURRENCY = int(os.getenv("GROQ_MAX_CONCURRENCY", "32"))
+ASSEMBLYAI_MAX_CONCURRENCY = int(os.getenv("ASSEMBLYAI_MAX_CONCURRENCY", "32"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_KEEPALIVE_SECONDS = float(os.getenv("HTTP_KEEPALIVE_SECONDS", "60"))
+UPSTREAM_TIMEOUT_SECONDS = float(os.getenv("UPSTREAM_TIMEOUT_SECONDS", "30"))
+
+# Per-upstream concurrency limits. Callers wait here (without blocking the
+# loop) instead of piling unbounded work onto the upstream.
+groq_limiter = asyncio.Semaphore(GROQ_MAX_CONCURRENCY)
+asr_limiter = asyncio.Semaphore(ASSEMBLYAI_MAX_CONCURRENCY)
+
+# The AssemblyAI SDK is synchronous (upload + poll), so it gets its own
+# threads rather than competing with Starlette's threadpool for sync routes.
+asr_executor = ThreadPoolExecutor(
+    max_workers=ASSEMBLYAI_MAX_CONCURRENCY, thread_name_prefix="asr"
+)
+
+_http_client = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Returns the process-wide async HTTP client.
+    Connections are pooled and kept alive, and HTTP/2 is negotiated where the
+    upstream supports it (Groq does), so concurrent commands share sockets.
+    """
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            http2=True,
+            timeout=httpx.Timeout(UPSTREAM_TIMEOUT_SECONDS),
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+                keepalive_expiry=HTTP_KEEPALIVE_SECONDS,
+            ),
+        )
+    return _http_client
+
+
+async def run_asr(func, *args, **kwargs):
+    """
+    Runs a blocking transcription call on the ASR executor, bounded by the
+    AssemblyAI concurrency limit.
+    """
+    async with asr_limiter:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            asr_executor, functools.partial(func, *args, **kwargs)
+        )
+
+
+async def close_upstreams():
+    """Releases pooled connections and ASR threads on shutdown."""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+    asr_executor.shutdown(wait=False, cancel_futures=True)
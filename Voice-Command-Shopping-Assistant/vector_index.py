@@ -0,0 +1,267 @@
+import logging
+import math
+import os
+
+import numpy as np
+
+# vector_index.py
+#
+# ANN backends behind the store index. STORE_INDEX_TYPE picks one:
+#   flat   exact brute-force scan (default; right for small catalogs)
+#   hnsw   graph index, sub-linear search, no training step
+#   ivfpq  inverted lists + product quantization, trained on the catalog;
+#          48-byte codes instead of 1536 bytes per 384-dim vector
+# STORE_INDEX_FP16=true stores flat/hnsw vectors as float16 (half the memory).
+#
+# Vectors sit at sequential positions inside the faiss index and `labels`
+# maps a position to the caller's int64 id. Removing a vector only
+# tombstones its position (HNSW can't delete); once tombstones pass
+# STORE_INDEX_REBUILD_FRACTION the index is rebuilt from its own stored
+# vectors. IVF-PQ codes and fp16 only approximate a vector, so an index
+# given a `source` (labels -> the original float32 vectors) rebuilds and
+# retrains from that instead. Every position also carries an integer tag
+# (the store uses the category) so filtered searches run inside faiss via
+# an IDSelectorBitmap.
+#
+# Not thread-safe on its own: StoreIndex serialises access with its lock.
+# faiss is imported where it's first needed, so importing this module
+# (and with it the API) doesn't pay for loading the library.
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ("flat", "hnsw", "ivfpq")
+
+STORE_INDEX_TYPE = os.getenv("STORE_INDEX_TYPE", "flat").lower()
+STORE_INDEX_FP16 = os.getenv("STORE_INDEX_FP16", "false").lower() == "true"
+STORE_INDEX_HNSW_M = int(os.getenv("STORE_INDEX_HNSW_M", "32"))
+STORE_INDEX_HNSW_EF_CONSTRUCTION = int(os.getenv("STORE_INDEX_HNSW_EF_CONSTRUCTION", "80"))
+STORE_INDEX_HNSW_EF_SEARCH = int(os.getenv("STORE_INDEX_HNSW_EF_SEARCH", "64"))
+STORE_INDEX_IVF_NLIST = int(os.getenv("STORE_INDEX_IVF_NLIST", "0"))  # 0 = ~4*sqrt(catalog size)
+STORE_INDEX_IVF_NPROBE = int(os.getenv("STORE_INDEX_IVF_NPROBE", "16"))
+STORE_INDEX_PQ_M = int(os.getenv("STORE_INDEX_PQ_M", "48"))
+# IVF-PQ needs enough vectors to train its quantizers; smaller catalogs
+# stay on a flat index until they grow past this.
+STORE_INDEX_IVF_MIN_TRAIN = int(os.getenv("STORE_INDEX_IVF_MIN_TRAIN", "10000"))
+STORE_INDEX_REBUILD_FRACTION = float(os.getenv("STORE_INDEX_REBUILD_FRACTION", "0.2"))
+# Filters letting through less than this share of an HNSW index are served
+# by an exact scan instead of the graph.
+STORE_INDEX_FILTER_SCAN_FRACTION = float(os.getenv("STORE_INDEX_FILTER_SCAN_FRACTION", "0.1"))
+
+_PQ_BITS = 8
+_TRAIN_SAMPLE_MAX = 100_000
+
+
+def ivf_nlist(n: int) -> int:
+    if STORE_INDEX_IVF_NLIST > 0:
+        return STORE_INDEX_IVF_NLIST
+    return int(min(65536, max(16, 4 * math.sqrt(n))))
+
+
+def pq_subquantizers(dim: int, requested: int = STORE_INDEX_PQ_M) -> int:
+    """Largest divisor of dim not above `requested` (PQ splits dim evenly)."""
+    for m in range(min(requested, dim), 0, -1):
+        if dim % m == 0:
+            return m
+    return 1
+
+
+class VectorIndex:
+    def __init__(self, dim: int, kind: str = STORE_INDEX_TYPE, fp16: bool = STORE_INDEX_FP16, source=None):
+        if kind not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type {kind!r}, expected one of {', '.join(INDEX_TYPES)}")
+        self.dim = dim
+        self.kind = kind
+        self.fp16 = fp16
+        self.built_kind = None  # what is actually built (ivfpq starts out flat)
+        self.source = source  # labels -> (n, dim) float32, for rebuilding lossy indexes
+        self.index = None
+        self.labels = np.empty(0, dtype="int64")  # position -> label
+        self.tags = np.empty(0, dtype="int32")  # position -> tag
+        self.live = np.empty(0, dtype=bool)  # position -> not tombstoned
+        self._positions = {}  # label -> position
+
+    @property
+    def ntotal(self) -> int:
+        return len(self._positions)
+
+    def _kind_for(self, n: int) -> str:
+        if self.kind == "ivfpq" and n < STORE_INDEX_IVF_MIN_TRAIN:
+            return "flat"
+        return self.kind
+
+    def _create(self, kind: str, sample):
+        import faiss
+
+        d = self.dim
+        if kind == "hnsw":
+            if self.fp16:
+                index = faiss.IndexHNSWSQ(d, faiss.ScalarQuantizer.QT_fp16, STORE_INDEX_HNSW_M)
+            else:
+                index = faiss.IndexHNSWFlat(d, STORE_INDEX_HNSW_M)
+            index.hnsw.efConstruction = STORE_INDEX_HNSW_EF_CONSTRUCTION
+            index.hnsw.efSearch = STORE_INDEX_HNSW_EF_SEARCH
+        elif kind == "ivfpq":
+            index = faiss.IndexIVFPQ(faiss.IndexFlatL2(d), d, ivf_nlist(len(sample)), pq_subquantizers(d), _PQ_BITS)
+            index.nprobe = STORE_INDEX_IVF_NPROBE
+        elif self.fp16:
+            index = faiss.IndexScalarQuantizer(d, faiss.ScalarQuantizer.QT_fp16)
+        else:
+            index = faiss.IndexFlatL2(d)
+
+        if not index.is_trained:
+            if len(sample) > _TRAIN_SAMPLE_MAX:
+                rows = np.random.default_rng(0).choice(len(sample), _TRAIN_SAMPLE_MAX, replace=False)
+                sample = sample[np.sort(rows)]
+            index.train(sample)
+        if kind == "ivfpq":
+            index.make_direct_map()  # reconstruct() by position
+        return index
+
+    # ---------------------- updates --------------------------
+    def add(self, vectors, labels, tags):
+        """Adds (or replaces) vectors under the given labels."""
+        vectors = np.ascontiguousarray(vectors, dtype="float32")
+        labels = np.asarray(labels, dtype="int64")
+        self.remove(labels, rebuild=False)
+        if self.index is None:
+            self.built_kind = self._kind_for(len(vectors))
+            self.index = self._create(self.built_kind, vectors)
+
+        start = len(self.labels)
+        self.index.add(vectors)
+        self.labels = np.concatenate([self.labels, labels])
+        self.tags = np.concatenate([self.tags, np.asarray(tags, dtype="int32")])
+        self.live = np.concatenate([self.live, np.ones(len(labels), dtype=bool)])
+        self._positions.update(zip(labels.tolist(), range(start, start + len(labels))))
+        self._maybe_rebuild()
+
+    def remove(self, labels, rebuild: bool = True):
+        for label in labels:
+            position = self._positions.pop(int(label), None)
+            if position is not None:
+                self.live[position] = False
+        if rebuild:
+            self._maybe_rebuild()
+
+    def set_tags(self, labels, tags):
+        for label, tag in zip(labels, tags):
+            position = self._positions.get(int(label))
+            if position is not None:
+                self.tags[position] = tag
+
+    def _maybe_rebuild(self):
+        dead = len(self.labels) - len(self._positions)
+        outgrown_flat = self.built_kind != self._kind_for(len(self._positions)) and self.built_kind == "flat"
+        if outgrown_flat or (dead and dead > STORE_INDEX_REBUILD_FRACTION * len(self.labels)):
+            self.rebuild()
+
+    def rebuild(self):
+        """Re-creates the index from its live vectors, dropping tombstones."""
+        positions = np.flatnonzero(self.live)
+        if len(positions):
+            vectors = self._rebuild_vectors(positions)
+        else:
+            vectors = np.empty((0, self.dim), dtype="float32")
+        kind = self._kind_for(len(positions))
+        index = self._create(kind, vectors)
+        if len(positions):
+            index.add(vectors)
+
+        self.index, self.built_kind = index, kind
+        self.labels = self.labels[positions]
+        self.tags = self.tags[positions]
+        self.live = np.ones(len(positions), dtype=bool)
+        self._positions = dict(zip(self.labels.tolist(), range(len(positions))))
+        logger.info(f"🧱 Rebuilt {kind} vector index with {len(positions)} vectors")
+
+    def _rebuild_vectors(self, positions):
+        lossy = self.built_kind == "ivfpq" or self.fp16
+        if lossy and self.source is not None:
+            try:
+                return np.ascontiguousarray(self.source(self.labels[positions].tolist()), dtype="float32")
+            except Exception as e:
+                logger.warning(f"⚠️ Could not fetch source vectors, rebuilding from stored codes: {e}")
+        return self.index.reconstruct_batch(positions)
+
+    # ----------------------- reads ---------------------------
+    def reconstruct(self, label: int):
+        """The stored vector for `label` (approximate for ivfpq / fp16)."""
+        return self.index.reconstruct(self._positions[int(label)])
+
+    def search(self, queries, k: int, include=None, exclude=None):
+        """
+        Returns (distances, labels), both (n_queries, k); missing results
+        have label -1. `include` / `exclude` are tag values to restrict the
+        search to / leave out.
+        """
+        import faiss
+
+        queries = np.ascontiguousarray(queries, dtype="float32")
+        if self.index is None or not self._positions:
+            return np.empty((len(queries), 0), dtype="float32"), np.empty((len(queries), 0), dtype="int64")
+
+        mask = None
+        if len(self._positions) < len(self.labels):
+            mask = self.live
+        if include is not None:
+            mask = np.isin(self.tags, include) if mask is None else mask & np.isin(self.tags, include)
+        if exclude is not None:
+            mask = ~np.isin(self.tags, exclude) if mask is None else mask & ~np.isin(self.tags, exclude)
+
+        # Share of the index the filter lets through. Graph and IVF searches
+        # visit a fixed budget of candidates, so a narrow filter would leave
+        # them with few matches: HNSW switches to a scan of its vector
+        # storage, IVF probes proportionally more lists.
+        selectivity = 1.0 if mask is None else max(np.count_nonzero(mask), 1) / len(mask)
+        # Keep the bitmap referenced until the search returns.
+        bitmap = np.packbits(mask, bitorder="little") if mask is not None else None
+        selector = faiss.IDSelectorBitmap(len(bitmap), faiss.swig_ptr(bitmap)) if bitmap is not None else None
+        options = {"sel": selector} if selector is not None else {}
+        index = self.index
+        if self.built_kind == "hnsw" and selectivity < STORE_INDEX_FILTER_SCAN_FRACTION:
+            index = self.index.storage
+            params = faiss.SearchParameters(**options)
+        elif self.built_kind == "hnsw":
+            params = faiss.SearchParametersHNSW(efSearch=max(STORE_INDEX_HNSW_EF_SEARCH, k), **options)
+        elif self.built_kind == "ivfpq":
+            nprobe = min(self.index.nlist, math.ceil(STORE_INDEX_IVF_NPROBE / selectivity))
+            params = faiss.SearchParametersIVF(nprobe=nprobe, **options)
+        else:
+            params = faiss.SearchParameters(**options) if options else None
+
+        distances, positions = index.search(queries, k, params=params)
+        labels = np.where(positions >= 0, self.labels[np.maximum(positions, 0)], -1)
+        return distances, labels
+
+    # ---------------------- persistence ----------------------
+    def save(self, index_path: str, ids_path: str, snapshot_id: str = ""):
+        """`snapshot_id` is stored with the ids, so a caller can tell which save they came from."""
+        import faiss
+
+        faiss.write_index(self.index, index_path)
+        with open(ids_path, "wb") as f:
+            np.savez(f, labels=self.labels, tags=self.tags, live=self.live, built_kind=self.built_kind,
+                     snapshot_id=snapshot_id)
+
+    @classmethod
+    def load(cls, index_path: str, ids_path: str, kind: str = STORE_INDEX_TYPE, fp16: bool = STORE_INDEX_FP16,
+             source=None):
+        """Memory-maps the index where faiss supports it for that index type."""
+        import faiss
+
+        try:
+            index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP)
+        except RuntimeError:
+            index = faiss.read_index(index_path)
+        with np.load(ids_path) as ids:
+            vi = cls(index.d, kind, fp16, source)
+            vi.index = index
+            vi.built_kind = str(ids["built_kind"])
+            vi.labels = ids["labels"]
+            vi.tags = ids["tags"]
+            vi.live = ids["live"]
+            vi.snapshot_id = str(ids["snapshot_id"]) if "snapshot_id" in ids.files else None
+        if not len(vi.labels) == len(vi.tags) == len(vi.live) == index.ntotal:
+            raise ValueError(f"id file has {len(vi.labels)} positions, index file has {index.ntotal}")
+        vi._positions = {int(vi.labels[p]): int(p) for p in np.flatnonzero(vi.live)}
+        return vi
@@ -0,0 +1,201 @@
+import asyncio
+import json
+import logging
+import os
+import time
+
+import numpy as np
+from starlette.websockets import WebSocketDisconnect
+
+from parse_cache import normalize_command_key
+from resilience import REQUEST_DEADLINE_SECONDS, request_deadline
+from transcription import STREAM_SAMPLE_RATE
+
+# voice_stream.py
+#
+# WebSocket counterpart of POST /recognise_text_to_llm: one spoken command
+# per connection, transcribed while it is being spoken.
+#
+# The client sends the microphone audio as binary frames of raw 16 kHz mono
+# little-endian PCM16 (20-100 ms each) and gets JSON messages back:
+#   {"type": "ready", "sample_rate": 16000}      session open, start sending
+#   {"type": "partial", "text": ...}             transcript so far (may change)
+#   {"type": "transcript", "text": ...}          final transcript
+#   {"type": "result", "recognized_text": ..., "llm_response": ...}
+#                                                same body as the POST endpoint
+#   {"type": "error", "detail": ...}
+# and the server closes the socket after "result" or "error".
+#
+# The utterance ends when STREAM_END_SILENCE_MS of silence follows speech,
+# when the client sends {"type": "stop"}, when the ASR backend closes the
+# turn itself, or after STREAM_MAX_UTTERANCE_SECONDS. Command parsing
+# starts right then on the latest partial while the backend settles the
+# final transcript; if both normalise to the same command the early parse
+# is the answer, otherwise the final transcript is parsed.
+#
+# The connection runs under one request deadline (resilience.Deadline) of
+# STREAM_MAX_UTTERANCE_SECONDS plus REQUEST_DEADLINE_SECONDS, so the ASR
+# and Groq calls are bounded as they are for the POST endpoint.
+
+logger = logging.getLogger(__name__)
+
+STREAM_END_SILENCE_MS = int(os.getenv("STREAM_END_SILENCE_MS", "700"))
+STREAM_SPEECH_RMS = float(os.getenv("STREAM_SPEECH_RMS", "500"))  # PCM16 amplitude
+STREAM_MAX_UTTERANCE_SECONDS = float(os.getenv("STREAM_MAX_UTTERANCE_SECONDS", "15"))
+STREAM_IDLE_TIMEOUT_SECONDS = float(os.getenv("STREAM_IDLE_TIMEOUT_SECONDS", "5"))
+STREAM_FINAL_TIMEOUT_SECONDS = float(os.getenv("STREAM_FINAL_TIMEOUT_SECONDS", "10"))
+STREAM_MAX_FRAME_BYTES = 64 * 1024
+
+
+class Endpointer:
+    """Energy-based end-of-utterance detection over PCM16 frames."""
+
+    def __init__(self, end_silence_ms: int = STREAM_END_SILENCE_MS, speech_rms: float = STREAM_SPEECH_RMS,
+                 max_seconds: float = STREAM_MAX_UTTERANCE_SECONDS):
+        self.end_silence_ms = end_silence_ms
+        self.speech_rms = speech_rms
+        self.max_ms = max_seconds * 1000
+        self.speech_seen = False
+        self.silence_ms = 0.0
+        self.total_ms = 0.0
+
+    def feed(self, pcm: bytes) -> bool:
+        """True once the utterance is over."""
+        samples = np.frombuffer(pcm, dtype=np.int16).astype(np.float32)
+        if not len(samples):
+            return False
+        ms = len(samples) * 1000 / STREAM_SAMPLE_RATE
+        self.total_ms += ms
+        if np.sqrt(np.mean(samples ** 2)) >= self.speech_rms:
+            self.speech_seen = True
+            self.silence_ms = 0.0
+        elif self.speech_seen:
+            self.silence_ms += ms
+        return (self.speech_seen and self.silence_ms >= self.end_silence_ms) or self.total_ms >= self.max_ms
+
+
+async def _receive_audio(websocket, session, endpointer: Endpointer):
+    """
+    Feeds client frames to the ASR session until the utterance ends, then
+    keeps draining (and dropping) frames so a disconnect is still noticed.
+    End and disconnect are reported on session.events.
+    """
+    ended = False
+    while True:
+        try:
+            message = await asyncio.wait_for(websocket.receive(), timeout=STREAM_IDLE_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            if not ended:
+                ended = True
+                session.events.put_nowait(("end", "idle"))
+            continue
+        if message["type"] == "websocket.disconnect":
+            session.events.put_nowait(("disconnect", None))
+            return
+        if ended:
+            continue
+
+        pcm = message.get("bytes")
+        if pcm is not None:
+            if len(pcm) % 2 or len(pcm) > STREAM_MAX_FRAME_BYTES:
+                session.events.put_nowait(("error", f"Audio frames must be whole PCM16 samples, at most {STREAM_MAX_FRAME_BYTES} bytes"))
+                ended = True
+                continue
+            await session.feed(pcm)
+            if endpointer.feed(pcm):
+                ended = True
+                reason = "silence" if endpointer.speech_seen and endpointer.total_ms < endpointer.max_ms else "max_length"
+                session.events.put_nowait(("end", reason))
+            continue
+
+        try:
+            control = json.loads(message.get("text") or "")
+        except ValueError:
+            control = None
+        if isinstance(control, dict) and control.get("type") == "stop":
+            ended = True
+            session.events.put_nowait(("end", "client"))
+
+
+async def run_voice_stream(websocket, transcriber, interpret,
+                           deadline_seconds: float = STREAM_MAX_UTTERANCE_SECONDS + REQUEST_DEADLINE_SECONDS):
+    """
+    Serves one streaming voice command. `interpret` is the same parse step
+    the POST endpoint runs: transcript -> llm_response, or None if invalid.
+    """
+    # Set before any task is created, so the receiver and parses inherit it.
+    with request_deadline(deadline_seconds):
+        await _serve_stream(websocket, transcriber, interpret)
+
+
+async def _serve_stream(websocket, transcriber, interpret):
+    await websocket.accept()
+    session = transcriber.open_stream()
+    receiver = end_task = early_parse = None
+    started = time.perf_counter()
+    try:
+        await session.start()
+        await websocket.send_json({"type": "ready", "sample_rate": STREAM_SAMPLE_RATE})
+        receiver = asyncio.create_task(_receive_audio(websocket, session, Endpointer()))
+
+        latest, early_text, text = "", None, None
+        while text is None:
+            timeout = STREAM_FINAL_TIMEOUT_SECONDS if end_task is not None else None
+            try:
+                kind, value = await asyncio.wait_for(session.events.get(), timeout)
+            except asyncio.TimeoutError:
+                await websocket.send_json({"type": "error", "detail": "Timed out waiting for the transcript"})
+                return
+            if kind == "partial":
+                latest = value
+                await websocket.send_json({"type": "partial", "text": value})
+            elif kind == "end" and end_task is None:
+                logger.info(f"🛑 End of utterance ({value}) after {(time.perf_counter() - started) * 1000:.0f}ms")
+                end_task = asyncio.create_task(session.end_utterance())
+                if latest.strip():
+                    early_text = latest
+                    early_parse = asyncio.create_task(interpret(latest))
+            elif kind == "final":
+                text = value
+            elif kind == "error":
+                await websocket.send_json({"type": "error", "detail": value})
+                return
+            elif kind == "disconnect":
+                logger.info("🔌 Voice stream closed by the client")
+                return
+
+        logger.info(f"📝 Streamed transcript: {text}")
+        await websocket.send_json({"type": "transcript", "text": text})
+        if not text.strip():
+            await websocket.send_json({"type": "error", "detail": "No speech detected"})
+            return
+
+        if early_parse is not None and normalize_command_key(early_text) == normalize_command_key(text):
+            parse = early_parse
+        else:
+            if early_parse is not None:
+                early_parse.cancel()
+            parse = interpret(text)
+        try:
+            llm_response = await parse
+        except Exception as e:
+            logger.error(f"❌ Streamed command parsing failed: {e}")
+            await websocket.send_json({"type": "error", "detail": f"Voice recognition failed: {e}"})
+            return
+        if llm_response is None:
+            await websocket.send_json({"type": "error", "detail": "Invalid AI response format"})
+            return
+
+        await websocket.send_json({"type": "result", "recognized_text": text, "llm_response": llm_response})
+        logger.info(f"✅ Streamed voice command processed in {(time.perf_counter() - started) * 1000:.0f}ms")
+    except WebSocketDisconnect:
+        logger.info("🔌 Voice stream closed by the client")
+    finally:
+        for task in (receiver, end_task, early_parse):
+            if task is not None and not task.done():
+                task.cancel()
+        try:
+            await websocket.close()
+        except (RuntimeError, WebSocketDisconnect):
+            pass  # already closed by the client
+        await session.close()
@@ -0,0 +1,124 @@
+import logging
+
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import OperationFailure
+
+# wishlist.py
+#
+# Wishlist writes against users.wishlist, which holds exactly one entry per
+# product with the summed quantity. Every operation is a server-side update
+# on that one entry - the document is never read into Python first.
+
+logger = logging.getLogger(__name__)
+
+_MAX_ATTEMPTS = 3
+
+
+def ensure_user_indexes(collection):
+    """One document per username - add_item's upsert relies on it."""
+    try:
+        collection.create_index([("username", ASCENDING)], name="username", unique=True)
+    except OperationFailure as e:
+        logger.warning(f"⚠️ Could not create unique username index (duplicate users?): {e}")
+
+
+def aggregate_entries(wishlist):
+    """Collapses legacy duplicate entries into one per product, summing quantities."""
+    merged = {}
+    for entry in wishlist or []:
+        product = entry.get("product")
+        if product in merged:
+            merged[product]["quantity"] += int(entry.get("quantity", 0))
+            merged[product]["timestamp"] = max(
+                merged[product].get("timestamp") or "", entry.get("timestamp") or ""
+            )
+        else:
+            merged[product] = {**entry, "quantity": int(entry.get("quantity", 0))}
+    return list(merged.values())
+
+
+def add_item(collection, username: str, entry: dict, session=None):
+    """
+    Adds entry["quantity"] units of entry["product"].
+    The common case (product already listed) is a single positional $inc.
+    """
+    product, quantity = entry["product"], entry["quantity"]
+    updates = {"wishlist.$.timestamp": entry.get("timestamp"), "wishlist.$.status": entry.get("status")}
+    if entry.get("name_key"):
+        # Store key for stock.release(); backfills entries from before it was kept
+        updates["wishlist.$.name_key"] = entry["name_key"]
+    for _ in range(_MAX_ATTEMPTS):
+        # Already in the wishlist: bump it in place.
+        result = collection.update_one(
+            {"username": username, "wishlist.product": product},
+            {"$inc": {"wishlist.$.quantity": quantity}, "$set": updates},
+            session=session,
+        )
+        if result.matched_count:
+            return
+
+        # New product for an existing user. The $ne guard stops two
+        # concurrent first-adds from creating duplicate entries.
+        result = collection.update_one(
+            {"username": username, "wishlist.product": {"$ne": product}},
+            {"$push": {"wishlist": entry}},
+            session=session,
+        )
+        if result.matched_count:
+            return
+
+        # New user. If the user appeared meanwhile this is a no-op and the
+        # next attempt takes one of the paths above.
+        result = collection.update_one(
+            {"username": username},
+            {"$setOnInsert": {"username": username, "wishlist": [entry]}},
+            upsert=True,
+            session=session,
+        )
+        if result.upserted_id is not None:
+            return
+    raise RuntimeError(f"Could not add {product} to {username}'s wishlist under contention")
+
+
+def remove_item(collection, username: str, product: str, quantity: int = 0, session=None):
+    """
+    Removes `quantity` units of `product` (0 = the whole entry).
+    Returns the number of units actually removed, or None if the product
+    isn't in the wishlist.
+    """
+    for _ in range(_MAX_ATTEMPTS):
+        if quantity > 0:
+            # Partial: decrement when more than `quantity` units are listed.
+            doc = collection.find_one_and_update(
+                {"username": username, "wishlist": {"$elemMatch": {"product": product, "quantity": {"$gt": quantity}}}},
+                {"$inc": {"wishlist.$.quantity": -quantity}},
+                projection={"_id": 1},
+                session=session,
+            )
+            if doc is not None:
+                return quantity
+            entry_filter = {"$elemMatch": {"product": product, "quantity": {"$lte": quantity}}}
+        else:
+            entry_filter = {"$elemMatch": {"product": product}}
+
+        # Whole entry goes; the pre-image tells us how many units it held.
+        doc = collection.find_one_and_update(
+            {"username": username, "wishlist": entry_filter},
+            {"$pull": {"wishlist": {"product": product}}},
+            projection={"wishlist": {"$elemMatch": {"product": product}}},
+            return_document=ReturnDocument.BEFORE,
+            session=session,
+        )
+        if doc is not None:
+            return doc["wishlist"][0].get("quantity", 0)
+
+        if collection.count_documents({"username": username, "wishlist.product": product}, limit=1, session=session) == 0:
+            return None
+        # Quantity changed between the two updates; try again.
+    raise RuntimeError(f"Could not remove {product} from {username}'s wishlist under contention")
+
+
+def wishlist_products(collection, username: str):
+    """Product names (and store keys) only - for fuzzy matching when the catalog can't resolve a name."""
+    doc = collection.find_one({"username": username}, {"_id": 0, "wishlist.product": 1, "wishlist.name_key": 1})
+    return (doc or {}).get("wishlist", [])
@@ -104,13 +104,13 @@ export const useWishlist = () => {
     return await updateWishlist(llmResponse);
   }, [updateWishlist]);
 
-  // Manual remove item from wishlist
+  // Manual remove item from wishlist (the whole entry)
   const removeItem = useCallback(async (product) => {
     const llmResponse = {
       product,
-      quantity: 1,
+      quantity: 0,
       category: 'unknown',
-      action: 'remove',
+      action: 'delete',
       status: 'manual'
     };
 
@@ -14,14 +14,13 @@ const api = axios.create({
 
 // Voice Command Processing
 export const voiceAPI = {
+  // The recording is sent as the raw request body, which the backend
+  // streams straight into its transcription buffer.
   processVoice: async (audioFile) => {
-    const formData = new FormData();
-    formData.append('file', audioFile);
-    
     try {
-      const response = await api.post('/recognise_text_to_llm', formData, {
+      const response = await api.post('/recognise_text_to_llm', audioFile, {
         headers: {
-          'Content-Type': 'multipart/form-data',
+          'Content-Type': audioFile.type || 'application/octet-stream',
         },
       });
       return response.data;
@@ -66,10 +65,22 @@ export const recommendationsAPI = {
 
 // Store Management
 export const storeAPI = {
-  getStoreItems: async () => {
+  // Follows next_cursor until the whole catalog is loaded. The browser cache
+  // revalidates each page with If-None-Match, so unchanged pages are 304s.
+  getStoreItems: async (pageSize = 500) => {
     try {
-      const response = await api.get('/store');
-      return response.data;
+      const storeItems = [];
+      let cursor = null;
+      let data;
+      do {
+        const response = await api.get('/store', {
+          params: { limit: pageSize, ...(cursor && { cursor }) },
+        });
+        data = response.data;
+        storeItems.push(...data.store_items);
+        cursor = data.next_cursor;
+      } while (cursor);
+      return { ...data, store_items: storeItems };
     } catch (error) {
       throw new Error(error.response?.data?.error || 'Failed to fetch store items');
     }